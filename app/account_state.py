@@ -0,0 +1,148 @@
+import time
+import logging
+from dataclasses import dataclass, field, replace
+from threading import Event, Lock, Thread
+from typing import Callable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+
+@dataclass(slots=True)
+class PositionState:
+    symbol: str
+    amount: float = 0.0
+    entry_price: float = 0.0
+    unrealized_pnl: float = 0.0
+    initial_margin: float = 0.0
+    liquidation_price: float = 0.0
+    leverage: int = 1
+    updated_at: float = field(default_factory=time.time)
+
+
+class AccountState:
+    """Позиции и балансы фьючерсного счёта в памяти.
+
+    Обновляется событиями ACCOUNT_UPDATE и периодически сверяется с REST.
+    Чтение потокобезопасно и возвращает копии.
+    """
+
+    def __init__(
+        self,
+        fetch_positions: Callable[[], list[dict]],
+        fetch_balances: Callable[[], list[dict]],
+        reconcile_interval: float = 30.0
+    ):
+        self._fetch_positions = fetch_positions
+        self._fetch_balances = fetch_balances
+        self.reconcile_interval = reconcile_interval
+        self._positions: dict[str, PositionState] = {}
+        self._balances: dict[str, float] = {}
+        self._lock = Lock()
+        self.updated_at = 0.0
+        self.reconciled_at = 0.0
+        self._wakeup = Event()
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def apply_account_update(self, event: dict) -> None:
+        data = event.get("a", {})
+        now = time.time()
+        position_changed = False
+        with self._lock:
+            for b in data.get("B", []):
+                self._balances[b["a"]] = float(b["wb"])
+            for p in data.get("P", []):
+                # В one-way режиме ps=BOTH; хедж-позиции не поддерживаются ботом
+                if p.get("ps", "BOTH") != "BOTH":
+                    continue
+                pos = self._positions.setdefault(p["s"], PositionState(p["s"]))
+                pos.amount = float(p["pa"])
+                pos.entry_price = float(p["ep"])
+                pos.unrealized_pnl = float(p.get("up", 0.0))
+                pos.updated_at = now
+                position_changed = True
+            self.updated_at = now
+        if position_changed:
+            # Маржа и цена ликвидации в событии не приходят — досверяем через REST
+            self._wakeup.set()
+
+    def load_positions(self, positions: list[dict]) -> None:
+        now = time.time()
+        with self._lock:
+            for p in positions:
+                if p.get("positionSide", "BOTH") != "BOTH":
+                    continue
+                self._positions[p["symbol"]] = PositionState(
+                    symbol=p["symbol"],
+                    amount=float(p.get("positionAmt", 0.0)),
+                    entry_price=float(p.get("entryPrice", 0.0)),
+                    unrealized_pnl=float(p.get("unRealizedProfit", 0.0)),
+                    initial_margin=float(p.get("initialMargin", 0.0)),
+                    liquidation_price=float(p.get("liquidationPrice", 0.0)),
+                    leverage=int(p.get("leverage", 1)),
+                    updated_at=now,
+                )
+            self.updated_at = now
+
+    def load_balances(self, balances: list[dict]) -> None:
+        with self._lock:
+            for a in balances:
+                self._balances[a["asset"]] = float(a["balance"])
+            self.updated_at = time.time()
+
+    def reconcile(self) -> None:
+        self.load_positions(self._fetch_positions())
+        self.load_balances(self._fetch_balances())
+        self.reconciled_at = time.time()
+        logger.debug(f"Account state reconciled: {len(self._positions)} positions")
+
+    def staleness(self) -> float:
+        return time.time() - self.updated_at if self.updated_at else float("inf")
+
+    def is_fresh(self, max_age: float | None = None) -> bool:
+        return self.staleness() <= (max_age or self.reconcile_interval * 2)
+
+    def position(self, symbol: str) -> PositionState:
+        with self._lock:
+            pos = self._positions.get(symbol)
+            return replace(pos) if pos else PositionState(symbol, updated_at=self.updated_at)
+
+    def position_amount(self, symbol: str) -> float:
+        pos = self._positions.get(symbol)
+        return pos.amount if pos else 0.0
+
+    def positions(self) -> list[PositionState]:
+        with self._lock:
+            return [replace(p) for p in self._positions.values() if p.amount]
+
+    def balance(self, asset: str = "USDT") -> float:
+        return self._balances.get(asset, 0.0)
+
+    def balances(self) -> dict[str, float]:
+        with self._lock:
+            return dict(self._balances)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._reconcile_loop, name="account-state", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+
+    def _reconcile_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.reconcile()
+            except Exception as e:
+                logger.warning(f"Account reconcile failed: {e}")
+            if self._wakeup.wait(self.reconcile_interval):
+                # Даём пачке ACCOUNT_UPDATE после исполнения собраться в одну сверку
+                self._stop.wait(0.5)
+            self._wakeup.clear()
@@ -0,0 +1,138 @@
+import os
+import logging
+
+from app.config import settings
+from app import websocket_manager
+from app.account_state import AccountState
+from app.trade_journal import TradeJournal
+from app.rate_limiter import GovernedClient, RateLimitGovernor
+from app.clock_sync import clock_sync
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+POOL_SIZE = 32  # keep-alive соединений на аккаунт: рассылка сигнала идёт из нескольких потоков
+ALL_ACCOUNTS = ("all", "*")
+
+
+def new_client(api_key: str, api_secret: str):
+    # Импорт здесь: клиент строится лениво, при первом запросе к бирже
+    from binance.client import Client
+    from requests.adapters import HTTPAdapter
+
+    client = Client(api_key, api_secret, ping=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+    client.session.mount("https://", adapter)
+    return client
+
+
+def journal_symbols() -> list[str]:
+    # SYMBOLS и символы, подписанные на лету по сигналам
+    return sorted(set(settings.symbols) | websocket_manager.tracked_symbols())
+
+
+def journal_path_for(account_id: str) -> str:
+    """Журнал основного аккаунта — JOURNAL_PATH, остальных — рядом с суффиксом аккаунта."""
+    path = settings.journal_path
+    if account_id == settings.default_account or path == ":memory:":
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{account_id}{ext}"
+
+
+class Account:
+    """Торговый аккаунт: свой клиент с пулом соединений, бюджет лимитов, позиции и журнал.
+
+    Рыночные данные (стаканы, метаданные символов) общие для всех аккаунтов
+    и в аккаунт не входят.
+    """
+
+    def __init__(
+        self,
+        account_id: str,
+        client: GovernedClient,
+        governor: RateLimitGovernor,
+        state: AccountState,
+        journal: TradeJournal,
+        api_key: str = "",
+        api_secret: str = ""
+    ):
+        self.id = account_id
+        self.client = client
+        self.governor = governor
+        self.state = state
+        self.journal = journal
+        self.api_key = api_key
+        self.api_secret = api_secret
+
+    def lock_key(self, symbol: str) -> str:
+        # Замок исполнения — на пару (аккаунт, символ): аккаунты по одному символу работают параллельно
+        return f"{self.id}:{symbol}"
+
+    def start(self, symbols: list[str] | None = None) -> None:
+        self.state.start()
+        websocket_manager.start_user_stream(self.id, self.api_key, self.api_secret)
+        self.journal.start(lambda: symbols or journal_symbols(), name=f"journal-catch-up-{self.id}")
+
+    def __repr__(self) -> str:
+        return f"Account({self.id!r})"
+
+
+def create_account(account_id: str, api_key: str, api_secret: str) -> Account:
+    governor = RateLimitGovernor()
+    client = GovernedClient(None, governor, factory=lambda: new_client(api_key, api_secret), clock=clock_sync)
+    state = AccountState(
+        client.futures_position_information,
+        client.futures_account_balance,
+        reconcile_interval=settings.account_reconcile_interval
+    )
+    journal = TradeJournal(journal_path_for(account_id), client.futures_account_trades)
+    websocket_manager.add_user_handler('ACCOUNT_UPDATE', state.apply_account_update, account=account_id)
+    websocket_manager.add_user_handler('ORDER_TRADE_UPDATE', journal.on_order_update, account=account_id)
+    websocket_manager.add_resume_handler(journal.request_catch_up, account=account_id)
+    return Account(account_id, client, governor, state, journal, api_key, api_secret)
+
+
+class AccountRegistry:
+    """Аккаунты процесса и их группы; resolve() превращает цель сигнала в список аккаунтов."""
+
+    def __init__(self, groups: dict[str, list[str]] | None = None):
+        self._accounts: dict[str, Account] = {}
+        self.groups = dict(groups or {})
+        self.default: Account | None = None
+
+    def register(self, account: Account, default: bool = False) -> Account:
+        self._accounts[account.id] = account
+        if default or self.default is None:
+            self.default = account
+        return account
+
+    def get(self, account_id: str | None = None) -> Account:
+        if account_id is None:
+            return self.default
+        account = self._accounts.get(account_id)
+        if account is None:
+            raise ValueError(f"Неизвестный аккаунт: {account_id}")
+        return account
+
+    def all(self) -> list[Account]:
+        return list(self._accounts.values())
+
+    def resolve(self, target: str | list[str] | None = None) -> list[Account]:
+        """Аккаунт, группа, "all" или их список -> аккаунты без повторов; None — основной."""
+        if not target:
+            return [self.default]
+        names = [target] if isinstance(target, str) else list(target)
+        resolved: dict[str, Account] = {}
+        for name in names:
+            if name in ALL_ACCOUNTS:
+                ids = list(self._accounts)
+            elif name in self.groups:
+                ids = self.groups[name]
+            elif name in self._accounts:
+                ids = [name]
+            else:
+                raise ValueError(f"Неизвестный аккаунт или группа: {name}")
+            for account_id in ids:
+                resolved[account_id] = self.get(account_id)
+        return list(resolved.values())
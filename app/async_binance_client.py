@@ -0,0 +1,359 @@
+import math
+import asyncio
+import logging
+import aiohttp
+from typing import Awaitable, Callable
+from binance.async_client import AsyncClient
+from binance.exceptions import BinanceAPIException
+from app.config import settings
+from app.websocket_manager import get_best
+from app.repricer import RepricingPolicy
+from app.accounts import Account
+from app.binance_client import (
+    default_account,
+    book_analytics,
+    repricer,
+    get_symbol_info,
+    BATCH_ORDERS_MAX,
+    BATCH_CANCEL_MAX,
+    _chunks,
+    _log_cancel_errors,
+)
+from app import metrics, post_only
+from app.symbol_locks import symbol_locks
+from app.rate_limiter import GovernedAsyncClient, rate_governor
+from app.clock_sync import clock_sync
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+# Один AsyncClient (и одна aiohttp-сессия с keep-alive пулом) на аккаунт в event loop процесса
+_async_client: GovernedAsyncClient | None = None
+_account_clients: dict[str, GovernedAsyncClient] = {}
+_client_lock = asyncio.Lock()
+
+POOL_SIZE = 100
+
+
+def _new_async_client(api_key: str, api_secret: str) -> AsyncClient:
+    connector = aiohttp.TCPConnector(limit=POOL_SIZE, ttl_dns_cache=300, keepalive_timeout=60)
+    return AsyncClient(api_key, api_secret, session_params={"connector": connector})
+
+
+async def get_async_client(account: Account | None = None) -> GovernedAsyncClient:
+    global _async_client
+    if account is None or account is default_account:
+        if _async_client is not None:
+            return _async_client
+        async with _client_lock:
+            if _async_client is None:
+                _async_client = GovernedAsyncClient(
+                    _new_async_client(settings.binance_api_key, settings.binance_api_secret),
+                    rate_governor, clock=clock_sync
+                )
+        return _async_client
+    client = _account_clients.get(account.id)
+    if client is not None:
+        return client
+    async with _client_lock:
+        if account.id not in _account_clients:
+            # Тот же governor, что и у синхронного клиента аккаунта: бюджет лимитов один
+            _account_clients[account.id] = GovernedAsyncClient(
+                _new_async_client(account.api_key, account.api_secret), account.governor, clock=clock_sync
+            )
+    return _account_clients[account.id]
+
+
+async def close_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close_connection()
+        _async_client = None
+    while _account_clients:
+        _, client = _account_clients.popitem()
+        await client.close_connection()
+
+
+async def create_order(account: Account | None = None, **params) -> dict:
+    client = await get_async_client(account)
+    return await client.futures_create_order(**params)
+
+
+async def cancel_order(symbol: str, order_id: int, account: Account | None = None) -> dict:
+    client = await get_async_client(account)
+    return await client.futures_cancel_order(symbol=symbol, orderId=order_id)
+
+
+async def get_order(symbol: str, order_id: int, account: Account | None = None) -> dict:
+    client = await get_async_client(account)
+    return await client.futures_get_order(symbol=symbol, orderId=order_id)
+
+
+async def get_positions(account: Account | None = None) -> list[dict]:
+    account = account or default_account
+    client = await get_async_client(account)
+    positions = await client.futures_position_information()
+    account.state.load_positions(positions)
+    return positions
+
+
+async def get_position_amount(symbol: str, account: Account | None = None) -> float:
+    account = account or default_account
+    if account.state.is_fresh():
+        return account.state.position_amount(symbol)
+    for p in await get_positions(account):
+        if p['symbol'] == symbol:
+            return float(p.get('positionAmt', 0))
+    return 0.0
+
+
+async def place_batch_orders(orders: list[dict], account: Account | None = None) -> list[dict]:
+    client = await get_async_client(account)
+    chunks = _chunks(orders, BATCH_ORDERS_MAX)
+    responses = await asyncio.gather(*(client.futures_place_batch_order(batchOrders=c) for c in chunks))
+    return [r for resp in responses for r in resp]
+
+
+async def cancel_orders(symbol: str, order_ids: list[int], account: Account | None = None) -> list[dict]:
+    client = await get_async_client(account)
+    chunks = _chunks(order_ids, BATCH_CANCEL_MAX)
+    responses = await asyncio.gather(
+        *(client.futures_cancel_orders(symbol=symbol, orderidlist=c) for c in chunks)
+    )
+    for chunk, resp in zip(chunks, responses):
+        _log_cancel_errors(symbol, chunk, resp)
+    return [r for resp in responses for r in resp]
+
+
+async def cancel_all_open_orders(symbol: str, account: Account | None = None) -> None:
+    account = account or default_account
+    client = await get_async_client(account)
+    logger.info(f"Cancelling all open orders for {symbol} ({account.id})")
+    await client.futures_cancel_all_open_orders(symbol=symbol)
+
+
+async def cancel_open_orders(symbol: str, side: str = None, account: Account | None = None) -> list[dict]:
+    return await post_only.run_async(post_only.cancel_open_orders(symbol, side), _AsyncIO(account or default_account))
+
+
+async def replace_post_only_order(
+    symbol: str, order_id: int, side: str, quantity: str, price: str, account: Account | None = None
+) -> dict:
+    return await post_only.run_async(
+        post_only.replace_order(symbol, order_id, side, quantity, price), _AsyncIO(account or default_account)
+    )
+
+
+async def get_current_book(symbol: str) -> dict:
+    book = get_best(symbol)
+    if book:
+        return book
+    client = await get_async_client()
+    resp = await client.futures_order_book(symbol=symbol, limit=5)
+    return {"bid": float(resp["bids"][0][0]), "ask": float(resp["asks"][0][0])}
+
+
+async def place_post_only_with_retries(
+    symbol: str,
+    side: str,
+    quantity: float,
+    max_deviation_pct: float = 0.1,
+    retry_interval: float = 1,
+    max_attempts: int = 10,
+    policy: RepricingPolicy | None = None,
+    account: Account | None = None
+) -> dict:
+    """Асинхронный вариант binance_client.place_post_only_with_retries: те же шаги post_only."""
+    account = account or default_account
+    with metrics.span("metadata"):
+        info = get_symbol_info(symbol)
+    steps = post_only.chase_post_only(
+        repricer, info, side, quantity, account.id, max_deviation_pct, retry_interval, max_attempts, policy
+    )
+    return await post_only.run_async(steps, _AsyncIO(account))
+
+
+class _AsyncIO:
+    """Асинхронный ввод-вывод шагов post_only для аккаунта; futures_* — его AsyncClient."""
+
+    def __init__(self, account: Account):
+        self.account = account
+
+    def __getattr__(self, name):
+        async def call(**params):
+            client = await get_async_client(self.account)
+            return await getattr(client, name)(**params)
+
+        return call
+
+    async def position(self, symbol: str) -> float:
+        return await get_position_amount(symbol, self.account)
+
+    async def book(self, symbol: str) -> dict:
+        return await get_current_book(symbol)
+
+    async def wait(self, symbol: str, seq: int, timeout: float) -> bool:
+        return await repricer.wait_async(symbol, seq, timeout)
+
+    async def cancel_orders(self, symbol: str, order_ids: list[int]) -> list[dict]:
+        return await cancel_orders(symbol, order_ids, self.account)
+
+
+FLATTEN_MAX_PARALLEL = 8
+TAKE_ATTEMPTS = 3
+
+
+def _flatten_parallelism(requested: int | None, count: int, account: Account) -> int:
+    # Одна погоня — до ~2 ордерных запросов в секунду; не выходим за 10-секундный лимит ORDERS аккаунта
+    bucket = account.governor.buckets.get(("ORDERS", 10))
+    budget = int(bucket.rate / 2) if bucket else FLATTEN_MAX_PARALLEL
+    return max(1, min(count, requested or FLATTEN_MAX_PARALLEL, budget))
+
+
+async def take_liquidity(symbol: str, side: str, quantity: float, mode: str = "market",
+                         slippage_pct: float = 0.5, account: Account | None = None) -> dict:
+    """reduceOnly MARKET или IOC-лимит с допуском slippage_pct от лучшей встречной цены."""
+    info = get_symbol_info(symbol)
+    estimate = book_analytics.vwap(symbol, side, quantity)
+    if estimate is not None:
+        logger.info(
+            f"Taking {side} {quantity} {symbol}: expected VWAP {estimate['vwap']} "
+            f"({estimate['slippage_bps']:.1f} bps over {estimate['levels']} levels)"
+        )
+        reach_pct = abs(estimate['worst_price'] - estimate['best_price']) / estimate['best_price'] * 100
+        if mode == "ioc" and (reach_pct > slippage_pct or estimate['filled'] < quantity):
+            logger.warning(f"Book depth for {symbol} is thin: IOC within {slippage_pct}% will fill partially")
+    params = dict(
+        symbol=symbol, side=side, quantity=info.format_qty(quantity),
+        reduceOnly="true", newOrderRespType="RESULT"
+    )
+    if mode == "ioc":
+        book = await get_current_book(symbol)
+        if side == "BUY":
+            price = book['ask'] * (1 + slippage_pct / 100)
+        else:
+            price = book['bid'] * (1 - slippage_pct / 100)
+        params.update(type="LIMIT", timeInForce="IOC", price=info.format_price(price))
+    else:
+        params.update(type="MARKET")
+    return await create_order(account, **params)
+
+
+def _check_deadline(deadline: float | None) -> None:
+    if deadline is not None and not (math.isfinite(deadline) and deadline > 0):
+        raise ValueError(f"Deadline must be a positive number of seconds, got {deadline:g}")
+
+
+async def flatten_position(
+    symbol: str, deadline: float | None = None, urgent_mode: str = "market", account: Account | None = None
+) -> dict:
+    """Закрывает позицию по символу post-only ордером; с deadline после него добивает IOC/рынком.
+
+    Возвращает {'account','symbol','status','mode','qty','orders': [(order_id, qty)], 'error'}.
+    """
+    _check_deadline(deadline)
+    account = account or default_account
+    async with symbol_locks.hold_async(account.lock_key(symbol)):
+        return await _flatten_position(symbol, deadline, urgent_mode, account)
+
+
+async def _flatten_position(symbol: str, deadline: float | None, urgent_mode: str, account: Account) -> dict:
+    result = {'account': account.id, 'symbol': symbol, 'status': 'flat', 'mode': None, 'qty': 0.0,
+              'orders': [], 'error': None}
+    amt = await get_position_amount(symbol, account)
+    if not amt:
+        return result
+    result['qty'] = amt
+    side = "SELL" if amt > 0 else "BUY"
+    await cancel_open_orders(symbol, account=account)
+    step = get_symbol_info(symbol).step_size
+    maker_id, error = None, None
+    try:
+        if deadline is None:
+            order = await place_post_only_with_retries(symbol, side, abs(amt), account=account)
+        else:
+            order = await place_post_only_with_retries(
+                symbol, side, abs(amt), retry_interval=min(1.0, deadline),
+                max_attempts=max(1, math.ceil(deadline / min(1.0, deadline))), account=account
+            )
+        maker_id = order.get('orderId')
+    except (RuntimeError, ValueError, BinanceAPIException) as e:
+        error = str(e)
+
+    # Погоня возвращает и частичное исполнение: остаток снимаем и меряем по позиции
+    await cancel_open_orders(symbol, account=account)
+    await asyncio.to_thread(account.state.reconcile)
+    remaining = await get_position_amount(symbol, account)
+    if abs(remaining) < step / 2:
+        remaining = 0.0
+    closed = round(abs(amt) - abs(remaining), 8)
+    if maker_id and closed > 0:
+        result['orders'].append((maker_id, closed))
+    if not remaining:
+        result.update(status='closed', mode='maker')
+        return result
+    if deadline is None:
+        result.update(status='failed', mode='maker', error=error or f"{remaining} left open after a partial fill")
+        return result
+    logger.warning(
+        f"Flatten {symbol} ({account.id}): maker close left {remaining} after {deadline}s"
+        f"{f' ({error})' if error else ''}, going {urgent_mode}"
+    )
+
+    for _ in range(TAKE_ATTEMPTS):
+        if not remaining:
+            break
+        order = await take_liquidity(
+            symbol, "SELL" if remaining > 0 else "BUY", abs(remaining), urgent_mode, account=account
+        )
+        executed = float(order.get('executedQty', 0))
+        result['orders'].append((order['orderId'], executed))
+        remaining = remaining - executed if remaining > 0 else remaining + executed
+        if abs(remaining) < step / 2:
+            remaining = 0.0
+    if remaining:
+        result.update(status='failed', mode=urgent_mode, error=f"{remaining} left open after {urgent_mode} orders")
+    else:
+        result.update(status='closed', mode=urgent_mode)
+    return result
+
+
+async def flatten_positions(
+    symbols: list[str] | None = None,
+    deadline: float | None = None,
+    urgent_mode: str = "market",
+    max_parallel: int | None = None,
+    on_progress: Callable[[dict], Awaitable[None]] | None = None,
+    account: Account | None = None
+) -> list[dict]:
+    """Параллельно закрывает позиции аккаунта по symbols (по умолчанию — все открытые).
+
+    Параллелизм ограничен бюджетом ордерных лимитов аккаунта; on_progress вызывается
+    по мере готовности каждого символа.
+    """
+    _check_deadline(deadline)
+    account = account or default_account
+    if symbols is None:
+        if not account.state.is_fresh():
+            await asyncio.to_thread(account.state.reconcile)
+        symbols = [p.symbol for p in account.state.positions()]
+    if not symbols:
+        return []
+    semaphore = asyncio.Semaphore(_flatten_parallelism(max_parallel, len(symbols), account))
+
+    async def run(symbol: str) -> dict:
+        async with semaphore:
+            try:
+                res = await flatten_position(symbol, deadline, urgent_mode, account)
+            except Exception as e:
+                logger.exception(f"Flatten {symbol} ({account.id}) failed")
+                res = {'account': account.id, 'symbol': symbol, 'status': 'failed', 'mode': None, 'qty': 0.0,
+                       'orders': [], 'error': str(e)}
+        if on_progress is not None:
+            try:
+                await on_progress(res)
+            except Exception as e:
+                logger.error(f"Flatten progress callback failed for {symbol}: {e}")
+        return res
+
+    return await asyncio.gather(*(run(s) for s in symbols))
@@ -2,48 +2,179 @@ import math
 import time
 import logging
 from datetime import datetime
-from binance.client import Client
+from concurrent.futures import ThreadPoolExecutor
 from binance.exceptions import BinanceAPIException
 from app.config import settings
-from app.websocket_manager import latest_book
+from app.websocket_manager import (
+    get_best, get_level_qty, add_book_listener, add_user_handler, add_market_listener, add_resume_handler,
+    get_order_book_snapshot, get_book_version
+)
+from app.book_analytics import BookAnalytics
+from app.order_tracker import order_tracker, FILL_STATUSES
+from app.repricer import RepricingEngine, RepricingPolicy
+from app.symbol_metadata import SymbolInfo, SymbolMetadataCache
+from app.account_state import AccountState
+from app.trade_journal import TradeJournal
+from app import metrics, post_only
+from app.rate_limiter import GovernedClient, rate_governor
+from app.clock_sync import clock_sync
+from app.accounts import Account, AccountRegistry, create_account, new_client
+from app.order_scheduler import ParentOrder, ParentOrderScheduler
+from app.risk import RiskEngine, RiskLimits, RiskRejected
+from app.symbol_locks import symbol_locks
 
 logger = logging.getLogger(__name__)
 logger.setLevel(settings.log_level)
 
-_client = Client(settings.binance_api_key, settings.binance_api_secret)
+# Клиент биржи создаётся при первом запросе (прогрев или первый сигнал), не при импорте
+_client = GovernedClient(
+    None, rate_governor, factory=lambda: new_client(settings.binance_api_key, settings.binance_api_secret),
+    clock=clock_sync
+)
+# Метки E событий рынка — нижняя граница смещения часов и односторонняя задержка
+add_market_listener(clock_sync.on_market_event)
 
+symbol_metadata = SymbolMetadataCache(_client.futures_exchange_info, ttl=settings.metadata_ttl)
 
-def get_price_filter(symbol: str) -> dict:
-    info = _client.futures_exchange_info()
-    for s in info["symbols"]:
-        if s["symbol"] == symbol:
-            return next(f for f in s["filters"] if f["filterType"] == "PRICE_FILTER")
-    raise ValueError(f"No PRICE_FILTER for symbol {symbol}")
+account_state = AccountState(
+    _client.futures_position_information,
+    _client.futures_account_balance,
+    reconcile_interval=settings.account_reconcile_interval
+)
+add_user_handler('ACCOUNT_UPDATE', account_state.apply_account_update, account=settings.default_account)
 
+trade_journal = TradeJournal(settings.journal_path, _client.futures_account_trades)
+add_user_handler('ORDER_TRADE_UPDATE', trade_journal.on_order_update, account=settings.default_account)
+add_resume_handler(trade_journal.request_catch_up, account=settings.default_account)
 
-def cancel_open_orders(symbol: str, side: str = None) -> None:
-    opens = _client.futures_get_open_orders(symbol=symbol)
-    for o in opens:
-        if o["type"] == "LIMIT" and (side is None or o["side"] == side):
-            logger.info(f"Cancelling order {o['orderId']} side={o['side']}")
-            _client.futures_cancel_order(symbol=symbol, orderId=o["orderId"])
+# Основной аккаунт — объекты выше; дополнительные получают свои клиенты, лимиты и журналы
+accounts = AccountRegistry(settings.account_groups)
+default_account = accounts.register(
+    Account(
+        settings.default_account, _client, rate_governor, account_state, trade_journal,
+        settings.binance_api_key, settings.binance_api_secret
+    ),
+    default=True
+)
+for _account_id, (_key, _secret) in settings.account_credentials.items():
+    accounts.register(create_account(_account_id, _key, _secret))
+
+repricer = RepricingEngine(get_best, get_level_qty)
+add_book_listener(repricer.on_book_update)
+add_user_handler('ORDER_TRADE_UPDATE', repricer.on_order_update)
+
+# Глубина, дисбаланс и VWAP по локальному стакану — общие для исполнения, API и дашборда
+book_analytics = BookAnalytics(get_order_book_snapshot, get_book_version)
+# Предторговые проверки по позициям и ценам в памяти — для вебхуков и бота
+risk_engine = RiskEngine(RiskLimits.from_settings(), get_best)
+
+
+def get_symbol_info(symbol: str) -> SymbolInfo:
+    return symbol_metadata.get(symbol)
+
+
+BATCH_ORDERS_MAX = 5
+BATCH_CANCEL_MAX = 10
+
+
+def _chunks(items: list, size: int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def place_batch_orders(orders: list[dict], account: Account | None = None) -> list[dict]:
+    """Размещает ордера пачками по 5 через batchOrders; ошибки возвращаются как {'code','msg'}."""
+    client = (account or default_account).client
+    results = []
+    for chunk in _chunks(orders, BATCH_ORDERS_MAX):
+        resp = client.futures_place_batch_order(batchOrders=chunk)
+        for order, r in zip(chunk, resp):
+            if "code" in r and "orderId" not in r:
+                logger.warning(f"Batch order {order.get('symbol')} {order.get('side')} rejected: {r.get('msg')}")
+        results.extend(resp)
+    return results
+
+
+def _log_cancel_errors(symbol: str, order_ids: list[int], results: list[dict]) -> None:
+    for order_id, r in zip(order_ids, results):
+        if "code" in r and "orderId" not in r:
+            logger.warning(f"Cancel of order {order_id} {symbol} rejected: {r.get('msg')}")
+
+
+def cancel_orders(symbol: str, order_ids: list[int], account: Account | None = None) -> list[dict]:
+    """Снимает ордера пачками по 10; ошибки возвращаются как {'code','msg'} на месте ордера."""
+    client = (account or default_account).client
+    results = []
+    for chunk in _chunks(order_ids, BATCH_CANCEL_MAX):
+        resp = client.futures_cancel_orders(symbol=symbol, orderidlist=chunk)
+        _log_cancel_errors(symbol, chunk, resp)
+        results.extend(resp)
+    return results
+
+
+def cancel_all_open_orders(symbol: str, account: Account | None = None) -> None:
+    account = account or default_account
+    logger.info(f"Cancelling all open orders for {symbol} ({account.id})")
+    account.client.futures_cancel_all_open_orders(symbol=symbol)
+
+
+def cancel_open_orders(symbol: str, side: str = None, account: Account | None = None) -> list[dict]:
+    """Снимает открытые LIMIT-ордера символа; возвращает ошибки снятия ({'code','msg'})."""
+    return post_only.run(post_only.cancel_open_orders(symbol, side), _SyncIO(account or default_account))
+
+
+def cancel_open_orders_many(symbols: list[str], cancel_all: bool = False, account: Account | None = None) -> None:
+    cancel = cancel_all_open_orders if cancel_all else cancel_open_orders
+    if not symbols:
+        return
+    with ThreadPoolExecutor(max_workers=min(len(symbols), 8)) as pool:
+        for sym, future in [(sym, pool.submit(cancel, sym, account=account)) for sym in symbols]:
+            try:
+                errors = future.result()
+                if errors:
+                    logger.error(f"Cancel for {sym} left {len(errors)} orders open")
+            except BinanceAPIException as e:
+                logger.error(f"Cancel for {sym} failed: {e.message}")
+
+
+def replace_post_only_order(
+    symbol: str, order_id: int, side: str, quantity: str, price: str, account: Account | None = None
+) -> dict:
+    """Перевыставляет post-only ордер по новой цене одним запросом (modify), иначе cancel + create."""
+    return post_only.run(
+        post_only.replace_order(symbol, order_id, side, quantity, price), _SyncIO(account or default_account)
+    )
 
 
 def get_current_book(symbol: str) -> dict:
-    book = latest_book.get(symbol)
+    book = get_best(symbol)
     if book:
         return book
+    logger.debug(f"No local book for {symbol}, falling back to REST")
     resp = _client.futures_order_book(symbol=symbol, limit=5)
     return {"bid": float(resp["bids"][0][0]), "ask": float(resp["asks"][0][0])}
 
 
-def wait_for_fill(symbol: str, order_id: int, timeout: float = 20.0, poll_interval: float = 0.5) -> None:
+def wait_for_fill(
+    symbol: str, order_id: int, timeout: float = 20.0, poll_interval: float = 0.5, account: Account | None = None
+) -> None:
+    account = account or default_account
+    status = None
+    if order_tracker.is_active(account.id):
+        state = order_tracker.wait(order_id, timeout)
+        status = state.status if state else None
+        logger.info(f"Order {order_id} status: {status}")
+        if status in FILL_STATUSES:
+            return
+        if state is not None and order_tracker.is_active(account.id):
+            raise RuntimeError(f"Order {order_id} not filled in {timeout}s, last status {status}")
+        # Событий нет или поток замолчал во время ожидания — статус из REST
+        timeout = poll_interval
     deadline = time.time() + timeout
     while time.time() < deadline:
-        o = _client.futures_get_order(symbol=symbol, orderId=order_id)
+        o = account.client.futures_get_order(symbol=symbol, orderId=order_id)
         status = o.get("status")
         logger.info(f"Order {order_id} status: {status}")
-        if status in ("FILLED", "PARTIALLY_FILLED"):
+        if status in FILL_STATUSES:
             return
         time.sleep(poll_interval)
     raise RuntimeError(f"Order {order_id} not filled in {timeout}s, last status {status}")
@@ -55,88 +186,96 @@ def place_post_only_with_retries(
     quantity: float,
     max_deviation_pct: float = 0.1,
     retry_interval: float = 1,
-    max_attempts: int = 10
+    max_attempts: int = 10,
+    policy: RepricingPolicy | None = None,
+    account: Account | None = None
 ) -> dict:
-    pf = get_price_filter(symbol)
-    tick = float(pf["tickSize"])
-    initial_pos = get_position_amount(symbol)
-    target_pos = initial_pos + quantity if side.upper() == 'BUY' else initial_pos - quantity
-    last_order_id = None
-
-    for attempt in range(1, max_attempts + 1):
-        current_pos = get_position_amount(symbol)
-        if (side.upper() == 'BUY' and current_pos >= target_pos) or \
-           (side.upper() == 'SELL' and current_pos <= target_pos):
-            logger.info(f"Position reached target ({current_pos}), stopping retries")
-            return {'orderId': last_order_id}
-
-        book = get_current_book(symbol)
-        best_bid, best_ask = book['bid'], book['ask']
-        if side.upper() == 'BUY':
-            price_raw = best_bid - tick * attempt
-            base_price = best_bid
-        else:
-            price_raw = best_ask + tick * attempt
-            base_price = best_ask
-        max_dev = base_price * max_deviation_pct / 100
-        if abs(price_raw - base_price) > max_dev:
-            logger.error(f"Exceeded max deviation after {attempt} attempts")
-            break
-        precision = abs(int(round(math.log10(tick))))
-        price_str = f"{price_raw:.{precision}f}"
-
-        if last_order_id:
-            try:
-                _client.futures_cancel_order(symbol=symbol, orderId=last_order_id)
-            except Exception:
-                pass
-            last_order_id = None
+    """Выставляет post-only ордер и ведёт его за лучшей ценой до исполнения (см. post_only.chase_post_only)."""
+    account = account or default_account
+    with metrics.span("metadata"):
+        info = get_symbol_info(symbol)
+    steps = post_only.chase_post_only(
+        repricer, info, side, quantity, account.id, max_deviation_pct, retry_interval, max_attempts, policy
+    )
+    return post_only.run(steps, _SyncIO(account))
 
-        try:
-            order = _client.futures_create_order(
-                symbol=symbol,
-                side=side.upper(),
-                type="LIMIT",
-                timeInForce="GTX",
-                price=price_str,
-                quantity=str(quantity)
-            )
-            last_order_id = order['orderId']
-            logger.info(f"Attempt {attempt}/{max_attempts}: placed post-only {side} at {price_str}")
-        except BinanceAPIException as e:
-            if "could not be executed as maker" in e.message or \
-               "Post Only order will be rejected" in e.message:
-                logger.warning(f"Attempt {attempt}: maker reject ({e.message}), retrying")
-                time.sleep(retry_interval)
-                continue
-            logger.error(f"Attempt {attempt}: unexpected API error ({e.message})")
-            raise
-
-        time.sleep(retry_interval)
-        try:
-            o = _client.futures_get_order(symbol=symbol, orderId=last_order_id)
-            status = o.get('status')
-        except BinanceAPIException:
-            logger.warning(f"Attempt {attempt}: cannot fetch order status, retrying")
-            time.sleep(retry_interval)
-            continue
 
-        logger.info(f"Order {last_order_id} status: {status}")
-        if status in ('FILLED', 'PARTIALLY_FILLED'):
-            return o
-        time.sleep(retry_interval)
+class _SyncIO:
+    """Синхронный ввод-вывод шагов post_only для аккаунта; futures_* — напрямую клиенту."""
+
+    def __init__(self, account: Account):
+        self.account = account
+
+    def __getattr__(self, name):
+        return getattr(self.account.client, name)
 
-    error = f"Order {side} {symbol} {quantity} not filled after {max_attempts} attempts"
-    logger.error(error)
-    raise RuntimeError(error)
+    def position(self, symbol: str) -> float:
+        return get_position_amount(symbol, self.account)
 
+    def book(self, symbol: str) -> dict:
+        return get_current_book(symbol)
 
-def get_position_amount(symbol: str) -> float:
-    positions = _client.futures_position_information()
+    def wait(self, symbol: str, seq: int, timeout: float) -> bool:
+        return repricer.wait(symbol, seq, timeout)
+
+    def cancel_orders(self, symbol: str, order_ids: list[int]) -> list[dict]:
+        return cancel_orders(symbol, order_ids, account=self.account)
+
+
+def get_position_amount(symbol: str, account: Account | None = None) -> float:
+    account = account or default_account
+    if account.state.is_fresh():
+        amt = account.state.position_amount(symbol)
+        logger.debug(f"Position for {symbol} ({account.id}): {amt} (cached)")
+        return amt
+    positions = account.client.futures_position_information()
+    account.state.load_positions(positions)
     for p in positions:
         if p['symbol'] == symbol:
             amt = float(p.get('positionAmt', 0))
             logger.debug(f"Position for {symbol}: {amt}")
             return amt
     logger.debug(f"No position for {symbol}, returning 0.0")
-    return 0.0
\ No newline at end of file
+    return 0.0
+
+
+def place_child_order(parent: ParentOrder, quantity: float, budget: float) -> float:
+    """Дочерний post-only ордер родителя: погоня не дольше budget секунд, затем снятие остатка.
+
+    Замок символа аккаунта держится только на время этой погони. Возвращает исполненный объём.
+    """
+    account = accounts.get(parent.account)
+    try:
+        risk_engine.check_order_rate(account.id)
+    except RiskRejected as e:
+        logger.info(f"Parent {parent.parent_id}: child {quantity} skipped ({e})")
+        return 0.0
+    lock = symbol_locks[account.lock_key(parent.symbol)]
+    if not lock.acquire(timeout=budget):
+        logger.info(f"Parent {parent.parent_id}: {parent.symbol} ({account.id}) is busy, skipping a child")
+        return 0.0
+    try:
+        before = get_position_amount(parent.symbol, account)
+        interval = min(1.0, budget)
+        try:
+            place_post_only_with_retries(
+                parent.symbol, parent.side, quantity,
+                retry_interval=interval, max_attempts=max(1, math.ceil(budget / interval)), account=account
+            )
+        except RuntimeError as e:
+            logger.info(f"Parent {parent.parent_id}: child {quantity} not filled in {budget:.1f}s ({e})")
+        except BinanceAPIException as e:
+            logger.warning(f"Parent {parent.parent_id}: child {quantity} failed ({e.message})")
+        finally:
+            # Погоня возвращает и частичное исполнение, ошибка могла прийти после части сделок —
+            # остаток снимаем всегда, исполненное меряем по позиции
+            cancel_open_orders(parent.symbol, parent.side, account=account)
+            account.state.reconcile()
+            filled = min(quantity, abs(get_position_amount(parent.symbol, account) - before))
+        return filled
+    finally:
+        lock.release()
+
+
+order_scheduler = ParentOrderScheduler(place_child_order, get_symbol_info)
+add_market_listener(order_scheduler.on_market_event)
@@ -0,0 +1,186 @@
+import logging
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+ANALYTICS_DEPTH = 500
+DEFAULT_BPS = (5, 10, 25, 50)
+MAX_SUMMARIES = 256  # наборы параметров из запросов API не должны раздувать кэш
+
+
+@dataclass(slots=True)
+class BookLevels:
+    """Уровни одной версии стакана в массивах NumPy с накопленными суммами.
+
+    Биды — по убыванию цены, аски — по возрастанию; cum_* [i] — сумма по уровням 0..i.
+    """
+    version: int
+    bid_px: np.ndarray
+    bid_qty: np.ndarray
+    ask_px: np.ndarray
+    ask_qty: np.ndarray
+    bid_cum_qty: np.ndarray
+    ask_cum_qty: np.ndarray
+    bid_cum_notional: np.ndarray
+    ask_cum_notional: np.ndarray
+
+    @classmethod
+    def from_top(cls, book: dict) -> "BookLevels":
+        bids = np.asarray(book["bids"], dtype=np.float64).reshape(-1, 2)
+        asks = np.asarray(book["asks"], dtype=np.float64).reshape(-1, 2)
+        return cls(
+            version=book.get("version", 0),
+            bid_px=bids[:, 0], bid_qty=bids[:, 1],
+            ask_px=asks[:, 0], ask_qty=asks[:, 1],
+            bid_cum_qty=np.cumsum(bids[:, 1]), ask_cum_qty=np.cumsum(asks[:, 1]),
+            bid_cum_notional=np.cumsum(bids[:, 0] * bids[:, 1]),
+            ask_cum_notional=np.cumsum(asks[:, 0] * asks[:, 1]),
+        )
+
+    @property
+    def empty(self) -> bool:
+        return not len(self.bid_px) or not len(self.ask_px)
+
+    @property
+    def mid(self) -> float:
+        return (self.bid_px[0] + self.ask_px[0]) / 2
+
+    @property
+    def microprice(self) -> float:
+        # Середина, смещённая к стороне с меньшим объёмом на touch
+        bq, aq = self.bid_qty[0], self.ask_qty[0]
+        return float((self.bid_px[0] * aq + self.ask_px[0] * bq) / (bq + aq))
+
+    def depth_within(self, bps: float) -> tuple[float, float]:
+        """Накопленный объём бидов и асков в пределах bps от середины."""
+        mid = self.mid
+        # -bid_px возрастает, поэтому обе стороны ищутся бинарным поиском
+        nb = np.searchsorted(-self.bid_px, -mid * (1 - bps / 1e4), side="right")
+        na = np.searchsorted(self.ask_px, mid * (1 + bps / 1e4), side="right")
+        bid = float(self.bid_cum_qty[nb - 1]) if nb else 0.0
+        ask = float(self.ask_cum_qty[na - 1]) if na else 0.0
+        return bid, ask
+
+    def cum_qty(self, side: str, levels: int) -> float:
+        """Объём первых levels уровней: BUY — биды, SELL — аски."""
+        cum = self.bid_cum_qty if side == "BUY" else self.ask_cum_qty
+        return float(cum[min(levels, len(cum)) - 1]) if levels > 0 else 0.0
+
+    def imbalance(self, levels: int = 5) -> float:
+        """(B - A) / (B + A) по первым levels уровням: +1 — только биды, -1 — только аски."""
+        b, a = self.cum_qty("BUY", levels), self.cum_qty("SELL", levels)
+        return (b - a) / (b + a) if b + a else 0.0
+
+    def vwap(self, side: str, quantity: float) -> dict:
+        """Средняя цена рыночного исполнения quantity: BUY идёт по аскам, SELL — по бидам.
+
+        slippage_bps — ухудшение VWAP относительно лучшей цены; filled < quantity,
+        если в загруженной глубине не хватает объёма.
+        """
+        if side == "BUY":
+            px, cum_qty, cum_notional = self.ask_px, self.ask_cum_qty, self.ask_cum_notional
+        else:
+            px, cum_qty, cum_notional = self.bid_px, self.bid_cum_qty, self.bid_cum_notional
+        k = int(np.searchsorted(cum_qty, quantity, side="left"))
+        if k >= len(px):
+            filled, notional, k = float(cum_qty[-1]), float(cum_notional[-1]), len(px) - 1
+        else:
+            before_qty = float(cum_qty[k - 1]) if k else 0.0
+            before_notional = float(cum_notional[k - 1]) if k else 0.0
+            filled = quantity
+            notional = before_notional + (quantity - before_qty) * float(px[k])
+        vwap = notional / filled if filled else 0.0
+        best = float(px[0])
+        slippage = (vwap - best) / best if side == "BUY" else (best - vwap) / best
+        return {
+            "side": side,
+            "quantity": quantity,
+            "filled": filled,
+            "vwap": vwap,
+            "best_price": best,
+            "worst_price": float(px[k]),
+            "levels": k + 1,
+            "slippage_bps": slippage * 1e4,
+        }
+
+
+class BookAnalytics:
+    """Аналитика локального стакана: глубина в bps, дисбаланс, microprice, VWAP до объёма.
+
+    Массивы уровней строятся один раз на версию книги и общие для всех
+    запросов — вебхуков, бота и дашборда.
+    """
+
+    def __init__(
+        self,
+        snapshot: Callable[[str, int], dict],
+        version: Callable[[str], int],
+        depth: int = ANALYTICS_DEPTH
+    ):
+        self._snapshot = snapshot
+        self._version = version
+        self.depth = depth
+        self._cache: dict[str, BookLevels] = {}
+        self._summaries: dict[tuple, tuple[int, dict]] = {}
+        self._lock = Lock()
+
+    def levels(self, symbol: str) -> BookLevels | None:
+        version = self._version(symbol)
+        if not version:
+            return None
+        cached = self._cache.get(symbol)
+        if cached is not None and cached.version == version:
+            return cached
+        levels = BookLevels.from_top(self._snapshot(symbol, self.depth))
+        if levels.empty:
+            return None
+        with self._lock:
+            self._cache[symbol] = levels
+        return levels
+
+    def vwap(self, symbol: str, side: str, quantity: float) -> dict | None:
+        levels = self.levels(symbol)
+        return levels.vwap(side.upper(), quantity) if levels is not None else None
+
+    def summary(
+        self, symbol: str, bps: tuple[float, ...] = DEFAULT_BPS, imbalance_levels: int = 5, top: int = 20
+    ) -> dict | None:
+        """Сводка по стакану, одна на версию книги и набор параметров.
+
+        top_qty — суммарный объём первых top уровней каждой стороны (для шкал дашборда).
+        """
+        levels = self.levels(symbol)
+        if levels is None:
+            return None
+        key = (symbol, tuple(bps), imbalance_levels, top)
+        cached = self._summaries.get(key)
+        if cached is not None and cached[0] == levels.version:
+            return cached[1]
+        depth = {}
+        for b in bps:
+            bid, ask = levels.depth_within(b)
+            depth[f"{b:g}"] = {"bid": bid, "ask": ask}
+        result = {
+            "symbol": symbol,
+            "version": levels.version,
+            "bid": float(levels.bid_px[0]),
+            "ask": float(levels.ask_px[0]),
+            "mid": float(levels.mid),
+            "spread": float(levels.ask_px[0] - levels.bid_px[0]),
+            "microprice": levels.microprice,
+            "imbalance": levels.imbalance(imbalance_levels),
+            "depth_bps": depth,
+            "top_qty": {"bid": levels.cum_qty("BUY", top), "ask": levels.cum_qty("SELL", top)},
+        }
+        with self._lock:
+            if len(self._summaries) >= MAX_SUMMARIES:
+                self._summaries.clear()
+            self._summaries[key] = (levels.version, result)
+        return result
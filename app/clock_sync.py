@@ -0,0 +1,201 @@
+import time
+import logging
+from collections import deque
+from threading import Event, Lock, Thread
+from typing import Callable
+
+from app.config import settings
+from app import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+TIMESTAMP_ERROR = -1021  # метка времени вне recvWindow или впереди часов биржи
+
+SAMPLES = 16  # последних замеров REST, из которых берётся замер с минимальным RTT
+# мс; python-binance подписывал запросы с REQUEST_RECVWINDOW = 10000 (у самой Binance по умолчанию 5000).
+# Окно не опускается ниже прежнего: подстройка под RTT его только расширяет при медленной сети
+DEFAULT_RECV_WINDOW = 10000
+MIN_RECV_WINDOW = DEFAULT_RECV_WINDOW
+MAX_RECV_WINDOW = 60000  # верхняя граница Binance
+RECV_MARGIN_MS = 500  # запас на джиттер планировщика и GC
+AHEAD_SHIFT_MS = 1000  # биржа отвергает метки, опережающие её часы больше чем на секунду
+BOOST_SECONDS = 60.0  # сколько держать увеличенный recvWindow после -1021
+FLOOR_TTL = 60.0  # нижняя граница смещения из потока действует столько секунд
+ERROR_RESYNC_DELAY = 1.0  # фоновая синхронизация после -1021
+
+clock_offset_ms = metrics.register(metrics.Gauge(
+    "exchange_clock_offset_ms", "Estimated exchange clock minus local clock, ms"
+))
+clock_rtt_seconds = metrics.register(metrics.Histogram(
+    "exchange_time_rtt_seconds", "Round trip of exchange time endpoint samples"
+))
+one_way_latency_seconds = metrics.register(metrics.Histogram(
+    "market_event_one_way_latency_seconds", "Exchange event time to local receipt, offset-corrected", ("kind",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+))
+timestamp_rejects_total = metrics.register(metrics.Counter(
+    "exchange_timestamp_rejects_total", "Signed requests rejected with -1021 by cause", ("cause",)
+))
+
+
+class ClockSync:
+    """Оценка смещения часов биржи и задержки до неё для подписи запросов.
+
+    Смещение берётся из замеров эндпоинта времени: из последних SAMPLES
+    выбирается замер с минимальным RTT, его погрешность — половина RTT.
+    Метка E событий рынка даёт нижнюю границу смещения (задержка не бывает
+    отрицательной) и одностороннюю задержку. recvWindow подстраивается под
+    сглаженный RTT подписанных запросов (как RTO в TCP: srtt + 4·rttvar).
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], int] | None = None,
+        interval: float = settings.clock_sync_interval,
+        clock: Callable[[], float] = time.time,
+        monotonic: Callable[[], float] = time.monotonic
+    ):
+        self._fetch = fetch  # -> serverTime биржи в мс
+        self.interval = interval
+        self._clock = clock
+        self._monotonic = monotonic
+        self._lock = Lock()
+        self._samples: deque[tuple[float, float]] = deque(maxlen=SAMPLES)  # (rtt мс, смещение мс)
+        self._offset = 0.0
+        self._uncertainty = 0.0
+        self._floor: float | None = None
+        self._floor_at = 0.0
+        self._srtt: float | None = None  # мс
+        self._rttvar = 0.0
+        self._boost_until = 0.0
+        self._synced_at: float | None = None
+        self._wake = Event()
+        self._thread: Thread | None = None
+
+    def start(self, fetch: Callable[[], int] | None = None) -> float:
+        """Первый замер (ошибка — наружу, для повтора прогревом) и фоновая синхронизация."""
+        if fetch is not None:
+            self._fetch = fetch
+        offset = self.sync()
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name="clock-sync", daemon=True)
+            self._thread.start()
+        return offset
+
+    def sync(self) -> float:
+        sent = self._clock()
+        server_ms = self._fetch()
+        return self.add_sample(sent, server_ms, self._clock())
+
+    def add_sample(self, sent: float, server_ms: float, received: float) -> float:
+        """Замер эндпоинта времени: локальные секунды отправки и ответа, время биржи в мс."""
+        rtt = (received - sent) * 1000
+        # Сервер ставит метку примерно посередине запроса
+        offset = server_ms - (sent + received) * 500
+        clock_rtt_seconds.observe(rtt / 1000)
+        with self._lock:
+            self._samples.append((rtt, offset))
+            best_rtt, best_offset = min(self._samples)
+            self._uncertainty = best_rtt / 2
+            self._offset = max(best_offset, self._live_floor())
+            self._synced_at = self._monotonic()
+            result = self._offset
+        clock_offset_ms.set(result)
+        return result
+
+    def _live_floor(self) -> float:
+        if self._floor is None or self._monotonic() - self._floor_at > FLOOR_TTL:
+            return float("-inf")
+        return self._floor
+
+    def observe_event(self, event_ms: float, received: float | None = None, kind: str = "depth") -> None:
+        """Событие с меткой биржи: нижняя граница смещения и односторонняя задержка."""
+        received_ms = (self._clock() if received is None else received) * 1000
+        bound = event_ms - received_ms
+        with self._lock:
+            if self._floor is None or bound > self._floor or self._monotonic() - self._floor_at > FLOOR_TTL:
+                self._floor, self._floor_at = bound, self._monotonic()
+            if bound > self._offset:
+                # Событие пришло «раньше», чем было отправлено по нашей оценке — оценка отстаёт
+                self._offset = bound
+                clock_offset_ms.set(bound)
+            one_way = received_ms + self._offset - event_ms
+        one_way_latency_seconds.observe(one_way / 1000, (kind,))
+
+    def on_market_event(self, kind: str, payload: dict) -> None:
+        """Слушатель websocket_manager.add_market_listener."""
+        event_ms = payload.get("E")
+        if event_ms:
+            self.observe_event(event_ms, kind=kind)
+
+    def observe_request(self, seconds: float) -> None:
+        """Длительность подписанного запроса — в сглаженный RTT для recvWindow."""
+        rtt = seconds * 1000
+        with self._lock:
+            if self._srtt is None:
+                self._srtt, self._rttvar = rtt, rtt / 2
+            else:
+                self._rttvar += (abs(self._srtt - rtt) - self._rttvar) / 4
+                self._srtt += (rtt - self._srtt) / 8
+
+    def offset_ms(self) -> int:
+        """Смещение для подписи: сдвинуто назад на погрешность, чтобы метка не опережала биржу."""
+        return round(self._offset - self._uncertainty)
+
+    def recv_window(self) -> int:
+        if self._srtt is None and not self._samples:
+            window = DEFAULT_RECV_WINDOW
+        else:
+            # Метка отстаёт от биржи на погрешность, запрос идёт до неё примерно полпути RTT
+            srtt = self._srtt if self._srtt is not None else min(self._samples)[0]
+            window = max(srtt + 4 * self._rttvar + 2 * self._uncertainty + RECV_MARGIN_MS, MIN_RECV_WINDOW)
+            if self._monotonic() < self._boost_until:
+                window *= 2
+        return int(min(window, MAX_RECV_WINDOW))
+
+    def on_timestamp_error(self, message: str) -> None:
+        """Поправка по ответу -1021 без обращения к бирже; уточнение — фоновым замером."""
+        with self._lock:
+            if "ahead" in message:
+                cause = "ahead"
+                self._offset = max(self._offset - AHEAD_SHIFT_MS, self._live_floor())
+            else:
+                cause = "recv_window"
+                self._offset = max(self._offset, self._live_floor())
+                self._boost_until = self._monotonic() + BOOST_SECONDS
+            offset = self._offset
+        clock_offset_ms.set(offset)
+        timestamp_rejects_total.inc((cause,))
+        logger.warning(f"Timestamp rejected ({message}), offset now {offset:+.0f}ms, recvWindow {self.recv_window()}")
+        self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            woken = self._wake.wait(self.interval)
+            if woken:
+                self._wake.clear()
+                # Даём сети успокоиться: замер во время всплеска задержек даст плохой RTT
+                time.sleep(ERROR_RESYNC_DELAY)
+            try:
+                self.sync()
+            except Exception as e:
+                logger.warning(f"Clock sync failed: {e}")
+
+    def status(self) -> dict:
+        with self._lock:
+            floor = self._live_floor()
+            return {
+                "offset_ms": round(self._offset, 1),
+                "signing_offset_ms": self.offset_ms(),
+                "uncertainty_ms": round(self._uncertainty, 1),
+                "stream_floor_ms": round(floor, 1) if floor != float("-inf") else None,
+                "srtt_ms": round(self._srtt, 1) if self._srtt is not None else None,
+                "rttvar_ms": round(self._rttvar, 1),
+                "recv_window": self.recv_window(),
+                "samples": len(self._samples),
+                "synced_ago": round(self._monotonic() - self._synced_at, 1) if self._synced_at else None,
+            }
+
+
+clock_sync = ClockSync()
@@ -4,20 +4,94 @@ from dotenv import load_dotenv
 if os.getenv("FLASK_ENV", "").lower() == "development":
     load_dotenv(".env")
 
+def _parse_groups(raw: str) -> dict[str, list[str]]:
+    # "subs=sub1,sub2;alts=sub2" -> {"subs": ["sub1", "sub2"], "alts": ["sub2"]}
+    groups = {}
+    for part in raw.split(";"):
+        name, _, members = part.partition("=")
+        if name.strip() and members:
+            groups[name.strip()] = [m.strip() for m in members.split(",") if m.strip()]
+    return groups
+
+def _parse_limits(raw: str) -> dict[str, float]:
+    # "ETHUSDT=5,BTCUSDT=0.5,*=100" -> {"ETHUSDT": 5.0, "BTCUSDT": 0.5, "*": 100.0}
+    limits = {}
+    for part in raw.split(","):
+        name, _, value = part.partition("=")
+        if name.strip() and value.strip():
+            limits[name.strip().upper()] = float(value)
+    return limits
+
 class Settings:
-    binance_api_key: str = os.environ["BINANCE_API_KEY"]
-    binance_api_secret: str = os.environ["BINANCE_API_SECRET"]
-    webhook_secret: str = os.environ["WEBHOOK_SECRET"]
+    # Обязательные переменные проверяет validate() при старте сервисов, а не импорт модуля
+    binance_api_key: str = os.environ.get("BINANCE_API_KEY", "")
+    binance_api_secret: str = os.environ.get("BINANCE_API_SECRET", "")
+    webhook_secret: str = os.environ.get("WEBHOOK_SECRET", "")
 
-    telegram_token: str    = os.environ["TELEGRAM_TOKEN"]
+    telegram_token: str    = os.environ.get("TELEGRAM_TOKEN", "")
+
+    # Основной аккаунт — BINANCE_API_KEY/SECRET; дополнительные — ACCOUNTS=sub1,sub2
+    # с ключами BINANCE_API_KEY_SUB1/BINANCE_API_SECRET_SUB1; группы — ACCOUNT_GROUPS="subs=sub1,sub2"
+    default_account: str   = os.environ.get("DEFAULT_ACCOUNT", "main")
+    account_credentials: dict[str, tuple[str, str]] = {
+        a.strip(): (
+            os.environ.get(f"BINANCE_API_KEY_{a.strip().upper()}", ""),
+            os.environ.get(f"BINANCE_API_SECRET_{a.strip().upper()}", "")
+        )
+        for a in os.environ.get("ACCOUNTS", "").split(",") if a.strip()
+    }
+    account_groups: dict[str, list[str]] = _parse_groups(os.environ.get("ACCOUNT_GROUPS", ""))
 
     symbols: list[str]     = os.environ.get("SYMBOLS", "ETHUSDT,BTCUSDT").split(",")
     default_symbol: str    = os.environ.get("DEFAULT_SYMBOL", symbols[0])
     default_quantity: float= float(os.environ.get("DEFAULT_QUANTITY", "0.01"))
 
+    metadata_ttl: float    = float(os.environ.get("METADATA_TTL", "3600"))
+    account_reconcile_interval: float = float(os.environ.get("ACCOUNT_RECONCILE_INTERVAL", "30"))
+
+    run_telegram_bot: bool = os.environ.get("RUN_TELEGRAM_BOT", "1").lower() not in ("0", "false", "no")
+    journal_path: str      = os.environ.get("JOURNAL_PATH", "trade_journal.db")
+    metrics_enabled: bool  = os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+    metrics_port: int      = int(os.environ.get("METRICS_PORT", "0"))  # /metrics Telegram-бота; 0 — выключено
+    # Каналы рыночного хаба для всех символов; combined-сокет молчит дольше таймаута — переподключение
+    market_channels: list[str] = [
+        c.strip() for c in os.environ.get("MARKET_CHANNELS", "depth,bookTicker,markPrice,aggTrade").split(",")
+        if c.strip()
+    ]
+    stream_stall_timeout: float = float(os.environ.get("STREAM_STALL_TIMEOUT", "10"))
+    # Пользовательский поток без событий дольше стольких секунд считается оборвавшимся: статусы — через REST
+    user_stream_stale: float = float(os.environ.get("USER_STREAM_STALE", "60"))
+    # Сверка журнала сделок с REST (и сразу после переподключения пользовательского потока), секунды
+    journal_catch_up_interval: float = float(os.environ.get("JOURNAL_CATCH_UP_INTERVAL", "300"))
+    # Символы, подписанные на лету по сигналам, снимаются после стольких секунд без сигналов
+    dynamic_symbol_ttl: float = float(os.environ.get("DYNAMIC_SYMBOL_TTL", "3600"))
+    # Предторговые проверки; 0 или пусто — проверка выключена
+    risk_max_position: dict[str, float] = _parse_limits(os.environ.get("RISK_MAX_POSITION", ""))
+    risk_max_notional: float = float(os.environ.get("RISK_MAX_NOTIONAL", "0"))
+    risk_max_leverage: int = int(os.environ.get("RISK_MAX_LEVERAGE", "0"))
+    risk_max_orders_per_minute: int = int(os.environ.get("RISK_MAX_ORDERS_PER_MINUTE", "0"))
+    risk_duplicate_window: float = float(os.environ.get("RISK_DUPLICATE_WINDOW", "2"))
+    risk_price_band_bps: float = float(os.environ.get("RISK_PRICE_BAND_BPS", "1000"))
+    # Зрители /ws/orderbook держат по потоку gunicorn (их 16) на соединение; остальные потоки — вебхукам и /ready
+    orderbook_ws_max_subscribers: int = int(os.environ.get("ORDERBOOK_WS_MAX_SUBSCRIBERS", "8"))
+    record_dir: str        = os.environ.get("RECORD_DIR", "")  # запись depth/aggTrade потоков; пусто — выключено
+
+    warmup_timeout: float  = float(os.environ.get("WARMUP_TIMEOUT", "30"))  # ожидание стаканов при прогреве
+    clock_sync_interval: float = float(os.environ.get("CLOCK_SYNC_INTERVAL", "30"))  # замер часов биржи, с
+
     flask_env: str = os.environ.get("FLASK_ENV", "production")
     log_level: str = os.environ.get("LOG_LEVEL", "INFO")
     host: str = os.environ.get("HOST", "0.0.0.0")
     port: int = int(os.environ.get("PORT", "8000"))
 
+    def validate(self) -> None:
+        required = ["BINANCE_API_KEY", "BINANCE_API_SECRET", "WEBHOOK_SECRET"]
+        if self.run_telegram_bot:
+            required.append("TELEGRAM_TOKEN")
+        for account in self.account_credentials:
+            required += [f"BINANCE_API_KEY_{account.upper()}", f"BINANCE_API_SECRET_{account.upper()}"]
+        missing = [name for name in required if not os.environ.get(name)]
+        if missing:
+            raise RuntimeError(f"Missing required environment variables: {', '.join(missing)}")
+
 settings = Settings()
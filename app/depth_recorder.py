@@ -0,0 +1,336 @@
+import os
+import mmap
+import time
+import zlib
+import heapq
+import queue
+import struct
+import logging
+from bisect import bisect_right
+from dataclasses import dataclass
+from threading import Thread
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+# Файл: MAGIC, длина и имя символа, затем чанки. Чанк — заголовок _CHUNK и zlib-сжатые
+# записи. Заголовки чанков с диапазоном времени и есть индекс: читатель проходит их
+# по mmap без распаковки. Запись — _RECORD и (n_bids + n_asks) пар float64 (цена, объём).
+MAGIC = b"BLBDEPTH"
+FILE_SUFFIX = ".depth"
+_NAME = struct.Struct("<H")
+_CHUNK = struct.Struct("<4sqqIIII")  # b"CHNK", first_ts, last_ts, comp_len, raw_len, records, flags
+_RECORD = struct.Struct("<Bqqqii")   # kind, ts, a, b, n_bids, n_asks
+_LEVEL = np.dtype("<f8")
+
+SNAPSHOT, DIFF, TRADE = 1, 2, 3
+KEYFRAME = 1  # чанк начинается со снимка стакана — с него можно начинать проигрывание
+
+CHUNK_RECORDS = 5000
+CHUNK_SECONDS = 60.0
+SNAPSHOT_DEPTH = 1000
+QUEUE_SIZE = 100000
+
+
+@dataclass(slots=True)
+class Record:
+    """Запись потока: для DIFF a/b — U/u события, для TRADE a — id сделки, b — 1 при продаже-агрессоре."""
+    kind: int
+    ts: int
+    a: int
+    b: int
+    bids: np.ndarray
+    asks: np.ndarray
+
+
+@dataclass(slots=True)
+class ChunkInfo:
+    first_ts: int
+    last_ts: int
+    offset: int
+    comp_len: int
+    raw_len: int
+    records: int
+    flags: int
+
+
+def _levels(levels: Iterable) -> np.ndarray:
+    return np.asarray(levels, dtype=_LEVEL).reshape(-1, 2)
+
+
+class DepthFileWriter:
+    """Пишет записи одного символа в файл чанками по chunk_records записей."""
+
+    def __init__(self, path: str, symbol: str, chunk_records: int = CHUNK_RECORDS, level: int = 6):
+        self.path = path
+        self.chunk_records = chunk_records
+        self.level = level
+        self._f = open(path, "ab")
+        if self._f.tell() == 0:
+            name = symbol.encode()
+            self._f.write(MAGIC + _NAME.pack(len(name)) + name)
+        self._buf: list[bytes] = []
+        self._count = 0
+        self._first_ts = self._last_ts = 0
+        self._flags = 0
+
+    def append(self, kind: int, ts: int, a: int, b: int, bids: np.ndarray, asks: np.ndarray) -> None:
+        if kind == SNAPSHOT:
+            # Снимок открывает новый чанк, чтобы чтение с него не зависело от предыдущих
+            self.flush()
+        if not self._count:
+            self._first_ts, self._flags = ts, KEYFRAME if kind == SNAPSHOT else 0
+        self._last_ts = ts
+        self._count += 1
+        self._buf.append(_RECORD.pack(kind, ts, a, b, len(bids), len(asks)))
+        if len(bids):
+            self._buf.append(bids.astype(_LEVEL, copy=False).tobytes())
+        if len(asks):
+            self._buf.append(asks.astype(_LEVEL, copy=False).tobytes())
+        if self._count >= self.chunk_records:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._count:
+            return
+        raw = b"".join(self._buf)
+        comp = zlib.compress(raw, self.level)
+        self._f.write(_CHUNK.pack(
+            b"CHNK", self._first_ts, self._last_ts, len(comp), len(raw), self._count, self._flags
+        ))
+        self._f.write(comp)
+        self._f.flush()
+        self._buf, self._count = [], 0
+
+    def close(self) -> None:
+        self.flush()
+        self._f.close()
+
+
+class DepthFile:
+    """Чтение файла записи через mmap: индекс чанков строится по заголовкам без распаковки."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a depth recording")
+        (n,) = _NAME.unpack_from(self._mm, len(MAGIC))
+        start = len(MAGIC) + _NAME.size
+        self.symbol = self._mm[start:start + n].decode()
+        self.chunks: list[ChunkInfo] = []
+        offset = start + n
+        while offset + _CHUNK.size <= len(self._mm):
+            tag, first_ts, last_ts, comp_len, raw_len, records, flags = _CHUNK.unpack_from(self._mm, offset)
+            offset += _CHUNK.size
+            if tag != b"CHNK" or offset + comp_len > len(self._mm):
+                logger.warning(f"{path}: truncated chunk at offset {offset - _CHUNK.size}, ignoring the rest")
+                break
+            self.chunks.append(ChunkInfo(first_ts, last_ts, offset, comp_len, raw_len, records, flags))
+            offset += comp_len
+        self._starts = [c.first_ts for c in self.chunks]
+
+    @property
+    def start_ts(self) -> int | None:
+        return self.chunks[0].first_ts if self.chunks else None
+
+    @property
+    def end_ts(self) -> int | None:
+        return self.chunks[-1].last_ts if self.chunks else None
+
+    def keyframe_before(self, ts: int) -> int:
+        """Индекс последнего чанка-снимка, начавшегося не позже ts (0, если такого нет)."""
+        i = bisect_right(self._starts, ts) - 1
+        while i > 0 and not self.chunks[i].flags & KEYFRAME:
+            i -= 1
+        return max(i, 0)
+
+    def _chunk_records(self, chunk: ChunkInfo) -> Iterator[Record]:
+        raw = zlib.decompress(self._mm[chunk.offset:chunk.offset + chunk.comp_len])
+        pos = 0
+        for _ in range(chunk.records):
+            kind, ts, a, b, nb, na = _RECORD.unpack_from(raw, pos)
+            pos += _RECORD.size
+            levels = np.frombuffer(raw, _LEVEL, (nb + na) * 2, pos).reshape(-1, 2)
+            pos += (nb + na) * 16
+            yield Record(kind, ts, a, b, levels[:nb], levels[nb:])
+
+    def records(self, start_ts: int | None = None, end_ts: int | None = None) -> Iterator[Record]:
+        """Записи с ближайшего к start_ts снимка и до end_ts включительно."""
+        first = self.keyframe_before(start_ts) if start_ts is not None else 0
+        for chunk in self.chunks[first:]:
+            if end_ts is not None and chunk.first_ts > end_ts:
+                return
+            for record in self._chunk_records(chunk):
+                if end_ts is not None and record.ts > end_ts:
+                    return
+                yield record
+
+    def close(self) -> None:
+        self._mm.close()
+        self._f.close()
+
+
+class DepthRecorder:
+    """Записывает diff-ы стакана и сделки каждого символа в directory.
+
+    Слушает websocket_manager.add_market_listener: событие лишь кладётся в
+    очередь, сжатие и запись идут в отдельном потоке. Каждые chunk_records
+    событий или chunk_seconds символ получает снимок стакана (snapshot),
+    поэтому проигрывание можно начинать с любого такого чанка.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        snapshot: Callable[[str, int], dict],
+        chunk_records: int = CHUNK_RECORDS,
+        chunk_seconds: float = CHUNK_SECONDS
+    ):
+        self.directory = directory
+        self._snapshot = snapshot
+        self.chunk_records = chunk_records
+        self.chunk_seconds = chunk_seconds
+        self._queue: queue.Queue = queue.Queue(QUEUE_SIZE)
+        self._writers: dict[str, DepthFileWriter] = {}
+        self._since_snapshot: dict[str, tuple[int, float]] = {}
+        self.recorded = 0
+        self.dropped = 0
+        self._thread: Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = Thread(target=self._run, name="depth-recorder", daemon=True)
+        self._thread.start()
+        logger.info(f"Recording depth streams to {self.directory}")
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(5)
+        self._thread = None
+
+    def _put(self, item: tuple) -> None:
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def on_market_event(self, kind: str, payload: dict) -> None:
+        symbol = payload.get("symbol") or payload.get("s")
+        if kind == "snapshot":
+            self._since_snapshot[symbol] = (0, time.monotonic())
+            self._put((SNAPSHOT, symbol, payload.get("timestamp") or int(time.time() * 1000), 0,
+                       payload.get("version", 0), payload["bids"], payload["asks"]))
+        elif kind == "depth":
+            self._put((DIFF, symbol, payload.get("E", 0), payload["U"], payload["u"], payload["b"], payload["a"]))
+            count, since = self._since_snapshot.get(symbol, (0, time.monotonic()))
+            count += 1
+            if count >= self.chunk_records or time.monotonic() - since >= self.chunk_seconds:
+                # Вызов идёт после применения diff к книге — снимок согласован с записанным потоком
+                book = self._snapshot(symbol, SNAPSHOT_DEPTH)
+                if book["bids"] or book["asks"]:
+                    book["symbol"] = symbol
+                    self.on_market_event("snapshot", {**book, "timestamp": payload.get("E")})
+                    return
+            self._since_snapshot[symbol] = (count, since)
+        elif kind == "trade":
+            # m: покупатель — мейкер, значит агрессор продавал
+            self._put((TRADE, symbol, payload.get("T") or payload.get("E", 0), payload.get("a", 0),
+                       1 if payload.get("m") else 0, [[payload["p"], payload["q"]]], []))
+
+    def _writer(self, symbol: str) -> DepthFileWriter:
+        writer = self._writers.get(symbol)
+        if writer is None:
+            path = os.path.join(self.directory, f"{symbol}-{int(time.time() * 1000)}{FILE_SUFFIX}")
+            writer = self._writers[symbol] = DepthFileWriter(path, symbol, self.chunk_records)
+        return writer
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self.chunk_seconds)
+            except queue.Empty:
+                for writer in self._writers.values():
+                    writer.flush()
+                continue
+            if item is None:
+                break
+            kind, symbol, ts, a, b, bids, asks = item
+            try:
+                self._writer(symbol).append(kind, int(ts), int(a), int(b), _levels(bids), _levels(asks))
+                self.recorded += 1
+            except Exception as e:
+                logger.error(f"Depth recorder failed for {symbol}: {e}")
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+
+def recording_files(paths: Iterable[str]) -> list[str]:
+    """Файлы записи из списка файлов и каталогов."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(FILE_SUFFIX))
+        else:
+            files.append(path)
+    return files
+
+
+def _file_events(f: DepthFile, start_ts: int | None, end_ts: int | None) -> Iterator[dict]:
+    symbol = f.symbol
+    bids: dict[float, float] = {}
+    asks: dict[float, float] = {}
+    warming = start_ts is not None
+    for r in f.records(start_ts, end_ts):
+        if warming:
+            # До start_ts только восстанавливаем стакан и отдаём его одним снимком
+            if r.kind == SNAPSHOT:
+                bids, asks = dict(r.bids.tolist()), dict(r.asks.tolist())
+            elif r.kind == DIFF:
+                for levels, changes in ((bids, r.bids), (asks, r.asks)):
+                    for p, q in changes.tolist():
+                        if q:
+                            levels[p] = q
+                        else:
+                            levels.pop(p, None)
+            if r.ts < start_ts:
+                continue
+            warming = False
+            if r.kind != SNAPSHOT:
+                yield {"type": "depth", "symbol": symbol, "ts": r.ts,
+                       "bids": sorted(bids.items(), reverse=True), "asks": sorted(asks.items())}
+                if r.kind == DIFF:
+                    continue
+        if r.kind == SNAPSHOT:
+            yield {"type": "depth", "symbol": symbol, "ts": r.ts, "bids": r.bids.tolist(), "asks": r.asks.tolist()}
+        elif r.kind == DIFF:
+            yield {"type": "diff", "symbol": symbol, "ts": r.ts, "b": r.bids.tolist(), "a": r.asks.tolist()}
+        elif r.kind == TRADE:
+            price, qty = r.bids[0].tolist()
+            yield {"type": "trade", "symbol": symbol, "ts": r.ts, "side": "SELL" if r.b else "BUY",
+                   "price": price, "qty": qty}
+
+
+def replay_feed(paths: Iterable[str], start_ts: int | None = None, end_ts: int | None = None) -> Iterator[dict]:
+    """События записи для SimExchange.load_feed, слитые по времени между символами.
+
+    С start_ts стакан каждого символа восстанавливается с ближайшего снимка и
+    выдаётся одним событием depth, дальше идут diff и trade с меткой ts (мс).
+    """
+    files = [DepthFile(p) for p in recording_files(paths)]
+    try:
+        yield from heapq.merge(*(_file_events(f, start_ts, end_ts) for f in files), key=lambda e: e["ts"])
+    finally:
+        for f in files:
+            f.close()
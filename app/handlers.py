@@ -1,43 +1,138 @@
-from pydantic import BaseModel, validator
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from pydantic_core import from_json
 from binance.exceptions import BinanceAPIException
+from app.accounts import Account
 from app.binance_client import (
+    accounts,
+    order_scheduler,
+    risk_engine,
+    symbol_metadata,
     get_position_amount,
     place_post_only_with_retries
 )
-from threading import Lock
-from collections import defaultdict
+from app.order_scheduler import make_algo
+from app.signal_queue import SignalQueue, SignalRecord
+from app.symbol_locks import symbol_locks
+from app.websocket_manager import track_symbol
+from app import metrics
+from app.config import settings
+from threading import Event
 
-symbol_locks: dict[str, Lock] = defaultdict(Lock)
+# Ставится командой /pause бота: новые вебхуки не принимаются
+webhook_paused = Event()
 
 class Signal(BaseModel):
     symbol: str
     side: str
     quantity: float
     action: str = 'open'
+    # Аккаунт, группа, "all" или их список; по умолчанию — основной аккаунт
+    account: str | list[str] | None = None
+    # Нарезка open на дочерние post-only ордера: twap (duration, slices),
+    # iceberg (visible_qty) или pov (participation); без algo — один ордер
+    algo: str | None = None
+    duration: float | None = None
+    slices: int | None = None
+    visible_qty: float | None = None
+    participation: float | None = None
+    # Секрет приходит в теле вебхука; в дампы и repr не попадает
+    secret: str | None = Field(default=None, exclude=True, repr=False)
 
-    @validator('side')
-    def validate_side(cls, v):
+    # Валидаторы v2 собираются в схему pydantic-core один раз при создании класса
+    @field_validator('symbol')
+    @classmethod
+    def validate_symbol(cls, v: str) -> str:
+        return v.upper()
+
+    @field_validator('side')
+    @classmethod
+    def validate_side(cls, v: str) -> str:
         v2 = v.upper()
         if v2 not in ('BUY', 'SELL'):
             raise ValueError("Поле 'side' должно быть 'BUY' или 'SELL'")
         return v2
 
-    @validator('action')
-    def validate_action(cls, v):
+    @field_validator('algo')
+    @classmethod
+    def validate_algo(cls, v: str | None) -> str | None:
+        return v.lower() if v else None
+
+    @field_validator('action')
+    @classmethod
+    def validate_action(cls, v: str) -> str:
         v2 = v.lower()
         if v2 not in ('open', 'close'):
             raise ValueError("Поле 'action' должно быть 'open' или 'close'")
         return v2
 
 
-def handle_signal(data: dict) -> dict:
-    sig = Signal(**data)
-    lock = symbol_locks[sig.symbol]
-    if not lock.acquire(blocking=False):
-        return {'status': 'error', 'detail': 'Operation already in progress for symbol'}
+_WEBHOOK_SECRET = settings.webhook_secret.encode()
+
+
+def secret_ok(value) -> bool:
+    # Сравнение за постоянное время: по времени ответа секрет не подобрать
+    # Пустой WEBHOOK_SECRET не открывает вебхук для пустого секрета
+    return bool(_WEBHOOK_SECRET) and isinstance(value, str) and hmac.compare_digest(value.encode(), _WEBHOOK_SECRET)
+
+
+def _check_symbol(sig: Signal) -> Signal:
+    # Белый список по кэшу метаданных, без сетевых запросов; пока кэш пуст — пропускаем
+    if symbol_metadata.loaded_at:
+        info = symbol_metadata.peek(sig.symbol)
+        if info is None or info.status != 'TRADING':
+            raise ValueError(f"Symbol {sig.symbol} is not traded")
+    return sig
+
+
+def decode_webhook(body: bytes) -> Signal | None:
+    """Сигнал из тела вебхука; None — секрет в теле неверный или тело не JSON-объект.
+
+    pydantic-core разбирает байты тела сразу в модель, за один проход без
+    промежуточного словаря. ValueError (невалидный сигнал) получают только
+    знающие секрет — остальным отвечаем как на неверный секрет.
+    """
+    with metrics.span("validate"):
+        try:
+            sig = Signal.model_validate_json(body)
+        except ValidationError:
+            try:
+                data = from_json(body)
+            except ValueError:
+                return None
+            if not isinstance(data, dict) or not secret_ok(data.get("secret")):
+                return None
+            raise
+        if not secret_ok(sig.secret):
+            return None
+        return _check_symbol(sig)
+
+
+def parse_signal(data: dict) -> Signal:
+    with metrics.span("validate"):
+        return _check_symbol(Signal.model_validate(data))
+
+
+ALGO_FIELDS = ('algo', 'duration', 'slices', 'visible_qty', 'participation')
+
+
+def _algo(sig: Signal):
+    if sig.algo == 'twap':
+        return make_algo('twap', duration=sig.duration, slices=sig.slices)
+    if sig.algo == 'iceberg':
+        return make_algo('iceberg', visible_qty=sig.visible_qty, duration=sig.duration)
+    return make_algo(sig.algo or '', participation=sig.participation, duration=sig.duration)
+
+
+def execute_signal(sig: Signal, account: Account | None = None) -> dict:
+    account = account or accounts.default
+    track_symbol(sig.symbol)
     try:
         if sig.action == 'close':
-            current_amt = get_position_amount(sig.symbol)
+            # Закрытие отменяет незавершённые родительские ордера по символу
+            order_scheduler.cancel_symbol(account.id, sig.symbol)
+            current_amt = get_position_amount(sig.symbol, account)
             if current_amt == 0:
                 return {'status': 'error', 'detail': 'Нет позиции для закрытия'}
             close_side = 'SELL' if current_amt > 0 else 'BUY'
@@ -45,14 +140,24 @@ def handle_signal(data: dict) -> dict:
             order = place_post_only_with_retries(
                 symbol=sig.symbol,
                 side=close_side,
-                quantity=qty
+                quantity=qty,
+                account=account
             )
             return {'status': 'ok', 'detail': f"closed_order_id={order['orderId']}"}
 
+        risk_engine.check_order(
+            account.id, account.state.position(sig.symbol), sig.side, sig.quantity, count_rate=not sig.algo
+        )
+
+        if sig.algo:
+            parent = order_scheduler.submit(sig.symbol, sig.side, sig.quantity, _algo(sig), account.id)
+            return {'status': 'ok', 'detail': f"parent_id={parent.parent_id}"}
+
         order = place_post_only_with_retries(
             symbol=sig.symbol,
             side=sig.side,
-            quantity=sig.quantity
+            quantity=sig.quantity,
+            account=account
         )
         return {'status': 'ok', 'detail': f"order_id={order['orderId']}"}
 
@@ -62,5 +167,69 @@ def handle_signal(data: dict) -> dict:
         return {'status': 'error', 'detail': str(e)}
     except ValueError as e:
         return {'status': 'error', 'detail': str(e)}
+
+
+def _execute_locked(sig: Signal, account: Account) -> dict:
+    lock = symbol_locks[account.lock_key(sig.symbol)]
+    if not lock.acquire(blocking=False):
+        return {'status': 'error', 'detail': 'Operation already in progress for symbol'}
+    try:
+        with metrics.span("execute"):
+            return execute_signal(sig, account)
     finally:
-        lock.release()
\ No newline at end of file
+        lock.release()
+
+
+def handle_signal(data: dict) -> dict:
+    """Синхронно исполняет сигнал; для нескольких аккаунтов — параллельно, ответ по каждому."""
+    sig = parse_signal(data)
+    targets = accounts.resolve(sig.account)
+    if len(targets) == 1:
+        return _execute_locked(sig, targets[0])
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        results = list(pool.map(lambda a: _execute_locked(sig, a), targets))
+    ok = all(r['status'] == 'ok' for r in results)
+    return {
+        'status': 'ok' if ok else 'error',
+        'accounts': {a.id: r for a, r in zip(targets, results)}
+    }
+
+
+def _run_queued(record: SignalRecord) -> dict:
+    # Поля уже проверены при приёме вебхука — собираем модель без повторной валидации
+    sig = Signal.model_construct(
+        symbol=record.symbol, side=record.side, quantity=record.quantity, action=record.action, **record.params
+    )
+    account = accounts.get(record.account)
+    metrics.signal_stage_seconds.observe(record.started_at - record.received_at, ("queue_wait",))
+    # Воркер ждёт, пока закончится операция по символу в этом аккаунте, начатая не из очереди (например, из бота)
+    lock = symbol_locks[account.lock_key(sig.symbol)]
+    with metrics.span("lock"):
+        lock.acquire()
+    try:
+        with metrics.span("execute"):
+            return execute_signal(sig, account)
+    finally:
+        lock.release()
+
+
+signal_queue = SignalQueue(_run_queued)
+
+
+def enqueue_signal(data: dict | Signal) -> list[SignalRecord]:
+    """Ставит сигнал в очередь каждого целевого аккаунта; аккаунты исполняют его параллельно."""
+    sig = data if isinstance(data, Signal) else parse_signal(data)
+    # Стакан нового символа начинает синхронизироваться, пока сигнал ждёт в очереди
+    track_symbol(sig.symbol)
+    if sig.algo and sig.action == 'open':
+        _algo(sig)  # неверные параметры нарезки — 400 сразу, а не ошибка в очереди
+    params = sig.model_dump(include=set(ALGO_FIELDS), exclude_none=True)
+    targets = accounts.resolve(sig.account)
+    # Повтор алерта TradingView (ретрай доставки, двойное срабатывание) не доходит до очереди
+    risk_engine.check_duplicates(
+        [a.id for a in targets], sig.symbol, sig.side, sig.quantity, sig.action, sig.algo
+    )
+    return [
+        signal_queue.submit(sig.symbol, sig.side, sig.quantity, sig.action, account.id, params)
+        for account in targets
+    ]
@@ -3,11 +3,20 @@ import os
 import json
 import time
 
-from flask import Flask, request, abort, jsonify, send_from_directory
+from flask import Flask, Response, request, abort, jsonify, send_from_directory
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
 
 from app.config import settings
-from app.handlers import handle_signal
-from app.binance_client import _client
+from app.handlers import decode_webhook, enqueue_signal, secret_ok, signal_queue, webhook_paused
+from app.binance_client import _client, accounts, book_analytics, order_scheduler, risk_engine
+from app import runtime
+from app import websocket_manager
+from app.rate_limiter import rate_governor
+from app.clock_sync import clock_sync
+from app.orderbook_stream import OrderBookBroadcaster, SubscriberLimitReached
+from app.book_analytics import DEFAULT_BPS
+from app import metrics
 
 logging.basicConfig(
     level=settings.log_level,
@@ -17,34 +26,214 @@ logger = logging.getLogger(__name__)
 logger.setLevel(getattr(logging, settings.log_level.upper(), logging.INFO))
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'), static_url_path='/static')
+sock = Sock(app)
+
+orderbook_broadcaster = OrderBookBroadcaster(
+    websocket_manager.get_order_book_snapshot,
+    websocket_manager.get_book_version,
+    stats=book_analytics.summary,
+    max_subscribers=settings.orderbook_ws_max_subscribers
+)
+websocket_manager.add_book_listener(orderbook_broadcaster.on_book_update)
+
+metrics.register(metrics.Gauge(
+    "signal_queue_depth", "Signals waiting in per-symbol queues", lambda: sum(signal_queue.depth().values())
+))
+metrics.register(metrics.Gauge(
+    "rate_limit_queue_depth", "Requests waiting for the rate limit governors of all accounts",
+    lambda: sum(a.governor.metrics()["queue_depth"] for a in accounts.all())
+))
+metrics.register(metrics.Gauge(
+    "orderbook_ws_subscribers", "Dashboard WebSocket subscribers", orderbook_broadcaster.subscriber_count
+))
+
+@app.route("/health", methods=["GET"])
+def health():
+    return jsonify({'status': 'ok'}), 200
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    # Балансировщик/деплой пускает трафик только на прогретые экземпляры
+    status = runtime.warmup.status()
+    return jsonify(status), 200 if status["ready"] else 503
 
 @app.route("/static/<path:filename>")
 def static_files(filename):
     return send_from_directory(app.static_folder, filename)
 
+def _require_secret():
+    # Управление и состояние исполнения — только с секретом вебхука, как и сам вебхук
+    if not secret_ok(request.args.get("secret", "")):
+        abort(401, "Invalid secret (query)")
+
 @app.route("/webhook", methods=["POST"])
 def webhook():
-    secret_qs = request.args.get("secret", "")
-    if secret_qs != settings.webhook_secret:
+    with metrics.span("webhook"):
+        return _webhook()
+
+def _webhook():
+    if not secret_ok(request.args.get("secret", "")):
         abort(401, "Invalid webhook secret (query)")
-    data = request.get_json(force=True)
-    if data.get("secret") != settings.webhook_secret:
-        abort(401, "Invalid webhook secret (body)")
-    data.pop("secret", None)
-    result = handle_signal(data)
-    status_code = 200 if result.get("status") == "ok" else 400
+    try:
+        sig = decode_webhook(request.get_data(cache=False))
+        if sig is None:
+            abort(401, "Invalid webhook secret (body)")
+        if webhook_paused.is_set():
+            result = {'status': 'error', 'detail': 'Webhooks processing paused'}
+            logger.info(f"Response: {result}")
+            return jsonify(result), 503
+        records = enqueue_signal(sig)
+    except ValueError as e:
+        result = {'status': 'error', 'detail': str(e)}
+        logger.info(f"Response: {result}")
+        return jsonify(result), 400
+    if len(records) == 1:
+        result = {'status': 'accepted', 'signal_id': records[0].signal_id, 'state': records[0].status}
+    else:
+        result = {
+            'status': 'accepted',
+            'signals': [{'account': r.account, 'signal_id': r.signal_id, 'state': r.status} for r in records]
+        }
     logger.info(f"Response: {result}")
-    return jsonify(result), status_code
+    return jsonify(result), 202
+
+@app.route("/signals/<signal_id>", methods=["GET"])
+def signal_status(signal_id):
+    _require_secret()
+    record = signal_queue.get(signal_id)
+    if record is None:
+        return jsonify({'status': 'error', 'detail': 'Unknown signal id'}), 404
+    return jsonify(record.as_dict()), 200
+
+@app.route("/api/parents", methods=["GET"])
+def api_parents():
+    _require_secret()
+    active_only = request.args.get("active", "").lower() in ("1", "true", "yes")
+    return jsonify([p.as_dict() for p in order_scheduler.parents(active_only)]), 200
+
+@app.route("/api/parents/<parent_id>", methods=["GET", "DELETE"])
+def api_parent(parent_id):
+    _require_secret()
+    parent = order_scheduler.get(parent_id)
+    if parent is None:
+        return jsonify({'status': 'error', 'detail': 'Unknown parent id'}), 404
+    if request.method == "DELETE":
+        order_scheduler.cancel(parent_id)
+    return jsonify(parent.as_dict()), 200
 
 @app.route("/api/orderbook", methods=["GET"])
 def api_orderbook():
+    symbol = request.args.get("symbol", settings.default_symbol).upper()
+    book = websocket_manager.get_order_book_snapshot(symbol, 20)
+    if book["bids"] or book["asks"]:
+        return jsonify({"bids": book["bids"], "asks": book["asks"]}), 200
     try:
-        resp = _client.futures_order_book(symbol="ETHUSDT", limit=20)
+        resp = _client.futures_order_book(symbol=symbol, limit=20)
         data = {"bids": resp.get("bids", []), "asks": resp.get("asks", [])}
         return jsonify(data), 200
     except Exception as e:
         logger.error(f"Failed to fetch order book via REST: {e}")
         return jsonify({"bids": [], "asks": []}), 500
 
+@app.route("/api/orderbook/analytics", methods=["GET"])
+def api_orderbook_analytics():
+    """Глубина в bps, дисбаланс, microprice и VWAP/проскальзывание для объёмов qty=1,5."""
+    symbol = request.args.get("symbol", settings.default_symbol).upper()
+    try:
+        bps = tuple(float(b) for b in request.args.get("bps", "").split(",") if b) or DEFAULT_BPS
+        quantities = [float(q) for q in request.args.get("qty", "").split(",") if q]
+        levels = int(request.args.get("levels", "5"))
+    except ValueError:
+        return jsonify({'status': 'error', 'detail': 'bps, qty and levels must be numbers'}), 400
+    summary = book_analytics.summary(symbol, bps, levels)
+    if summary is None:
+        return jsonify({'status': 'error', 'detail': f'No local book for {symbol}'}), 404
+    result = dict(summary)
+    if quantities:
+        result["vwap"] = {
+            side: [book_analytics.vwap(symbol, side, q) for q in quantities] for side in ("BUY", "SELL")
+        }
+    return jsonify(result), 200
+
+def _ws_command(sub, raw: str) -> str | None:
+    try:
+        cmd = json.loads(raw)
+        symbols = {s.upper() for s in cmd.get("symbols", [])}
+    except (ValueError, AttributeError, TypeError):
+        return "Invalid command"
+    unknown = symbols - websocket_manager.tracked_symbols()
+    if cmd.get("op") == "subscribe":
+        if unknown:
+            return f"Symbols not streamed: {', '.join(sorted(unknown))}"
+        orderbook_broadcaster.update_symbols(sub, add=symbols)
+    elif cmd.get("op") == "unsubscribe":
+        orderbook_broadcaster.update_symbols(sub, remove=symbols)
+    else:
+        return f"Unknown op {cmd.get('op')}"
+    return None
+
+@app.before_request
+def _limit_orderbook_viewers():
+    # Отказ до рукопожатия: лишний зритель не занимает поток даже на время закрытия сокета
+    if request.path == "/ws/orderbook" and orderbook_broadcaster.is_full():
+        return jsonify({'status': 'error', 'detail': 'Too many order book subscribers'}), 503
+
+@sock.route("/ws/orderbook")
+def ws_orderbook(ws):
+    requested = request.args.get("symbols", settings.default_symbol)
+    symbols = {s.upper() for s in requested.split(",") if s} & websocket_manager.tracked_symbols()
+    try:
+        sub = orderbook_broadcaster.subscribe(symbols)
+    except SubscriberLimitReached as e:
+        ws.close(reason=1013, message=str(e))  # Try Again Later
+        return
+    last_sent = 0.0
+    try:
+        while True:
+            raw = ws.receive(timeout=0)
+            if raw:
+                error = _ws_command(sub, raw)
+                if error:
+                    ws.send(json.dumps({"type": "error", "detail": error}))
+            orderbook_broadcaster.throttle(last_sent)
+            messages = orderbook_broadcaster.next_messages(sub, timeout=1.0)
+            for msg in messages:
+                ws.send(json.dumps(msg, separators=(",", ":")))
+            if messages:
+                last_sent = time.monotonic()
+    except ConnectionClosed:
+        pass
+    finally:
+        orderbook_broadcaster.unsubscribe(sub)
+
+@app.route("/api/market/streams", methods=["GET"])
+def api_market_streams():
+    return jsonify(websocket_manager.market_hub.status()), 200
+
+@app.route("/api/risk", methods=["GET"])
+def api_risk():
+    _require_secret()
+    return jsonify(risk_engine.status()), 200
+
+@app.route("/api/clock", methods=["GET"])
+def api_clock():
+    _require_secret()
+    return jsonify(clock_sync.status()), 200
+
+@app.route("/api/rate_limits", methods=["GET"])
+def api_rate_limits():
+    account_id = request.args.get("account")
+    if account_id is None:
+        return jsonify(rate_governor.metrics()), 200
+    try:
+        return jsonify(accounts.get(account_id).governor.metrics()), 200
+    except ValueError as e:
+        return jsonify({'status': 'error', 'detail': str(e)}), 404
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
+    runtime.start_process()
     app.run(host=settings.host, port=settings.port)
@@ -0,0 +1,430 @@
+import time
+import random
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from threading import Condition, Lock, Thread
+from typing import Callable, Iterable
+
+from app.config import settings
+from app import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+# Канал -> шаблон имени потока Binance Futures
+CHANNELS = {
+    "depth": "{s}@depth@100ms",
+    "bookTicker": "{s}@bookTicker",
+    "markPrice": "{s}@markPrice@1s",
+    "aggTrade": "{s}@aggTrade",
+}
+# Поле "e" события -> канал
+EVENT_KINDS = {
+    "depthUpdate": "depth",
+    "bookTicker": "bookTicker",
+    "markPriceUpdate": "markPrice",
+    "aggTrade": "aggTrade",
+}
+# Каналы, где важно только последнее значение: при отставании подписчика старое заменяется новым
+CONFLATED = frozenset({"bookTicker", "markPrice"})
+
+MAX_STREAMS_PER_SOCKET = 200
+STALL_TIMEOUT = 10.0  # markPrice@1s даёт каждому сокету минимум одно сообщение в секунду на символ
+HEARTBEAT_INTERVAL = 1.0
+RECONNECT_BASE = 1.0
+RECONNECT_MAX = 60.0
+SUBSCRIBER_QUEUE = 1000
+
+market_reconnects_total = metrics.register(metrics.Counter(
+    "market_stream_reconnects_total", "Combined market stream reconnects by reason", ("reason",)
+))
+market_dropped_total = metrics.register(metrics.Counter(
+    "market_subscriber_dropped_total", "Market events dropped or conflated for slow subscribers",
+    ("subscriber", "kind")
+))
+
+
+class Subscription:
+    """Подписчик хаба со своим потоком и ограниченной очередью.
+
+    bookTicker и markPrice схлопываются до последнего значения по символу,
+    остальные события копятся в очереди до maxsize, после чего вытесняются
+    самые старые. Порядок сохраняется внутри канала, но не между каналами.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[str, dict], None],
+        kinds: Iterable[str] | None = None,
+        symbols: Iterable[str] | None = None,
+        maxsize: int = SUBSCRIBER_QUEUE,
+        name: str = "subscriber"
+    ):
+        self.callback = callback
+        self.kinds = frozenset(kinds) if kinds else None
+        self.symbols = frozenset(symbols) if symbols else None
+        self.maxsize = maxsize
+        self.name = name
+        self.dropped = 0
+        self.conflated = 0
+        self._queue: deque[tuple[str, dict]] = deque()
+        self._latest: OrderedDict[tuple[str, str], dict] = OrderedDict()
+        self._cond = Condition()
+        self._closed = False
+        self._thread = Thread(target=self._run, name=f"market-{name}", daemon=True)
+        self._thread.start()
+
+    def wants(self, kind: str, symbol: str) -> bool:
+        return (self.kinds is None or kind in self.kinds) and (self.symbols is None or symbol in self.symbols)
+
+    def offer(self, kind: str, symbol: str, payload: dict) -> None:
+        """Не блокирует поток сокета: при переполнении теряются самые старые события."""
+        with self._cond:
+            if kind in CONFLATED:
+                key = (kind, symbol)
+                if key in self._latest:
+                    self.conflated += 1
+                    market_dropped_total.inc((self.name, kind))
+                self._latest[key] = payload
+            else:
+                if len(self._queue) >= self.maxsize:
+                    self._queue.popleft()
+                    self.dropped += 1
+                    market_dropped_total.inc((self.name, kind))
+                self._queue.append((kind, payload))
+            self._cond.notify()
+
+    @property
+    def backlog(self) -> int:
+        return len(self._queue) + len(self._latest)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._latest or self._closed)
+                if self._closed:
+                    return
+                if self._queue:
+                    kind, payload = self._queue.popleft()
+                else:
+                    (kind, _), payload = self._latest.popitem(last=False)
+            try:
+                self.callback(kind, payload)
+            except Exception as e:
+                logger.error(f"Market subscriber {self.name} failed for {kind}: {e}")
+
+
+@dataclass
+class _Shard:
+    """Один combined-сокет и его потоки."""
+    index: int
+    pinned: bool = True  # False — сокет одного символа, добавленного на лету
+    streams: list[str] = field(default_factory=list)
+    socket: str | None = None
+    last_message: float = 0.0
+    started_at: float = 0.0
+    failures: int = 0
+    retry_at: float | None = None  # сокет остановлен и ждёт переподключения
+
+    def as_dict(self, now: float) -> dict:
+        return {
+            "index": self.index,
+            "streams": len(self.streams),
+            "pinned": self.pinned,
+            "connected": self.socket is not None,
+            "silent_for": round(now - max(self.last_message, self.started_at), 3) if self.socket else None,
+            "failures": self.failures,
+        }
+
+
+class MarketDataHub:
+    """Рыночные потоки всех символов через минимум combined-сокетов.
+
+    Потоки каналов (depth, bookTicker, markPrice, aggTrade) раскладываются по
+    сокетам не больше чем по max_streams. on_message вызывается прямо в потоке
+    сокета и не теряет событий — на нём держатся локальные стаканы; остальные
+    потребители подписываются через subscribe() и получают события из своих
+    ограниченных очередей. Фоновый поток следит за тишиной сокетов и
+    переподключает их с экспоненциальной задержкой и случайным разбросом.
+    Символы, добавленные на лету (не pinned), получают каждый свой сокет —
+    их подписка и снятие не пересоздают сокеты с чужими стаканами — и
+    снимаются после idle_ttl без обращений.
+    """
+
+    def __init__(
+        self,
+        start_socket: Callable[[list[str], Callable[[dict], None]], str],
+        stop_socket: Callable[[str], None],
+        on_message: Callable[[dict], None] | None = None,
+        channels: Iterable[str] = tuple(CHANNELS),
+        max_streams: int = MAX_STREAMS_PER_SOCKET,
+        stall_timeout: float = STALL_TIMEOUT,
+        idle_ttl: float | None = None,
+        on_remove: Callable[[list[str]], None] | None = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        unknown = set(channels) - set(CHANNELS)
+        if unknown:
+            raise ValueError(f"Unknown market channels: {', '.join(sorted(unknown))}")
+        self._start_socket = start_socket
+        self._stop_socket = stop_socket
+        self._on_message = on_message
+        self.channels = tuple(channels)
+        self.max_streams = max_streams
+        self.stall_timeout = stall_timeout
+        self.idle_ttl = idle_ttl
+        self._on_remove = on_remove
+        self._clock = clock
+        self._lock = Lock()  # состояние символов и сокетов; старт сокета блокирует и идёт вне него
+        self._connect_lock = Lock()  # старты сокетов по очереди
+        self._shards: list[_Shard] = []
+        self._symbols: dict[str, bool] = {}  # symbol -> pinned
+        self._touched: dict[str, float] = {}
+        self._last_seen: dict[str, float] = {}
+        self._latest: dict[tuple[str, str], tuple[float, dict]] = {}
+        self._subscribers: list[Subscription] = []
+        self._monitor: Thread | None = None
+
+    # --- символы и сокеты ---
+
+    def streams_for(self, symbol: str) -> list[str]:
+        return [CHANNELS[c].format(s=symbol.lower()) for c in self.channels]
+
+    def symbols(self) -> set[str]:
+        return set(self._symbols)
+
+    def add_symbols(self, symbols: Iterable[str], pinned: bool = True) -> list[str]:
+        """Подписывает новые символы; затронутые сокеты пересоздаются один раз на вызов.
+
+        pinned-символы упаковываются в общие сокеты, остальные открывают свой.
+        """
+        with self._lock:
+            added = []
+            for symbol in symbols:
+                symbol = symbol.upper()
+                self._touched[symbol] = self._clock()
+                if symbol in self._symbols:
+                    self._symbols[symbol] = self._symbols[symbol] or pinned
+                    continue
+                self._symbols[symbol] = pinned
+                added.append(symbol)
+            changed = {}
+            for symbol in added:
+                if not pinned:
+                    shard = self._free_shard(lambda s: not s.pinned and not s.streams, pinned=False)
+                    shard.streams = self.streams_for(symbol)
+                    changed[shard.index] = shard
+                    continue
+                for stream in self.streams_for(symbol):
+                    shard = self._free_shard(lambda s: s.pinned and len(s.streams) < self.max_streams)
+                    shard.streams.append(stream)
+                    changed[shard.index] = shard
+        self._connect_all(changed.values())
+        if added:
+            logger.info(f"Market streams added for {', '.join(added)} ({len(self._shards)} sockets)")
+        return added
+
+    def _free_shard(self, fits: Callable[[_Shard], bool], pinned: bool = True) -> _Shard:
+        shard = next((s for s in self._shards if fits(s)), None)
+        if shard is None:
+            shard = _Shard(len(self._shards), pinned)
+            self._shards.append(shard)
+        return shard
+
+    def touch(self, symbol: str) -> bool:
+        """Продлевает жизнь символа, добавленного на лету; False — символ не подписан."""
+        if symbol not in self._symbols:
+            return False
+        self._touched[symbol] = self._clock()
+        return True
+
+    def remove_symbols(self, symbols: Iterable[str]) -> list[str]:
+        reconnect = []
+        with self._lock:
+            removed = [s for s in (s.upper() for s in symbols) if s in self._symbols]
+            if not removed:
+                return []
+            gone = {stream for s in removed for stream in self.streams_for(s)}
+            for symbol in removed:
+                del self._symbols[symbol]
+                self._touched.pop(symbol, None)
+                self._last_seen.pop(symbol, None)
+                for kind in CONFLATED:
+                    self._latest.pop((kind, symbol), None)
+            for shard in self._shards:
+                kept = [s for s in shard.streams if s not in gone]
+                if len(kept) == len(shard.streams):
+                    continue
+                shard.streams = kept
+                if kept:
+                    reconnect.append(shard)
+                else:
+                    self._disconnect(shard)
+        self._connect_all(reconnect)
+        logger.info(f"Market streams removed for {', '.join(removed)}")
+        if self._on_remove:
+            self._on_remove(removed)
+        return removed
+
+    def _connect_all(self, shards: Iterable[_Shard]) -> None:
+        # Вне _lock: старт сокета ждёт менеджер, а хаб в это время нужен вебхукам и потокам сокетов
+        with self._connect_lock:
+            for shard in shards:
+                self._connect(shard)
+
+    def _connect(self, shard: _Shard) -> None:
+        with self._lock:
+            self._disconnect(shard)
+            shard.retry_at = None
+            streams = list(shard.streams)
+        if not streams:
+            return
+        try:
+            socket = self._start_socket(streams, lambda msg: self.dispatch(msg, shard))
+        except Exception as e:
+            logger.error(f"Market socket #{shard.index} failed to start: {e}")
+            with self._lock:
+                self._schedule_retry(shard, "start_failed")
+            return
+        with self._lock:
+            shard.socket = socket
+            shard.started_at = self._clock()
+            if not shard.streams:
+                # Символы сокета сняли, пока он стартовал
+                self._disconnect(shard)
+
+    def _disconnect(self, shard: _Shard) -> None:
+        if shard.socket is None:
+            return
+        socket, shard.socket = shard.socket, None
+        try:
+            self._stop_socket(socket)
+        except Exception as e:
+            logger.warning(f"Market socket #{shard.index} failed to stop: {e}")
+
+    def _schedule_retry(self, shard: _Shard, reason: str) -> None:
+        self._disconnect(shard)
+        delay = min(RECONNECT_MAX, RECONNECT_BASE * 2 ** shard.failures) * random.uniform(0.5, 1.5)
+        shard.failures += 1
+        shard.retry_at = self._clock() + delay
+        market_reconnects_total.inc((reason,))
+        logger.warning(f"Market socket #{shard.index} {reason}, reconnecting in {delay:.1f}s")
+
+    # --- события ---
+
+    def dispatch(self, msg: dict, shard: _Shard | None = None) -> None:
+        """Входная точка сообщений сокета (и симулятора, который шлёт их без сокета)."""
+        payload = msg.get("data", msg)
+        if shard is not None:
+            shard.last_message = self._clock()
+            if payload.get("e") == "error":
+                logger.error(f"Market socket #{shard.index} error: {payload.get('m')}")
+                with self._lock:
+                    if shard.socket is not None:
+                        self._schedule_retry(shard, "error")
+                return
+            shard.failures = 0
+        if self._on_message is not None:
+            self._on_message(payload)
+        kind = EVENT_KINDS.get(payload.get("e"))
+        symbol = payload.get("s")
+        if kind is None or not symbol:
+            return
+        now = time.time()
+        self._last_seen[symbol] = now
+        if kind in CONFLATED:
+            self._latest[(kind, symbol)] = (now, payload)
+        for sub in self._subscribers:
+            if sub.wants(kind, symbol):
+                sub.offer(kind, symbol, payload)
+
+    def latest(self, kind: str, symbol: str, max_age: float | None = None) -> dict | None:
+        """Последний bookTicker / markPrice символа, если он не старше max_age."""
+        item = self._latest.get((kind, symbol))
+        if item is None or (max_age is not None and time.time() - item[0] > max_age):
+            return None
+        return item[1]
+
+    def subscribe(
+        self,
+        callback: Callable[[str, dict], None],
+        kinds: Iterable[str] | None = None,
+        symbols: Iterable[str] | None = None,
+        maxsize: int = SUBSCRIBER_QUEUE,
+        name: str = "subscriber"
+    ) -> Subscription:
+        sub = Subscription(callback, kinds, symbols, maxsize, name)
+        self._subscribers = self._subscribers + [sub]
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._subscribers = [s for s in self._subscribers if s is not sub]
+        sub.close()
+
+    # --- устаревание ---
+
+    def symbol_age(self, symbol: str) -> float | None:
+        """Секунды с последнего события символа; None — событий ещё не было."""
+        seen = self._last_seen.get(symbol)
+        return time.time() - seen if seen is not None else None
+
+    def stale_symbols(self, max_age: float | None = None) -> list[str]:
+        max_age = self.stall_timeout if max_age is None else max_age
+        stale = []
+        for symbol in self._symbols:
+            age = self.symbol_age(symbol)
+            if age is None or age > max_age:
+                stale.append(symbol)
+        return sorted(stale)
+
+    def start(self) -> None:
+        if self._monitor is None:
+            self._monitor = Thread(target=self._monitor_loop, name="market-hub", daemon=True)
+            self._monitor.start()
+
+    def check(self) -> None:
+        """Один проход монитора: тихие сокеты, созревшие переподключения, простаивающие символы."""
+        now = self._clock()
+        due = []
+        with self._lock:
+            for shard in self._shards:
+                if shard.retry_at is not None:
+                    if now >= shard.retry_at and shard.streams:
+                        logger.info(f"Market socket #{shard.index} reconnecting ({len(shard.streams)} streams)")
+                        due.append(shard)
+                elif shard.socket is not None and now - max(shard.last_message, shard.started_at) > self.stall_timeout:
+                    self._schedule_retry(shard, "stalled")
+            idle = [s for s, pinned in self._symbols.items()
+                    if not pinned and self.idle_ttl and now - self._touched.get(s, now) > self.idle_ttl]
+        self._connect_all(due)
+        if idle:
+            self.remove_symbols(idle)
+
+    def _monitor_loop(self) -> None:
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Market hub monitor failed: {e}")
+
+    def status(self) -> dict:
+        now = self._clock()
+        return {
+            "channels": list(self.channels),
+            "sockets": [s.as_dict(now) for s in self._shards],
+            "symbols": {
+                s: {"pinned": pinned, "age": self.symbol_age(s)} for s, pinned in sorted(self._symbols.items())
+            },
+            "stale": self.stale_symbols(),
+            "subscribers": [
+                {"name": s.name, "backlog": s.backlog, "dropped": s.dropped, "conflated": s.conflated}
+                for s in self._subscribers
+            ],
+        }
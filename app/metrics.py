@@ -0,0 +1,248 @@
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from threading import Lock, Thread
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+# Включается/выключается целиком; в выключенном состоянии span() возвращает общий no-op
+enabled: bool = settings.metrics_enabled
+
+
+def _fmt_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = Lock()
+
+    def inc(self, labels: tuple = (), amount: float = 1.0) -> None:
+        if not enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {v}")
+        return lines
+
+
+class Gauge:
+    """Значение задаётся set() или вычисляется callback-ом при каждом рендере."""
+
+    def __init__(self, name: str, help: str, callback: Callable[[], float] | None = None):
+        self.name = name
+        self.help = help
+        self._callback = callback
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def value(self) -> float:
+        return float(self._callback()) if self._callback else self._value
+
+    def render(self) -> list[str]:
+        try:
+            value = self.value()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} failed: {e}")
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [counts по бакетам (+Inf последний), sum]
+        self._series: dict[tuple, list] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        if not enabled:
+            return
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][idx] += 1
+            series[1] += value
+
+    def count(self, labels: tuple = ()) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def totals(self) -> dict[tuple, tuple[int, float]]:
+        with self._lock:
+            return {labels: (sum(s[0]), s[1]) for labels, s in self._series.items()}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(s[0]), s[1]) for labels, s in self._series.items())
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _fmt_labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("_histogram", "_labels", "_started")
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._started, self._labels)
+        return False
+
+
+_registry: list = []
+_registry_lock = Lock()
+
+
+def register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for m in metrics:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+signal_stage_seconds = register(Histogram(
+    "signal_stage_seconds", "Time spent in each stage of a signal's life", ("stage",)
+))
+rest_request_seconds = register(Histogram(
+    "binance_rest_request_seconds", "Binance REST request latency by client method", ("method",)
+))
+rest_errors_total = register(Counter(
+    "binance_rest_errors_total", "Binance REST errors by client method and error code", ("method", "code")
+))
+order_attempts_total = register(Counter(
+    "order_attempts_total", "Post-only placement attempts by attempt number", ("attempt",)
+))
+maker_rejects_total = register(Counter(
+    "order_maker_rejects_total", "Post-only maker rejects by attempt number", ("attempt",)
+))
+time_to_fill_seconds = register(Histogram(
+    "order_time_to_fill_seconds", "Time from the first placement attempt to a fill", ("side",)
+))
+event_loop_lag_seconds = register(Histogram(
+    "event_loop_lag_seconds", "Event loop scheduling lag",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+))
+
+
+def span(stage: str):
+    """with span("book"): ... — пишет длительность в signal_stage_seconds{stage}."""
+    if not enabled:
+        return _NOOP_SPAN
+    return _Span(signal_stage_seconds, (stage,))
+
+
+def timer(histogram: Histogram, *labels):
+    if not enabled:
+        return _NOOP_SPAN
+    return _Span(histogram, labels)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """Фоновая задача: насколько позже запланированного просыпается event loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        event_loop_lag_seconds.observe(max(0.0, loop.time() - started - interval))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int) -> ThreadingHTTPServer:
+    """/metrics на отдельном порту — для процессов без Flask (Telegram-бот)."""
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Metrics served on :{port}/metrics")
+    return server
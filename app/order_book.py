@@ -0,0 +1,106 @@
+import time
+from bisect import bisect_left, insort
+from threading import Lock
+
+
+class LocalOrderBook:
+    """Локальный стакан одного символа, собранный из diff-depth потока.
+
+    Уровни хранятся в словаре цена -> объём плюс отсортированный по
+    возрастанию список цен, поэтому лучшая цена читается за O(1),
+    а top-N за O(N).
+    """
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self._bids: dict[float, float] = {}
+        self._asks: dict[float, float] = {}
+        self._bid_prices: list[float] = []
+        self._ask_prices: list[float] = []
+        self._lock = Lock()
+        self.last_update_id = 0
+        self.synced = False
+        self._awaiting_first = False
+        self.event_time: int | None = None
+        self.updated_at = 0.0
+        self.version = 0
+
+    @staticmethod
+    def _set_level(levels: dict, prices: list, price: float, qty: float) -> None:
+        if qty == 0.0:
+            if levels.pop(price, None) is not None:
+                i = bisect_left(prices, price)
+                if i < len(prices) and prices[i] == price:
+                    del prices[i]
+        else:
+            if price not in levels:
+                insort(prices, price)
+            levels[price] = qty
+
+    def apply_snapshot(self, snapshot: dict) -> None:
+        with self._lock:
+            self._bids = {float(p): float(q) for p, q in snapshot.get("bids", []) if float(q)}
+            self._asks = {float(p): float(q) for p, q in snapshot.get("asks", []) if float(q)}
+            self._bid_prices = sorted(self._bids)
+            self._ask_prices = sorted(self._asks)
+            self.last_update_id = snapshot["lastUpdateId"]
+            self.event_time = snapshot.get("E")
+            self.synced = True
+            self._awaiting_first = True
+            self.updated_at = time.time()
+            self.version += 1
+
+    def apply_diff(self, event: dict) -> bool:
+        """Применяет событие depthUpdate. Возвращает False при разрыве последовательности."""
+        with self._lock:
+            if not self.synced:
+                return False
+            first_id, final_id = event["U"], event["u"]
+            if final_id < self.last_update_id:
+                return True
+            if self._awaiting_first:
+                if first_id > self.last_update_id:
+                    self.synced = False
+                    return False
+                self._awaiting_first = False
+            elif event.get("pu") != self.last_update_id:
+                self.synced = False
+                return False
+
+            for p, q in event.get("b", []):
+                self._set_level(self._bids, self._bid_prices, float(p), float(q))
+            for p, q in event.get("a", []):
+                self._set_level(self._asks, self._ask_prices, float(p), float(q))
+            self.last_update_id = final_id
+            self.event_time = event.get("E")
+            self.updated_at = time.time()
+            self.version += 1
+            return True
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.synced = False
+
+    def best(self) -> tuple[float, float] | None:
+        with self._lock:
+            if not self.synced or not self._bid_prices or not self._ask_prices:
+                return None
+            return self._bid_prices[-1], self._ask_prices[0]
+
+    def level_qty(self, side: str, price: float) -> float:
+        """Объём на уровне price: side BUY — бид, SELL — аск."""
+        with self._lock:
+            levels = self._bids if side == "BUY" else self._asks
+            return levels.get(price, 0.0)
+
+    def top(self, depth: int = 20) -> dict:
+        with self._lock:
+            bids = [[p, self._bids[p]] for p in reversed(self._bid_prices[-depth:])]
+            asks = [[p, self._asks[p]] for p in self._ask_prices[:depth]]
+            return {
+                "symbol": self.symbol,
+                "bids": bids,
+                "asks": asks,
+                "timestamp": self.event_time,
+                "version": self.version,
+            }
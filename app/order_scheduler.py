@@ -0,0 +1,318 @@
+import time
+import heapq
+import uuid
+import logging
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from threading import Condition, Thread
+from typing import Callable
+
+from app.config import settings
+from app.symbol_metadata import SymbolInfo
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+MIN_CHILD_BUDGET = 2.0
+MAX_ACTIVE_CHILDREN = 16
+MAX_PARENTS = 1000
+ACTIVE = "active"
+
+
+class SlicingAlgo:
+    """Решает, каким объёмом и с каким бюджетом времени идёт следующий дочерний ордер."""
+
+    name = ""
+    # Предельное время жизни родителя; None — пока не исполнится
+    duration: float | None = None
+
+    def child(self, parent: "ParentOrder", now: float) -> tuple[float, float]:
+        """(объём, бюджет в секундах) следующего дочернего ордера; объём 0 — подождать."""
+        raise NotImplementedError
+
+    def next_due(self, parent: "ParentOrder", now: float) -> float:
+        """Когда спрашивать про следующий дочерний ордер после завершения текущего."""
+        return now
+
+
+class TwapAlgo(SlicingAlgo):
+    """Равные части каждые duration / slices секунд; недобор переходит в следующие части."""
+
+    name = "twap"
+
+    def __init__(self, duration: float, slices: int):
+        if duration <= 0 or slices < 1:
+            raise ValueError("TWAP needs duration > 0 and slices >= 1")
+        self.duration = duration
+        self.slices = slices
+        self.interval = duration / slices
+
+    def _slice(self, parent: "ParentOrder", now: float) -> int:
+        return min(self.slices - 1, int((now - parent.started_at) / self.interval))
+
+    def child(self, parent: "ParentOrder", now: float) -> tuple[float, float]:
+        k = self._slice(parent, now)
+        qty = parent.remaining / (self.slices - k)
+        slice_end = parent.started_at + (k + 1) * self.interval
+        return qty, max(MIN_CHILD_BUDGET, slice_end - now)
+
+    def next_due(self, parent: "ParentOrder", now: float) -> float:
+        return max(now, parent.started_at + (self._slice(parent, now) + 1) * self.interval)
+
+
+class IcebergAlgo(SlicingAlgo):
+    """В книге виден только visible_qty: следующая часть выставляется сразу после исполнения предыдущей."""
+
+    name = "iceberg"
+
+    def __init__(self, visible_qty: float, child_budget: float = 30.0, pause: float = 0.0,
+                 duration: float | None = None):
+        if visible_qty <= 0:
+            raise ValueError("Iceberg needs visible_qty > 0")
+        self.visible_qty = visible_qty
+        self.child_budget = child_budget
+        self.pause = pause
+        self.duration = duration
+
+    def child(self, parent: "ParentOrder", now: float) -> tuple[float, float]:
+        return min(self.visible_qty, parent.remaining), self.child_budget
+
+    def next_due(self, parent: "ParentOrder", now: float) -> float:
+        return now + self.pause
+
+
+class PovAlgo(SlicingAlgo):
+    """Участие в объёме рынка: исполнено не больше participation от объёма сделок с начала."""
+
+    name = "pov"
+
+    def __init__(self, participation: float, interval: float = 5.0, max_child: float | None = None,
+                 duration: float | None = None):
+        if not 0 < participation <= 1:
+            raise ValueError("Participation must be in (0, 1]")
+        self.participation = participation
+        self.interval = interval
+        self.max_child = max_child
+        self.duration = duration
+
+    def child(self, parent: "ParentOrder", now: float) -> tuple[float, float]:
+        qty = min(parent.remaining, self.participation * parent.traded - parent.filled)
+        if self.max_child:
+            qty = min(qty, self.max_child)
+        return max(qty, 0.0), max(MIN_CHILD_BUDGET, self.interval)
+
+    def next_due(self, parent: "ParentOrder", now: float) -> float:
+        return now + self.interval
+
+
+def make_algo(algo: str, **params) -> SlicingAlgo:
+    algos = {"twap": TwapAlgo, "iceberg": IcebergAlgo, "pov": PovAlgo}
+    if algo not in algos:
+        raise ValueError(f"Unknown algo {algo!r}, expected one of {', '.join(algos)}")
+    return algos[algo](**{k: v for k, v in params.items() if v is not None})
+
+
+@dataclass
+class ParentOrder:
+    parent_id: str
+    account: str
+    symbol: str
+    side: str
+    quantity: float
+    algo: SlicingAlgo = field(repr=False)
+    filled: float = 0.0
+    children: int = 0
+    status: str = ACTIVE
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    started_at: float = field(default_factory=time.monotonic)
+    volume_at_start: float = 0.0
+    traded: float = 0.0  # объём сделок рынка по символу с начала, обновляется перед каждым решением
+    child_running: bool = False
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self.quantity - self.filled)
+
+    def as_dict(self) -> dict:
+        return {
+            "parent_id": self.parent_id, "account": self.account, "symbol": self.symbol, "side": self.side,
+            "quantity": self.quantity, "algo": self.algo.name, "filled": self.filled,
+            "remaining": self.remaining, "children": self.children, "status": self.status,
+            "error": self.error, "created_at": self.created_at, "finished_at": self.finished_at,
+        }
+
+
+class ParentOrderScheduler:
+    """Родительские ордера, нарезанные на post-only дочерние (TWAP, iceberg, POV).
+
+    Один поток-таймер держит кучу сроков всех родителей по всем символам и
+    аккаунтам и отдаёт созревшие дочерние ордера пулу исполнителей. Замок
+    символа берёт только дочерний ордер на время своей погони, поэтому
+    вебхуки по тому же символу не ждут минутами, пока исполнится весь объём.
+    """
+
+    def __init__(
+        self,
+        run_child: Callable[[ParentOrder, float, float], float],
+        symbol_info: Callable[[str], SymbolInfo],
+        max_active_children: int = MAX_ACTIVE_CHILDREN
+    ):
+        self._run_child = run_child
+        self._symbol_info = symbol_info
+        self._pool = ThreadPoolExecutor(max_workers=max_active_children, thread_name_prefix="child-order")
+        self._cond = Condition()
+        self._heap: list[tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._parents: OrderedDict[str, ParentOrder] = OrderedDict()
+        self._volume: dict[str, float] = {}
+        self._thread: Thread | None = None
+
+    def on_market_event(self, kind: str, payload: dict) -> None:
+        # Объём сделок по символам — для POV
+        if kind == "trade":
+            symbol = payload.get("s")
+            self._volume[symbol] = self._volume.get(symbol, 0.0) + float(payload.get("q", 0))
+
+    def market_volume(self, symbol: str) -> float:
+        return self._volume.get(symbol, 0.0)
+
+    def submit(self, symbol: str, side: str, quantity: float, algo: SlicingAlgo, account: str) -> ParentOrder:
+        info = self._symbol_info(symbol)
+        if info.round_qty(quantity) <= 0:
+            raise ValueError(f"Quantity {quantity} is below step size {info.step_size} for {symbol}")
+        if info.round_qty(quantity) < info.min_qty:
+            raise ValueError(f"Quantity {quantity} is below min qty {info.min_qty} for {symbol}")
+        parent = ParentOrder(
+            uuid.uuid4().hex, account, symbol, side.upper(), info.round_qty(quantity), algo,
+            volume_at_start=self.market_volume(symbol)
+        )
+        with self._cond:
+            self._parents[parent.parent_id] = parent
+            while len(self._parents) > MAX_PARENTS:
+                oldest = next(iter(self._parents.values()))
+                if oldest.status == ACTIVE:
+                    break
+                self._parents.popitem(last=False)
+            self._schedule(parent, time.monotonic())
+        self._ensure_thread()
+        logger.info(
+            f"Parent {parent.parent_id} {algo.name} {parent.side} {parent.quantity} {symbol} ({account}) scheduled"
+        )
+        return parent
+
+    def get(self, parent_id: str) -> ParentOrder | None:
+        return self._parents.get(parent_id)
+
+    def parents(self, active_only: bool = False) -> list[ParentOrder]:
+        with self._cond:
+            return [p for p in self._parents.values() if not active_only or p.status == ACTIVE]
+
+    def cancel(self, parent_id: str) -> bool:
+        """Новые дочерние ордера не выставляются; текущий доработает свой бюджет."""
+        with self._cond:
+            parent = self._parents.get(parent_id)
+            if parent is None or parent.status != ACTIVE:
+                return False
+            self._finish(parent, "cancelled")
+            return True
+
+    def cancel_symbol(self, account: str, symbol: str) -> int:
+        with self._cond:
+            active = [p for p in self._parents.values()
+                      if p.status == ACTIVE and p.account == account and p.symbol == symbol]
+            for p in active:
+                self._finish(p, "cancelled")
+        return len(active)
+
+    def _ensure_thread(self) -> None:
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._timer_loop, name="order-scheduler", daemon=True)
+                self._thread.start()
+
+    def _schedule(self, parent: ParentOrder, due: float) -> None:
+        heapq.heappush(self._heap, (due, next(self._seq), parent.parent_id))
+        self._cond.notify()
+
+    def _finish(self, parent: ParentOrder, status: str, error: str | None = None) -> None:
+        parent.status, parent.error, parent.finished_at = status, error, time.time()
+        logger.info(
+            f"Parent {parent.parent_id} {status}: filled {parent.filled}/{parent.quantity} "
+            f"in {parent.children} children{f' ({error})' if error else ''}"
+        )
+
+    def _timer_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap:
+                    if not self._cond.wait(60):
+                        # Родителей нет — освобождаем поток, submit запустит новый
+                        self._thread = None
+                        return
+                due, _, parent_id = self._heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                parent = self._parents.get(parent_id)
+                if parent is None or parent.status != ACTIVE or parent.child_running:
+                    continue
+                child = self._next_child(parent)
+                if child is None:
+                    continue
+                parent.child_running = True
+                parent.children += 1
+            self._pool.submit(self._child, parent, *child)
+
+    def _next_child(self, parent: ParentOrder) -> tuple[float, float] | None:
+        """Объём и бюджет дочернего ордера или None (родитель завершён или ждёт)."""
+        now = time.monotonic()
+        info = self._symbol_info(parent.symbol)
+        remaining = info.round_qty(parent.remaining)
+        if remaining <= 0:
+            self._finish(parent, "done")
+            return None
+        if remaining < info.min_qty:
+            # Остаток меньше minQty биржа не примет
+            self._finish(parent, "partial")
+            return None
+        if self._expired(parent, now):
+            self._finish(parent, "partial" if parent.filled else "expired")
+            return None
+        parent.traded = self.market_volume(parent.symbol) - parent.volume_at_start
+        qty, budget = parent.algo.child(parent, now)
+        qty = info.round_qty(qty)
+        if qty <= 0:
+            self._schedule(parent, parent.algo.next_due(parent, now))
+            return None
+        return min(max(qty, info.min_qty), remaining), budget
+
+    @staticmethod
+    def _expired(parent: ParentOrder, now: float) -> bool:
+        return parent.algo.duration is not None and now - parent.started_at >= parent.algo.duration
+
+    def _child(self, parent: ParentOrder, qty: float, budget: float) -> None:
+        try:
+            filled = self._run_child(parent, qty, budget)
+            error = None
+        except Exception as e:
+            logger.exception(f"Child of parent {parent.parent_id} failed")
+            filled, error = 0.0, str(e)
+        with self._cond:
+            parent.child_running = False
+            parent.filled = min(parent.quantity, parent.filled + filled)
+            if parent.status != ACTIVE:
+                return
+            if error is not None:
+                self._finish(parent, "failed", error)
+                return
+            now = time.monotonic()
+            if parent.remaining <= 0 or self._expired(parent, now):
+                self._finish(parent, "done" if parent.remaining <= 0 else "partial")
+                return
+            self._schedule(parent, parent.algo.next_due(parent, now))
@@ -0,0 +1,185 @@
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from threading import Condition
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+FILL_STATUSES = ("FILLED", "PARTIALLY_FILLED")
+TERMINAL_STATUSES = ("FILLED", "CANCELED", "EXPIRED", "REJECTED", "EXPIRED_IN_MATCH")
+
+MAX_TRACKED_ORDERS = 1000
+TERMINAL_TTL = 600.0
+
+
+@dataclass(slots=True)
+class OrderState:
+    order_id: int
+    symbol: str
+    side: str
+    status: str
+    client_order_id: str = ""
+    price: float = 0.0
+    orig_qty: float = 0.0
+    filled_qty: float = 0.0
+    avg_price: float = 0.0
+    last_fill_qty: float = 0.0
+    last_fill_price: float = 0.0
+    commission: float = 0.0
+    realized_pnl: float = 0.0
+    updated_at: float = field(default_factory=time.time)
+
+    def as_dict(self) -> dict:
+        # Те же ключи, что и в ответе futures_get_order
+        return {
+            "orderId": self.order_id,
+            "clientOrderId": self.client_order_id,
+            "symbol": self.symbol,
+            "side": self.side,
+            "status": self.status,
+            "price": str(self.price),
+            "origQty": str(self.orig_qty),
+            "executedQty": str(self.filled_qty),
+            "avgPrice": str(self.avg_price),
+        }
+
+
+class OrderTracker:
+    """Состояние ордеров из ORDER_TRADE_UPDATE пользовательского потока.
+
+    wait() блокирует вызывающий поток до прихода нужного статуса ордера,
+    без опроса futures_get_order. Потоку доверяют по аккаунту (is_active):
+    сбой потока одного аккаунта не отключает отслеживание у остальных.
+    Признак жизни — любое событие потока; тишина дольше stale_after секунд
+    считается обрывом, пока не придёт следующее событие.
+    """
+
+    def __init__(self, stale_after: float = settings.user_stream_stale):
+        self._orders: dict[int, OrderState] = {}
+        self._cond = Condition()
+        # order_id -> [(loop, future, statuses)] для асинхронных ожидающих
+        self._waiters: dict[int, list[tuple]] = {}
+        self.stale_after = stale_after
+        # аккаунт -> последний признак жизни пользовательского потока (monotonic); нет — поток не работает
+        self._heartbeats: dict[str, float] = {}
+        self.last_event_at = 0.0
+
+    def set_active(self, account: str, active: bool) -> bool:
+        """Отмечает поток аккаунта живым или оборванным; True — поток ожил после обрыва или тишины."""
+        if not active:
+            self._heartbeats.pop(account, None)
+            return False
+        resumed = not self.is_active(account)
+        self._heartbeats[account] = time.monotonic()
+        return resumed
+
+    def is_active(self, account: str) -> bool:
+        beat = self._heartbeats.get(account)
+        if beat is None:
+            return False
+        return not self.stale_after or time.monotonic() - beat <= self.stale_after
+
+    def on_order_update(self, event: dict) -> OrderState:
+        o = event["o"]
+        order_id = int(o["i"])
+        with self._cond:
+            state = self._orders.get(order_id)
+            if state is None:
+                state = OrderState(order_id=order_id, symbol=o["s"], side=o["S"], status=o["X"])
+                self._orders[order_id] = state
+            state.status = o["X"]
+            state.client_order_id = o.get("c", "")
+            state.price = float(o.get("p", 0.0))
+            state.orig_qty = float(o.get("q", 0.0))
+            state.filled_qty = float(o.get("z", 0.0))
+            state.avg_price = float(o.get("ap", 0.0))
+            state.last_fill_qty = float(o.get("l", 0.0))
+            state.last_fill_price = float(o.get("L", 0.0))
+            if o.get("x") == "TRADE":
+                state.commission += float(o.get("n", 0.0))
+                state.realized_pnl += float(o.get("rp", 0.0))
+            state.updated_at = time.time()
+            self.last_event_at = state.updated_at
+            if len(self._orders) > MAX_TRACKED_ORDERS:
+                self._prune()
+            self._cond.notify_all()
+            self._resolve_waiters(state)
+        logger.debug(f"Order {order_id} {state.symbol} -> {state.status} filled={state.filled_qty}")
+        return state
+
+    def _resolve_waiters(self, state: OrderState) -> None:
+        waiters = self._waiters.get(state.order_id)
+        if not waiters:
+            return
+        remaining = []
+        for loop, fut, statuses in waiters:
+            if state.status in statuses:
+                loop.call_soon_threadsafe(_set_future_result, fut, state)
+            else:
+                remaining.append((loop, fut, statuses))
+        if remaining:
+            self._waiters[state.order_id] = remaining
+        else:
+            del self._waiters[state.order_id]
+
+    def _prune(self) -> None:
+        cutoff = time.time() - TERMINAL_TTL
+        for oid in [oid for oid, s in self._orders.items()
+                    if s.status in TERMINAL_STATUSES and s.updated_at < cutoff]:
+            del self._orders[oid]
+
+    def get(self, order_id: int) -> OrderState | None:
+        return self._orders.get(order_id)
+
+    def wait(
+        self,
+        order_id: int,
+        timeout: float,
+        statuses: tuple[str, ...] = FILL_STATUSES + TERMINAL_STATUSES
+    ) -> OrderState | None:
+        """Ждёт, пока ордер перейдёт в один из statuses; по таймауту возвращает последнее состояние."""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: (s := self._orders.get(order_id)) is not None and s.status in statuses,
+                timeout
+            )
+            return self._orders.get(order_id)
+
+    async def wait_async(
+        self,
+        order_id: int,
+        timeout: float,
+        statuses: tuple[str, ...] = FILL_STATUSES + TERMINAL_STATUSES
+    ) -> OrderState | None:
+        """Асинхронный аналог wait(): future резолвится из потока websocket."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        with self._cond:
+            state = self._orders.get(order_id)
+            if state is not None and state.status in statuses:
+                return state
+            entry = (loop, fut, statuses)
+            self._waiters.setdefault(order_id, []).append(entry)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return self._orders.get(order_id)
+        finally:
+            with self._cond:
+                waiters = self._waiters.get(order_id)
+                if waiters and entry in waiters:
+                    waiters.remove(entry)
+                    if not waiters:
+                        del self._waiters[order_id]
+
+
+def _set_future_result(fut: asyncio.Future, state: OrderState) -> None:
+    if not fut.done():
+        fut.set_result(state)
+
+
+order_tracker = OrderTracker()
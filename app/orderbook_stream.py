@@ -0,0 +1,151 @@
+import time
+import logging
+from threading import Event, Lock
+from typing import Callable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+
+class SubscriberLimitReached(RuntimeError):
+    pass
+
+
+class Subscription:
+    """Подписка одного клиента дашборда на набор символов."""
+
+    def __init__(self, symbols: set[str]):
+        self.symbols = set(symbols)
+        self.dirty: set[str] = set(symbols)
+        self.sent: dict[str, dict[str, dict[float, float]]] = {}
+        self.wakeup = Event()
+        self.wakeup.set()
+
+
+class OrderBookBroadcaster:
+    """Раздаёт top-N стакана из локальной книги всем подписчикам.
+
+    Обновления книги только помечают подписку «грязной»; отправка идёт не
+    чаще min_interval на клиента, поэтому серия diff-ов схлопывается в одно
+    сообщение, а стоимость на бирже не зависит от числа зрителей. Каждый
+    зритель занимает поток веб-сервера на всё время соединения, поэтому их
+    число ограничено max_subscribers — потоки остаются вебхукам и /ready.
+    """
+
+    def __init__(
+        self,
+        snapshot: Callable[[str, int], dict],
+        version: Callable[[str], int],
+        depth: int = 20,
+        min_interval: float = 0.1,
+        stats: Callable[..., dict | None] | None = None,
+        max_subscribers: int = 0
+    ):
+        self._snapshot = snapshot
+        self._version = version
+        # Сводка стакана (итоги, середина, спред) считается на сервере и едет в каждом сообщении
+        self._stats = stats
+        self.depth = depth
+        self.min_interval = min_interval
+        self.max_subscribers = max_subscribers  # 0 — без ограничения
+        self._subs: set[Subscription] = set()
+        self._lock = Lock()
+        self._cache: dict[str, dict] = {}
+
+    def subscribe(self, symbols: set[str]) -> Subscription:
+        sub = Subscription(symbols)
+        with self._lock:
+            if self.max_subscribers and len(self._subs) >= self.max_subscribers:
+                raise SubscriberLimitReached(f"Too many order book subscribers ({self.max_subscribers})")
+            self._subs.add(sub)
+        return sub
+
+    def is_full(self) -> bool:
+        return bool(self.max_subscribers) and len(self._subs) >= self.max_subscribers
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subs.discard(sub)
+
+    def update_symbols(self, sub: Subscription, add: set[str] = frozenset(), remove: set[str] = frozenset()) -> None:
+        with self._lock:
+            sub.symbols |= set(add)
+            sub.symbols -= set(remove)
+            sub.dirty |= set(add)
+            for s in remove:
+                sub.sent.pop(s, None)
+                sub.dirty.discard(s)
+        sub.wakeup.set()
+
+    def on_book_update(self, symbol: str) -> None:
+        with self._lock:
+            for sub in self._subs:
+                if symbol in sub.symbols:
+                    sub.dirty.add(symbol)
+                    sub.wakeup.set()
+
+    def subscriber_count(self) -> int:
+        return len(self._subs)
+
+    def _top(self, symbol: str) -> dict:
+        # Один расчёт top-N на версию книги, общий для всех клиентов
+        version = self._version(symbol)
+        cached = self._cache.get(symbol)
+        if version and cached is not None and cached.get("version") == version:
+            return cached
+        book = self._snapshot(symbol, self.depth)
+        self._cache[symbol] = book
+        return book
+
+    def next_messages(self, sub: Subscription, timeout: float = 1.0) -> list[dict]:
+        """Ждёт изменений и возвращает snapshot/delta сообщения для клиента."""
+        if not sub.wakeup.wait(timeout):
+            return []
+        with self._lock:
+            sub.wakeup.clear()
+            dirty, sub.dirty = sub.dirty, set()
+        messages = []
+        for symbol in dirty:
+            book = self._top(symbol)
+            levels = {
+                "bids": {p: q for p, q in book["bids"]},
+                "asks": {p: q for p, q in book["asks"]},
+            }
+            prev = sub.sent.get(symbol)
+            sub.sent[symbol] = levels
+            if prev is None:
+                messages.append({
+                    "type": "snapshot",
+                    "symbol": symbol,
+                    "bids": book["bids"],
+                    "asks": book["asks"],
+                    "E": book.get("timestamp"),
+                    **self._stats_field(symbol),
+                })
+                continue
+            delta = {"type": "delta", "symbol": symbol, "E": book.get("timestamp")}
+            changed = False
+            for side in ("bids", "asks"):
+                old, new = prev[side], levels[side]
+                diff = [[p, q] for p, q in new.items() if old.get(p) != q]
+                diff += [[p, 0] for p in old if p not in new]
+                if diff:
+                    changed = True
+                delta[side] = diff
+            if changed:
+                delta.update(self._stats_field(symbol))
+                messages.append(delta)
+        return messages
+
+    def _stats_field(self, symbol: str) -> dict:
+        if self._stats is None:
+            return {}
+        stats = self._stats(symbol, top=self.depth)
+        return {"stats": stats} if stats is not None else {}
+
+    def throttle(self, last_sent: float) -> None:
+        pause = self.min_interval - (time.monotonic() - last_sent)
+        if pause > 0:
+            time.sleep(pause)
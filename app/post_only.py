@@ -0,0 +1,222 @@
+import time
+import logging
+from typing import Any, Generator
+
+from binance.exceptions import BinanceAPIException
+from app.config import settings
+from app.order_tracker import order_tracker, FILL_STATUSES, TERMINAL_STATUSES
+from app.repricer import Chase, RepricingEngine, RepricingPolicy
+from app.symbol_metadata import SymbolInfo
+from app import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+MAX_ATTEMPT_LABEL = 20  # attempt в метриках; дальше всё сводится в одну серию
+
+# Логика погони — генераторы: yield (операция, параметры) просит исполнителя сделать
+# запрос и вернуть результат через send (ошибку — через throw). Исполнители — run и
+# run_async поверх адаптера с методами position, book, wait, cancel_orders и futures_*
+# клиента аккаунта, поэтому решения у синхронного и асинхронного пути одни и те же.
+Steps = Generator[tuple[str, dict], Any, Any]
+
+
+def _is_maker_reject(e: BinanceAPIException) -> bool:
+    return "could not be executed as maker" in e.message or \
+        "Post Only order will be rejected" in e.message
+
+
+def run(steps: Steps, io) -> Any:
+    result, error = None, None
+    while True:
+        try:
+            op, params = steps.send(result) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, error = getattr(io, op)(**params), None
+        except Exception as e:
+            result, error = None, e
+
+
+async def run_async(steps: Steps, io) -> Any:
+    result, error = None, None
+    while True:
+        try:
+            op, params = steps.send(result) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, error = await getattr(io, op)(**params), None
+        except Exception as e:
+            result, error = None, e
+
+
+def cancel_open_orders(symbol: str, side: str | None = None) -> Steps:
+    """Снимает открытые LIMIT-ордера символа (одной стороны, если side задан).
+
+    Возвращает ответы биржи с ошибкой ({'code','msg'}) — ордера, которые снять не удалось.
+    """
+    opens = yield "futures_get_open_orders", dict(symbol=symbol)
+    ids = []
+    for o in opens:
+        if o["type"] == "LIMIT" and (side is None or o["side"] == side):
+            logger.info(f"Cancelling order {o['orderId']} side={o['side']}")
+            ids.append(o["orderId"])
+    if not ids:
+        return []
+    results = yield "cancel_orders", dict(symbol=symbol, order_ids=ids)
+    return [r for r in results or [] if "code" in r and "orderId" not in r]
+
+
+def replace_order(symbol: str, order_id: int, side: str, quantity: str, price: str) -> Steps:
+    """Перевыставляет post-only ордер по новой цене одним запросом (modify), иначе cancel + create."""
+    try:
+        return (yield "futures_modify_order", dict(
+            symbol=symbol, orderId=order_id, side=side, quantity=quantity, price=price
+        ))
+    except BinanceAPIException as e:
+        if _is_maker_reject(e):
+            raise
+        if e.code == -5027:  # No need to modify the order
+            return {'orderId': order_id}
+        logger.warning(f"Modify of order {order_id} failed ({e.message}), falling back to cancel + create")
+    try:
+        yield "futures_cancel_order", dict(symbol=symbol, orderId=order_id)
+    except BinanceAPIException:
+        pass
+    return (yield "futures_create_order", dict(
+        symbol=symbol,
+        side=side,
+        type="LIMIT",
+        timeInForce="GTX",
+        price=price,
+        quantity=quantity
+    ))
+
+
+def poll_order(chase: Chase, poll_interval: float, account_id: str) -> Steps:
+    """Состояние ордера из потока аккаунта; REST — только если событий нет дольше poll_interval."""
+    if order_tracker.is_active(account_id):
+        state = order_tracker.get(chase.order_id)
+        if state is not None:
+            return state.as_dict()
+    if time.monotonic() - max(chase.polled_at, chase.last_request) < poll_interval:
+        return None
+    chase.polled_at = time.monotonic()
+    return (yield "futures_get_order", dict(symbol=chase.symbol, orderId=chase.order_id))
+
+
+def cancel_resting(chase: Chase) -> Steps:
+    """Снимает стоящий ордер погони; уже исполненный или снятый ордер — не ошибка."""
+    try:
+        yield "futures_cancel_order", dict(symbol=chase.symbol, orderId=chase.order_id)
+        logger.info(f"Cancelled resting order {chase.order_id} of {chase.symbol}")
+    except BinanceAPIException as e:
+        logger.warning(f"Cannot cancel resting order {chase.order_id} of {chase.symbol} ({e.message})")
+
+
+def chase_post_only(
+    repricer: RepricingEngine,
+    info: SymbolInfo,
+    side: str,
+    quantity: float,
+    account_id: str,
+    max_deviation_pct: float,
+    retry_interval: float,
+    max_attempts: int,
+    policy: RepricingPolicy | None = None
+) -> Steps:
+    """Выставляет post-only ордер и ведёт его за лучшей ценой до исполнения.
+
+    Цену выбирает repricer по событиям стакана: ордер остаётся на месте, пока
+    конкурентен, и переставляется через modify, когда touch уходит.
+    max_attempts × retry_interval — общий бюджет времени, retry_interval — интервал
+    опроса REST, если потока нет. Цена дальше max_deviation_pct от текущего touch — ошибка;
+    при ошибке и по истечении бюджета стоящий ордер снимается.
+    Объём меньше minQty или стоимость меньше MIN_NOTIONAL символа — ValueError до запроса.
+    """
+    symbol = info.symbol
+    side = side.upper()
+    qty = info.round_qty(quantity)
+    if qty <= 0:
+        raise ValueError(f"Quantity {quantity} is below step size {info.step_size} for {symbol}")
+    if qty < info.min_qty:
+        raise ValueError(f"Quantity {qty} is below min qty {info.min_qty} for {symbol}")
+    qty_str = info.format_qty(quantity)
+    initial_pos = yield "position", dict(symbol=symbol)
+    target_pos = initial_pos + qty if side == 'BUY' else initial_pos - qty
+    chase = repricer.chase(symbol, side, qty, info.tick_size, policy)
+    started = time.perf_counter()
+    deadline = time.monotonic() + retry_interval * max_attempts
+
+    while time.monotonic() < deadline:
+        seq = repricer.seq(symbol)
+        with metrics.span("position"):
+            current_pos = yield "position", dict(symbol=symbol)
+        if (side == 'BUY' and current_pos >= target_pos) or \
+           (side == 'SELL' and current_pos <= target_pos):
+            logger.info(f"Position {symbol} ({account_id}) reached target ({current_pos}), stopping")
+            if chase.order_id:
+                metrics.time_to_fill_seconds.observe(time.perf_counter() - started, (side,))
+            return {'orderId': chase.order_id}
+
+        if chase.order_id:
+            try:
+                o = yield from poll_order(chase, retry_interval, account_id)
+            except BinanceAPIException as e:
+                logger.warning(f"Cannot fetch order {chase.order_id} status ({e.message})")
+                o = None
+            status = o.get('status') if o else None
+            if status in FILL_STATUSES:
+                logger.info(f"Order {chase.order_id} {status} after {chase.requests} requests")
+                metrics.time_to_fill_seconds.observe(time.perf_counter() - started, (side,))
+                return o
+            if status in TERMINAL_STATUSES:
+                logger.warning(f"Order {chase.order_id} is {status}, placing a new one")
+                repricer.dropped(chase)
+
+        with metrics.span("book"):
+            book = yield "book", dict(symbol=symbol)
+        price = repricer.decide(chase, book['bid'], book['ask'])
+        if price is not None:
+            touch = book['bid'] if side == 'BUY' else book['ask']
+            if abs(price - touch) > touch * max_deviation_pct / 100:
+                logger.error(f"Price {price} is beyond {max_deviation_pct}% of touch {touch}, giving up")
+                break
+            if qty * price < info.min_notional:
+                raise ValueError(f"Notional {qty * price:.2f} is below min notional {info.min_notional} for {symbol}")
+            price_str = info.format_price(price)
+            attempt = str(min(chase.requests + 1, MAX_ATTEMPT_LABEL))
+            metrics.order_attempts_total.inc((attempt,))
+            try:
+                with metrics.span("order_create"):
+                    if chase.order_id:
+                        order = yield from replace_order(symbol, chase.order_id, side, qty_str, price_str)
+                    else:
+                        order = yield "futures_create_order", dict(
+                            symbol=symbol,
+                            side=side,
+                            type="LIMIT",
+                            timeInForce="GTX",
+                            price=price_str,
+                            quantity=qty_str
+                        )
+                repricer.placed(chase, order['orderId'], info.round_price(price))
+                logger.info(f"Request {chase.requests}: post-only {side} {symbol} at {price_str}")
+            except BinanceAPIException as e:
+                if not _is_maker_reject(e):
+                    logger.error(f"Request {chase.requests + 1}: unexpected API error ({e.message})")
+                    raise
+                metrics.maker_rejects_total.inc((attempt,))
+                repricer.rejected(chase)
+                logger.warning(f"Request {chase.requests}: maker reject ({e.message}), waiting for the book")
+
+        with metrics.span("fill_wait"):
+            yield "wait", dict(symbol=symbol, seq=seq, timeout=retry_interval)
+
+    if chase.order_id:
+        yield from cancel_resting(chase)
+    error = f"Order {side} {symbol} {quantity} ({account_id}) not filled after {chase.requests} requests"
+    logger.error(error)
+    raise RuntimeError(error)
@@ -0,0 +1,350 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from threading import Condition, Lock
+from typing import Callable
+
+from binance.exceptions import BinanceAPIException
+from app.config import settings
+from app.clock_sync import TIMESTAMP_ERROR, ClockSync
+from app import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+PRIORITY_ORDER = 0    # создание, отмена, изменение ордеров
+PRIORITY_ACCOUNT = 1  # статус ордеров, позиции, открытые ордера
+PRIORITY_INFO = 2     # баланс, mark price, стакан, история сделок
+
+# Лимиты USDⓈ-M фьючерсов: (тип, окно в секундах) -> ёмкость
+DEFAULT_LIMITS = {
+    ("REQUEST_WEIGHT", 60): 2400,
+    ("ORDERS", 60): 1200,
+    ("ORDERS", 10): 300,
+}
+
+_HEADER_LIMITS = {
+    "x-mbx-used-weight-1m": ("REQUEST_WEIGHT", 60),
+    "x-mbx-order-count-1m": ("ORDERS", 60),
+    "x-mbx-order-count-10s": ("ORDERS", 10),
+}
+
+# method -> (weight, orders, priority); weight может зависеть от параметров, см. request_cost
+ENDPOINT_COSTS = {
+    "futures_create_order": (1, 1, PRIORITY_ORDER),
+    "futures_cancel_order": (1, 0, PRIORITY_ORDER),
+    "futures_modify_order": (1, 1, PRIORITY_ORDER),
+    "futures_place_batch_order": (5, 1, PRIORITY_ORDER),
+    "futures_cancel_orders": (1, 0, PRIORITY_ORDER),
+    "futures_cancel_all_open_orders": (1, 0, PRIORITY_ORDER),
+    "futures_change_leverage": (1, 0, PRIORITY_ORDER),
+    "futures_get_order": (1, 0, PRIORITY_ACCOUNT),
+    "futures_get_open_orders": (1, 0, PRIORITY_ACCOUNT),
+    "futures_position_information": (5, 0, PRIORITY_ACCOUNT),
+    "futures_account": (5, 0, PRIORITY_ACCOUNT),
+    "futures_account_balance": (5, 0, PRIORITY_INFO),
+    "futures_account_trades": (5, 0, PRIORITY_INFO),
+    "futures_mark_price": (1, 0, PRIORITY_INFO),
+    "futures_order_book": (2, 0, PRIORITY_INFO),
+    "futures_exchange_info": (1, 0, PRIORITY_INFO),
+    "futures_time": (1, 0, PRIORITY_INFO),
+}
+
+
+# Подписанные эндпоинты: метка времени и recvWindow — из ClockSync
+SIGNED_METHODS = frozenset(
+    name for name, (_, _, priority) in ENDPOINT_COSTS.items() if priority != PRIORITY_INFO
+) | {"futures_account_balance", "futures_account_trades"}
+
+
+def _order_book_weight(limit: int) -> int:
+    if limit <= 50:
+        return 2
+    if limit <= 100:
+        return 5
+    if limit <= 500:
+        return 10
+    return 20
+
+
+def request_cost(method: str, params: dict) -> tuple[int, int, int]:
+    weight, orders, priority = ENDPOINT_COSTS.get(method, (1, 0, PRIORITY_INFO))
+    if method == "futures_order_book":
+        weight = _order_book_weight(int(params.get("limit", 500)))
+    elif method == "futures_place_batch_order":
+        orders = len(params.get("batchOrders", [])) or 1
+    elif method in ("futures_get_open_orders", "futures_mark_price") and "symbol" not in params:
+        weight = 40 if method == "futures_get_open_orders" else 10
+    return weight, orders, priority
+
+
+class TokenBucket:
+    def __init__(self, capacity: int, window: float):
+        self.capacity = capacity
+        self.window = window
+        self.rate = capacity / window
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: int, now: float) -> float:
+        self._refill(now)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: int) -> None:
+        self.tokens -= amount
+
+    def sync_used(self, used: int, now: float) -> None:
+        # Сервер знает точнее: если там потрачено больше, чем мы думаем, подтягиваемся
+        self._refill(now)
+        self.tokens = min(self.tokens, float(self.capacity - used))
+
+
+class RateLimitGovernor:
+    """Клиентский учёт лимитов Binance с очередью по приоритетам.
+
+    Запросы получают разрешение строго по (priority, порядок прихода),
+    поэтому ордерные вызовы обгоняют информационные.
+    """
+
+    def __init__(self, limits: dict | None = None, safety: float = 0.9):
+        limits = limits or DEFAULT_LIMITS
+        self.buckets = {
+            (kind, window): TokenBucket(int(capacity * safety), window)
+            for (kind, window), capacity in limits.items()
+        }
+        self._cond = Condition()
+        self._queue: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._banned_until = 0.0
+        self.granted = 0
+        self.waited = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.banned = 0
+
+    def _needs(self, weight: int, orders: int) -> list[tuple[TokenBucket, int]]:
+        needs = []
+        for (kind, _), bucket in self.buckets.items():
+            amount = weight if kind == "REQUEST_WEIGHT" else orders
+            if amount:
+                needs.append((bucket, amount))
+        return needs
+
+    def _try_grant(self, ticket: tuple[int, int], needs: list) -> float:
+        # Вызывается под self._cond; 0.0 — разрешение выдано
+        now = time.monotonic()
+        if self._queue[0] != ticket:
+            return 0.05
+        if now < self._banned_until:
+            return self._banned_until - now
+        delay = max((b.wait_time(n, now) for b, n in needs), default=0.0)
+        if delay > 0:
+            return delay
+        for b, n in needs:
+            b.take(n)
+        heapq.heappop(self._queue)
+        self._cond.notify_all()
+        return 0.0
+
+    def _record(self, waited: float) -> None:
+        self.granted += 1
+        if waited > 0.001:
+            self.waited += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def acquire(self, weight: int = 1, orders: int = 0, priority: int = PRIORITY_INFO) -> float:
+        needs = self._needs(weight, orders)
+        started = time.monotonic()
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._queue, ticket)
+            while (delay := self._try_grant(ticket, needs)) > 0:
+                self._cond.wait(delay)
+            waited = time.monotonic() - started
+            self._record(waited)
+        return waited
+
+    async def acquire_async(self, weight: int = 1, orders: int = 0, priority: int = PRIORITY_INFO) -> float:
+        needs = self._needs(weight, orders)
+        started = time.monotonic()
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._queue, ticket)
+        try:
+            while True:
+                with self._cond:
+                    delay = self._try_grant(ticket, needs)
+                if delay <= 0:
+                    break
+                await asyncio.sleep(min(delay, 0.05))
+        except asyncio.CancelledError:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+            raise
+        waited = time.monotonic() - started
+        with self._cond:
+            self._record(waited)
+        return waited
+
+    def update_from_headers(self, headers) -> None:
+        if not headers:
+            return
+        now = time.monotonic()
+        with self._cond:
+            for name, value in headers.items():
+                key = _HEADER_LIMITS.get(name.lower())
+                if key and key in self.buckets:
+                    self.buckets[key].sync_used(int(value), now)
+
+    def on_error(self, e: BinanceAPIException) -> None:
+        if e.status_code not in (418, 429):
+            return
+        headers = getattr(e.response, "headers", None) or {}
+        retry_after = float(headers.get("Retry-After", 60))
+        with self._cond:
+            self._banned_until = max(self._banned_until, time.monotonic() + retry_after)
+            self.banned += 1
+            self._cond.notify_all()
+        logger.error(f"Rate limit hit (HTTP {e.status_code}), pausing requests for {retry_after}s")
+
+    def metrics(self) -> dict:
+        with self._cond:
+            now = time.monotonic()
+            return {
+                "queue_depth": len(self._queue),
+                "granted": self.granted,
+                "waited": self.waited,
+                "wait_time_total": round(self.wait_time_total, 6),
+                "wait_time_max": round(self.wait_time_max, 6),
+                "banned": self.banned,
+                "banned_for": max(0.0, self._banned_until - now),
+                "available": {
+                    f"{kind}_{window}s": int(b.tokens) for (kind, window), b in self.buckets.items()
+                },
+            }
+
+
+class GovernedClient:
+    """Прокси над binance Client: каждый futures_* вызов проходит через governor.
+
+    С factory клиент создаётся при первом обращении, а не при импорте. С clock
+    подписанные запросы получают смещение часов и recvWindow из ClockSync, а
+    отказ -1021 поправляет оценку и повторяется один раз сразу.
+    """
+
+    def __init__(
+        self,
+        client,
+        governor: RateLimitGovernor,
+        factory: Callable[[], object] | None = None,
+        clock: ClockSync | None = None
+    ):
+        self._client = client
+        self._governor = governor
+        self._factory = factory
+        self._clock = clock
+        self._build_lock = Lock()
+
+    @property
+    def target(self):
+        if self._client is None:
+            with self._build_lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def set_target(self, client) -> None:
+        # Подмена клиента (например, симулятором биржи) без пересоздания ссылок на прокси
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self.target, name)
+        if not name.startswith("futures_") or not callable(attr):
+            return attr
+
+        def call(**params):
+            weight, orders, priority = request_cost(name, params)
+            signed = self._signed(name)
+            for attempt in range(2):
+                self._governor.acquire(weight, orders, priority)
+                if signed:
+                    self._apply_clock()
+                started = time.perf_counter()
+                try:
+                    with metrics.timer(metrics.rest_request_seconds, name):
+                        result = getattr(self.target, name)(**params)
+                except BinanceAPIException as e:
+                    if not self._on_api_error(name, e, signed and not attempt):
+                        raise
+                    continue
+                if signed:
+                    self._clock.observe_request(time.perf_counter() - started)
+                response = getattr(self.target, "response", None)
+                self._governor.update_from_headers(getattr(response, "headers", None))
+                return result
+
+        return call
+
+    def _signed(self, name: str) -> bool:
+        return self._clock is not None and name in SIGNED_METHODS
+
+    def _apply_clock(self) -> None:
+        # python-binance сам ставит timestamp (time.time() + timestamp_offset) и recvWindow при подписи
+        target = self.target
+        target.timestamp_offset = self._clock.offset_ms()
+        target.REQUEST_RECVWINDOW = self._clock.recv_window()
+
+    def _on_api_error(self, name: str, e: BinanceAPIException, retry: bool) -> bool:
+        """Учёт ошибки; True — метка времени поправлена и запрос стоит повторить сразу."""
+        metrics.rest_errors_total.inc((name, str(e.code)))
+        self._governor.on_error(e)
+        self._governor.update_from_headers(getattr(e.response, "headers", None))
+        if e.code != TIMESTAMP_ERROR or self._clock is None:
+            return False
+        self._clock.on_timestamp_error(e.message)
+        return retry
+
+
+class GovernedAsyncClient(GovernedClient):
+    def __getattr__(self, name):
+        attr = getattr(self.target, name)
+        if not name.startswith("futures_") or not callable(attr):
+            return attr
+
+        async def call(**params):
+            weight, orders, priority = request_cost(name, params)
+            signed = self._signed(name)
+            for attempt in range(2):
+                await self._governor.acquire_async(weight, orders, priority)
+                if signed:
+                    self._apply_clock()
+                started = time.perf_counter()
+                try:
+                    with metrics.timer(metrics.rest_request_seconds, name):
+                        result = await getattr(self.target, name)(**params)
+                except BinanceAPIException as e:
+                    if not self._on_api_error(name, e, signed and not attempt):
+                        raise
+                    continue
+                if signed:
+                    self._clock.observe_request(time.perf_counter() - started)
+                response = getattr(self.target, "response", None)
+                self._governor.update_from_headers(getattr(response, "headers", None))
+                return result
+
+        return call
+
+
+rate_governor = RateLimitGovernor()
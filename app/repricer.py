@@ -0,0 +1,247 @@
+import math
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from threading import Condition
+from typing import Callable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+VOLATILITY_ALPHA = 0.2
+MIN_AMEND_INTERVAL = 0.05
+
+
+@dataclass(slots=True)
+class Quote:
+    """Всё, что политика знает о рынке и нашем ордере в момент решения."""
+    side: str
+    bid: float
+    ask: float
+    tick: float
+    own_price: float | None
+    own_qty: float
+    queue_ahead: float
+    volatility_ticks: float
+
+    @property
+    def spread_ticks(self) -> int:
+        return max(1, round((self.ask - self.bid) / self.tick))
+
+    @property
+    def touch(self) -> float:
+        return self.bid if self.side == "BUY" else self.ask
+
+    def improve(self, ticks: int) -> float:
+        # Шаг от touch внутрь спреда
+        return self.touch + ticks * self.tick if self.side == "BUY" else self.touch - ticks * self.tick
+
+    def behind_ticks(self) -> int:
+        """На сколько тиков наш ордер хуже лучшей цены (0 — стоим на touch или лучше)."""
+        if self.own_price is None:
+            return 0
+        diff = self.touch - self.own_price if self.side == "BUY" else self.own_price - self.touch
+        return max(0, round(diff / self.tick))
+
+
+class RepricingPolicy:
+    """Решает, куда переставить ордер; None — оставить ордер как есть."""
+
+    def reprice(self, q: Quote) -> float | None:
+        raise NotImplementedError
+
+
+class JoinTouchPolicy(RepricingPolicy):
+    """Всегда стоим на лучшей цене своей стороны."""
+
+    def reprice(self, q: Quote) -> float | None:
+        if q.own_price is not None and q.behind_ticks() == 0:
+            return None
+        return q.touch
+
+
+class AdaptivePolicy(RepricingPolicy):
+    """Стоим на touch, пока это конкурентно; шаг зависит от спреда, очереди и волатильности.
+
+    - широкий спред: встаём внутрь, до max_improve_ticks, но не ближе тика к другой стороне;
+    - длинная очередь перед нами (больше queue_ratio наших объёмов) при спреде > 1 тика:
+      улучшаем цену на тик, чтобы оказаться первыми;
+    - touch ушёл от нас меньше чем на volatility_ticks × vol_tolerance тиков: ждём,
+      в шумном рынке цена чаще возвращается, чем стоит лишний amend.
+    """
+
+    def __init__(self, max_improve_ticks: int = 3, queue_ratio: float = 5.0, vol_tolerance: float = 0.5):
+        self.max_improve_ticks = max_improve_ticks
+        self.queue_ratio = queue_ratio
+        self.vol_tolerance = vol_tolerance
+
+    def _target(self, q: Quote) -> float:
+        room = q.spread_ticks - 1
+        improve = min(self.max_improve_ticks, math.ceil(room / 2)) if room > 0 else 0
+        return q.improve(improve)
+
+    def reprice(self, q: Quote) -> float | None:
+        if q.own_price is None:
+            return self._target(q)
+        behind = q.behind_ticks()
+        if behind == 0:
+            if q.spread_ticks > 1 and q.queue_ahead > self.queue_ratio * q.own_qty:
+                return q.improve(1)
+            return None
+        if behind <= math.floor(q.volatility_ticks * self.vol_tolerance):
+            return None
+        return self._target(q)
+
+
+class Chase:
+    """Состояние одного догоняющего ордера."""
+
+    def __init__(self, symbol: str, side: str, qty: float, tick: float, policy: RepricingPolicy):
+        self.symbol = symbol
+        self.side = side
+        self.qty = qty
+        self.tick = tick
+        self.policy = policy
+        self.order_id: int | None = None
+        self.price: float | None = None
+        self.queue_ahead = 0.0
+        self.requests = 0
+        self.rejects = 0
+        self.last_request = 0.0
+        self.polled_at = 0.0
+
+
+class RepricingEngine:
+    """Перестановка post-only ордеров по событиям стакана.
+
+    Слушает обновления локальных стаканов и пользовательского потока:
+    считает EWMA волатильности середины спреда и будит ожидающих
+    (wait/wait_async) при каждом событии по их символу.
+    """
+
+    def __init__(
+        self,
+        best: Callable[[str], dict | None],
+        level_qty: Callable[[str, str, float], float | None],
+        policy: RepricingPolicy | None = None,
+        min_amend_interval: float = MIN_AMEND_INTERVAL
+    ):
+        self._best = best
+        self._level_qty = level_qty
+        self.policy = policy or AdaptivePolicy()
+        self.min_amend_interval = min_amend_interval
+        self._cond = Condition()
+        self._seq: dict[str, int] = {}
+        self._mid: dict[str, float] = {}
+        self._volatility: dict[str, float] = {}
+        self._waiters: dict[str, list[tuple]] = {}
+
+    def _wake(self, symbol: str) -> None:
+        with self._cond:
+            self._seq[symbol] = self._seq.get(symbol, 0) + 1
+            self._cond.notify_all()
+            for loop, fut in self._waiters.pop(symbol, []):
+                loop.call_soon_threadsafe(_set_future_result, fut)
+
+    def on_book_update(self, symbol: str) -> None:
+        book = self._best(symbol)
+        if book:
+            mid = (book['bid'] + book['ask']) / 2
+            prev = self._mid.get(symbol)
+            if prev is not None:
+                vol = self._volatility.get(symbol, 0.0)
+                self._volatility[symbol] = vol + VOLATILITY_ALPHA * (abs(mid - prev) - vol)
+            self._mid[symbol] = mid
+        self._wake(symbol)
+
+    def on_order_update(self, event: dict) -> None:
+        symbol = event.get('o', {}).get('s')
+        if symbol:
+            self._wake(symbol)
+
+    def volatility(self, symbol: str) -> float:
+        return self._volatility.get(symbol, 0.0)
+
+    def seq(self, symbol: str) -> int:
+        return self._seq.get(symbol, 0)
+
+    def wait(self, symbol: str, seq: int, timeout: float) -> bool:
+        """Ждёт события по символу после seq; False по таймауту."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._seq.get(symbol, 0) != seq, timeout)
+
+    async def wait_async(self, symbol: str, seq: int, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        with self._cond:
+            if self._seq.get(symbol, 0) != seq:
+                return True
+            entry = (loop, fut)
+            self._waiters.setdefault(symbol, []).append(entry)
+        try:
+            await asyncio.wait_for(fut, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._cond:
+                waiters = self._waiters.get(symbol)
+                if waiters and entry in waiters:
+                    waiters.remove(entry)
+                    if not waiters:
+                        del self._waiters[symbol]
+
+    def chase(self, symbol: str, side: str, qty: float, tick: float, policy: RepricingPolicy | None = None) -> Chase:
+        return Chase(symbol, side, qty, tick, policy or self.policy)
+
+    def decide(self, chase: Chase, bid: float, ask: float) -> float | None:
+        """Новая цена для ордера или None, если его стоит оставить (или amend пока рано)."""
+        if chase.price is not None:
+            level = self._level_qty(chase.symbol, chase.side, chase.price)
+            if level is not None:
+                # Очередь перед нами может только убывать; свой объём в уровне не считаем
+                chase.queue_ahead = min(chase.queue_ahead, max(0.0, level - chase.qty))
+        quote = Quote(
+            side=chase.side,
+            bid=bid,
+            ask=ask,
+            tick=chase.tick,
+            own_price=chase.price,
+            own_qty=chase.qty,
+            queue_ahead=chase.queue_ahead,
+            volatility_ticks=self.volatility(chase.symbol) / chase.tick
+        )
+        price = chase.policy.reprice(quote)
+        if price is None or (chase.price is not None and abs(price - chase.price) < chase.tick / 2):
+            return None
+        # В шумном рынке amend-ы реже: интервал растёт с волатильностью
+        interval = self.min_amend_interval * (1 + quote.volatility_ticks)
+        if chase.requests and time.monotonic() - chase.last_request < interval:
+            return None
+        return price
+
+    def placed(self, chase: Chase, order_id: int, price: float) -> None:
+        chase.order_id = order_id
+        chase.price = price
+        chase.requests += 1
+        chase.last_request = time.monotonic()
+        level = self._level_qty(chase.symbol, chase.side, price)
+        chase.queue_ahead = level or 0.0
+
+    def rejected(self, chase: Chase) -> None:
+        chase.rejects += 1
+        chase.requests += 1
+        chase.last_request = time.monotonic()
+
+    def dropped(self, chase: Chase) -> None:
+        """Ордер снят не нами (отменён/истёк) — следующий decide выставит новый."""
+        chase.order_id = None
+        chase.price = None
+
+
+def _set_future_result(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(True)
@@ -0,0 +1,186 @@
+import time
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Callable, Iterable
+
+from app.config import settings
+from app.account_state import PositionState
+from app import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+ANY_SYMBOL = "*"
+RATE_WINDOW = 60.0
+REJECT_REASONS = ("duplicate", "max_position", "max_leverage", "price_band", "max_notional", "order_rate")
+
+risk_rejects_total = metrics.register(metrics.Counter(
+    "risk_rejects_total", "Pre-trade risk rejections by reason", ("reason",)
+))
+
+
+class RiskRejected(ValueError):
+    """Сигнал или ордер не прошёл предторговую проверку; reason — код для метрик."""
+
+    def __init__(self, reason: str, detail: str):
+        super().__init__(f"Risk check failed ({reason}): {detail}")
+        self.reason = reason
+
+
+@dataclass(slots=True)
+class RiskLimits:
+    """Лимиты предторговых проверок; 0 или пусто — проверка выключена."""
+    max_position: dict[str, float] = field(default_factory=dict)  # символ или "*" -> модуль позиции
+    max_notional: float = 0.0  # модуль позиции после ордера в котируемой валюте
+    max_leverage: int = 0
+    max_orders_per_minute: int = 0  # на аккаунт
+    duplicate_window: float = 0.0  # секунды, в которые одинаковый сигнал считается повтором
+    price_band_bps: float = 0.0  # отклонение лимитной цены от середины стакана
+
+    @classmethod
+    def from_settings(cls) -> "RiskLimits":
+        return cls(
+            max_position=settings.risk_max_position,
+            max_notional=settings.risk_max_notional,
+            max_leverage=settings.risk_max_leverage,
+            max_orders_per_minute=settings.risk_max_orders_per_minute,
+            duplicate_window=settings.risk_duplicate_window,
+            price_band_bps=settings.risk_price_band_bps,
+        )
+
+    def position_limit(self, symbol: str) -> float:
+        return self.max_position.get(symbol, self.max_position.get(ANY_SYMBOL, 0.0))
+
+
+class RiskEngine:
+    """Предторговые проверки по состоянию в памяти, без REST.
+
+    Позиция и плечо берутся из AccountState аккаунта, цены — из локального
+    стакана (best). Закрытия позиций не ограничиваются: снижение риска
+    проходит всегда. Каждый отказ — RiskRejected с причиной и счётчиком.
+    """
+
+    def __init__(
+        self,
+        limits: RiskLimits,
+        best: Callable[[str], dict | None],
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.limits = limits
+        self._best = best
+        self._clock = clock
+        self._lock = Lock()
+        self._recent: dict[tuple, float] = {}  # отпечаток сигнала -> когда принят
+        self._orders: dict[str, deque[float]] = {}  # аккаунт -> время выставленных ордеров
+
+    def _reject(self, reason: str, detail: str) -> None:
+        risk_rejects_total.inc((reason,))
+        logger.warning(f"Risk reject ({reason}): {detail}")
+        raise RiskRejected(reason, detail)
+
+    def check_duplicate(self, account: str, *fingerprint) -> None:
+        """Повтор того же сигнала для аккаунта в пределах duplicate_window отклоняется."""
+        self.check_duplicates([account], *fingerprint)
+
+    def check_duplicates(self, accounts: Iterable[str], *fingerprint) -> None:
+        """То же для сигнала на несколько аккаунтов: повтор хотя бы у одного отклоняет весь сигнал.
+
+        Сигнал запоминается для всех аккаунтов сразу и только если повторов нет.
+        """
+        window = self.limits.duplicate_window
+        if window <= 0:
+            return
+        keys = [(account, *fingerprint) for account in accounts]
+        now = self._clock()
+        with self._lock:
+            duplicates = [k[0] for k in keys if k in self._recent and now - self._recent[k] < window]
+            if not duplicates:
+                for key in keys:
+                    self._recent[key] = now
+                if len(self._recent) > 10000:
+                    self._recent = {k: t for k, t in self._recent.items() if now - t < window}
+        if duplicates:
+            self._reject("duplicate", f"same signal for {', '.join(duplicates)} within {window:g}s: {fingerprint}")
+
+    def check_order(
+        self,
+        account: str,
+        position: PositionState,
+        side: str,
+        quantity: float,
+        price: float | None = None,
+        leverage: int | None = None,
+        count_rate: bool = True
+    ) -> None:
+        """Проверки ордера, увеличивающего или открывающего позицию; при успехе занимает место в лимите частоты.
+
+        count_rate=False — ордер будет нарезан на дочерние, и частоту проверяет каждый из них (check_order_rate).
+        """
+        limits = self.limits
+        symbol = position.symbol
+        signed = quantity if side == "BUY" else -quantity
+        projected = position.amount + signed
+        if abs(projected) <= abs(position.amount):
+            return  # ордер сокращает позицию
+
+        max_position = limits.position_limit(symbol)
+        if max_position and abs(projected) > max_position:
+            self._reject("max_position", f"{symbol} position would be {projected:g}, limit {max_position:g}")
+
+        lev = leverage if leverage is not None else position.leverage
+        if limits.max_leverage and lev > limits.max_leverage:
+            self._reject("max_leverage", f"{symbol} leverage {lev}x above limit {limits.max_leverage}x")
+
+        if limits.max_notional or (price is not None and limits.price_band_bps):
+            best = self._best(symbol)
+            mid = (best["bid"] + best["ask"]) / 2 if best else None
+            if price is not None and limits.price_band_bps and mid:
+                deviation = abs(price - mid) / mid * 1e4
+                if deviation > limits.price_band_bps:
+                    self._reject(
+                        "price_band",
+                        f"{symbol} price {price:g} is {deviation:.0f} bps from mid {mid:g}, "
+                        f"band {limits.price_band_bps:g} bps"
+                    )
+            ref = price or mid or position.entry_price
+            if limits.max_notional and ref and abs(projected) * ref > limits.max_notional:
+                self._reject(
+                    "max_notional",
+                    f"{symbol} position notional would be {abs(projected) * ref:.2f}, limit {limits.max_notional:g}"
+                )
+
+        if count_rate:
+            self.check_order_rate(account)
+
+    def check_order_rate(self, account: str) -> None:
+        """Лимит выставленных на биржу ордеров аккаунта за минуту; при успехе занимает место в нём."""
+        limit = self.limits.max_orders_per_minute
+        if not limit:
+            return
+        now = self._clock()
+        with self._lock:
+            times = self._orders.setdefault(account, deque())
+            while times and now - times[0] >= RATE_WINDOW:
+                times.popleft()
+            limited = len(times) >= limit
+            if not limited:
+                times.append(now)
+        if limited:
+            self._reject("order_rate", f"{account} placed {limit} orders in the last minute")
+
+    def status(self) -> dict:
+        limits = self.limits
+        return {
+            "limits": {
+                "max_position": dict(limits.max_position),
+                "max_notional": limits.max_notional,
+                "max_leverage": limits.max_leverage,
+                "max_orders_per_minute": limits.max_orders_per_minute,
+                "duplicate_window": limits.duplicate_window,
+                "price_band_bps": limits.price_band_bps,
+            },
+            "rejects": {reason: risk_rejects_total.value((reason,)) for reason in REJECT_REASONS},
+            "rejects_total": risk_rejects_total.total(),
+        }
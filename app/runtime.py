@@ -0,0 +1,155 @@
+"""Общий рантайм процесса: потоки биржи, фоновые сервисы и встроенный Telegram-бот.
+
+Flask-приложение (app.main) и бот живут в одном процессе и делят клиентов,
+локальные стаканы, трекер ордеров, журнал и замки символов. Каждый аккаунт
+(app.accounts) приносит свой клиент, лимиты, позиции и журнал.
+"""
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Thread
+
+from app.config import settings
+from app import websocket_manager
+from app.accounts import POOL_SIZE, journal_symbols
+from app.clock_sync import clock_sync
+from app.depth_recorder import DepthRecorder
+from app.warmup import Stage, WarmUp
+from app.binance_client import _client, symbol_metadata, account_state, trade_journal, accounts, default_account
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+WARM_CONNECTIONS = 4  # keep-alive TLS-соединений на аккаунт, открываемых при прогреве
+
+_lock = Lock()
+_services_started = False
+_bot_thread: Thread | None = None
+recorder: DepthRecorder | None = None
+
+
+def _warm_streams() -> str:
+    # Первым: стаканы догружаются, пока идут остальные этапы
+    websocket_manager.start(_client, trades=True)
+    return f"{len(settings.symbols)} symbols"
+
+
+def _warm_metadata() -> str:
+    symbol_metadata.start()
+    symbol_metadata.ensure_loaded()
+    return f"{len(symbol_metadata.symbols())} symbols"
+
+
+def _warm_clock() -> str:
+    # Часы биржи одни на все аккаунты; дальше ClockSync досинхронизируется в фоне
+    offset = clock_sync.start(lambda: _client.futures_time()["serverTime"])
+    return f"offset {offset:+.0f}ms, recvWindow {clock_sync.recv_window()}ms"
+
+
+def _warm_connections() -> str:
+    # Параллельные ping открывают несколько соединений пула сразу, TLS-рукопожатия не достаются сигналам
+    n = min(WARM_CONNECTIONS, POOL_SIZE)
+    jobs = [a for a in accounts.all() for _ in range(n)]
+    with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="warm-tls") as pool:
+        list(pool.map(lambda a: a.client.futures_ping(), jobs))
+    return f"{n} per account"
+
+
+def _warm_accounts() -> str:
+    # Позиции и балансы — до первого сигнала: на них опираются риск-проверки
+    for account in accounts.all():
+        account.state.reconcile()
+    account_state.start()
+    trade_journal.start(journal_symbols)
+    # Стаканы и метаданные общие; у дополнительных аккаунтов — свои потоки, позиции и журналы
+    for account in accounts.all():
+        if account is not default_account:
+            account.start()
+    return ", ".join(a.id for a in accounts.all())
+
+
+def _warm_books() -> str:
+    deadline = time.monotonic() + settings.warmup_timeout
+    pending = set(settings.symbols)
+    while pending:
+        pending = {s for s in pending if not websocket_manager.get_book_version(s)}
+        if pending and time.monotonic() > deadline:
+            raise RuntimeError(f"Order books not synced in {settings.warmup_timeout:g}s: {', '.join(sorted(pending))}")
+        time.sleep(0.05)
+    return f"{len(settings.symbols)} books"
+
+
+# Без синхронных стаканов исполнение идёт через REST, поэтому готовность они не держат
+warmup = WarmUp([
+    Stage("streams", _warm_streams),
+    Stage("metadata", _warm_metadata),
+    Stage("clock", _warm_clock),
+    Stage("connections", _warm_connections),
+    Stage("accounts", _warm_accounts),
+    Stage("books", _warm_books, required=False),
+])
+
+
+def start_services() -> None:
+    """Запускает прогрев и фоновые сервисы один раз на процесс; сеть — только в фоне.
+
+    Старт воркера не ждёт биржу: готовность к трафику — warmup.ready (/ready).
+    """
+    global _services_started, recorder
+    with _lock:
+        if _services_started:
+            return
+        # Флаг — после проверки настроек: иначе после одной ошибки повторный вызов молча ничего не делает
+        settings.validate()
+        _services_started = True
+    if settings.record_dir:
+        recorder = DepthRecorder(settings.record_dir, websocket_manager.get_order_book_snapshot)
+        recorder.start()
+        websocket_manager.add_market_listener(recorder.on_market_event)
+    warmup.start()
+    logger.info(f"Warm-up started for accounts: {', '.join(a.id for a in accounts.all())}")
+
+
+def start_process() -> None:
+    """Точка входа процесса с HTTP: сервисы и, при RUN_TELEGRAM_BOT, встроенный бот.
+
+    Вызывается хуком gunicorn (gunicorn.conf.py) в воркере или из app.main при
+    запуске напрямую; импорт app.main ничего не запускает.
+    """
+    start_services()
+    if settings.run_telegram_bot:
+        start_telegram_bot()
+
+
+async def _run_bot(application) -> None:
+    # run_polling() хочет главный поток (сигналы), поэтому жизненный цикл ведём сами
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.updater.start_polling()
+    await application.start()
+    logger.info("Telegram bot started in the shared runtime")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        await application.shutdown()
+
+
+def start_telegram_bot() -> Thread:
+    """Запускает бота в отдельном потоке со своим event loop внутри этого процесса."""
+    global _bot_thread
+    with _lock:
+        if _bot_thread is not None:
+            return _bot_thread
+        from app.telegram_bot import build_application
+        application = build_application()
+        _bot_thread = Thread(
+            target=lambda: asyncio.run(_run_bot(application)), name="telegram-bot", daemon=True
+        )
+        _bot_thread.start()
+    return _bot_thread
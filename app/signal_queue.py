@@ -0,0 +1,138 @@
+import time
+import uuid
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field, asdict
+from threading import Condition, Thread
+from typing import Callable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+MAX_RECORDS = 10000
+
+
+@dataclass
+class SignalRecord:
+    signal_id: str
+    symbol: str
+    side: str
+    quantity: float
+    action: str
+    account: str = settings.default_account
+    # Параметры нарезки на дочерние ордера (algo, duration, ...); пусто — один ордер
+    params: dict = field(default_factory=dict)
+    status: str = "queued"
+    result: dict | None = None
+    received_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    replaced_by: str | None = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.account}:{self.symbol}"
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class SignalQueue:
+    """Очередь вебхук-сигналов с отдельным воркером на пару (аккаунт, символ).
+
+    Сигналы одного символа в одном аккаунте исполняются строго по порядку,
+    разные аккаунты — параллельно. Ещё не начатые
+    сигналы схлопываются: close отменяет ожидающие open, open в обратную
+    сторону отменяет ожидающий open, open в ту же сторону складывается
+    с ожидающим по количеству.
+    """
+
+    def __init__(self, execute: Callable[[SignalRecord], dict], max_records: int = MAX_RECORDS):
+        self._execute = execute
+        self._max_records = max_records
+        self._cond = Condition()
+        self._pending: dict[str, deque[SignalRecord]] = {}
+        self._workers: dict[str, Thread] = {}
+        self._records: OrderedDict[str, SignalRecord] = OrderedDict()
+
+    def _remember(self, record: SignalRecord) -> None:
+        self._records[record.signal_id] = record
+        while len(self._records) > self._max_records:
+            self._records.popitem(last=False)
+
+    def _coalesce(self, pending: deque[SignalRecord], record: SignalRecord) -> SignalRecord | None:
+        if record.action == "close":
+            for old in pending:
+                old.status, old.replaced_by = "superseded", record.signal_id
+            pending.clear()
+            return None
+        if not pending or pending[-1].action != "open":
+            return None
+        last = pending[-1]
+        if last.side != record.side:
+            last.status, last.replaced_by = "superseded", record.signal_id
+            pending.pop()
+            return None
+        if last.params != record.params:
+            return None
+        last.quantity += record.quantity
+        record.status, record.replaced_by = "coalesced", last.signal_id
+        return last
+
+    def submit(
+        self, symbol: str, side: str, quantity: float, action: str, account: str = settings.default_account,
+        params: dict | None = None
+    ) -> SignalRecord:
+        record = SignalRecord(uuid.uuid4().hex, symbol, side, quantity, action, account, params or {})
+        key = record.key
+        with self._cond:
+            self._remember(record)
+            pending = self._pending.setdefault(key, deque())
+            merged = self._coalesce(pending, record)
+            if merged is None:
+                pending.append(record)
+            worker = self._workers.get(key)
+            if worker is None or not worker.is_alive():
+                worker = Thread(target=self._worker, args=(key,), name=f"signals-{key}", daemon=True)
+                self._workers[key] = worker
+                worker.start()
+            self._cond.notify_all()
+        logger.info(f"Signal {record.signal_id} {action} {side} {symbol} {quantity} ({account}): {record.status}")
+        return record
+
+    def get(self, signal_id: str) -> SignalRecord | None:
+        return self._records.get(signal_id)
+
+    def depth(self) -> dict[str, int]:
+        """Ожидающие сигналы по символам (суммарно по аккаунтам)."""
+        depth: dict[str, int] = {}
+        with self._cond:
+            for q in self._pending.values():
+                if q:
+                    depth[q[0].symbol] = depth.get(q[0].symbol, 0) + len(q)
+        return depth
+
+    def _worker(self, key: str) -> None:
+        pending = self._pending[key]
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: pending, timeout=60):
+                    # Воркер простаивает — освобождаем поток, submit запустит новый
+                    del self._workers[key]
+                    return
+                record = pending.popleft()
+                record.status, record.started_at = "running", time.time()
+            try:
+                result = self._execute(record)
+            except Exception as e:
+                logger.exception(f"Signal {record.signal_id} failed")
+                result = {'status': 'error', 'detail': str(e)}
+            record.result = result
+            record.finished_at = time.time()
+            record.status = "done" if result.get("status") == "ok" else "failed"
+            logger.info(
+                f"Signal {record.signal_id} {record.status} in "
+                f"{record.finished_at - record.received_at:.3f}s: {result}"
+            )
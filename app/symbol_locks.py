@@ -0,0 +1,38 @@
+import asyncio
+from contextlib import asynccontextmanager
+from threading import Lock
+
+
+class SymbolLocks:
+    """Один замок исполнения на символ для всего процесса: webhook-потоки и Telegram-бот.
+
+    Замки обычные threading.Lock, поэтому их можно брать и из потоков Flask,
+    и из event loop бота (hold_async опрашивает замок, не блокируя loop).
+    """
+
+    def __init__(self):
+        self._locks: dict[str, Lock] = {}
+        self._guard = Lock()
+
+    def __getitem__(self, symbol: str) -> Lock:
+        lock = self._locks.get(symbol)
+        if lock is None:
+            with self._guard:
+                lock = self._locks.setdefault(symbol, Lock())
+        return lock
+
+    def busy(self) -> list[str]:
+        return [s for s, lock in list(self._locks.items()) if lock.locked()]
+
+    @asynccontextmanager
+    async def hold_async(self, symbol: str, poll_interval: float = 0.02):
+        lock = self[symbol]
+        while not lock.acquire(blocking=False):
+            await asyncio.sleep(poll_interval)
+        try:
+            yield
+        finally:
+            lock.release()
+
+
+symbol_locks = SymbolLocks()
@@ -0,0 +1,140 @@
+import math
+import time
+import logging
+from dataclasses import dataclass
+from decimal import Decimal
+from threading import Event, Lock, Thread
+from typing import Callable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+
+def _decimals(step: str) -> int:
+    exp = Decimal(step).normalize().as_tuple().exponent
+    return max(0, -exp)
+
+
+@dataclass(frozen=True, slots=True)
+class SymbolInfo:
+    symbol: str
+    status: str
+    tick_size: float
+    step_size: float
+    min_qty: float
+    min_notional: float
+    price_precision: int
+    qty_precision: int
+
+    def round_price(self, price: float) -> float:
+        return round(round(price / self.tick_size) * self.tick_size, self.price_precision)
+
+    def round_qty(self, qty: float) -> float:
+        # Количество всегда округляем вниз, чтобы не превысить запрошенный объём
+        steps = math.floor(qty / self.step_size + 1e-9)
+        return round(steps * self.step_size, self.qty_precision)
+
+    def format_price(self, price: float) -> str:
+        return f"{self.round_price(price):.{self.price_precision}f}"
+
+    def format_qty(self, qty: float) -> str:
+        return f"{self.round_qty(qty):.{self.qty_precision}f}"
+
+
+def parse_symbol(s: dict) -> SymbolInfo:
+    filters = {f["filterType"]: f for f in s.get("filters", [])}
+    pf = filters.get("PRICE_FILTER")
+    if pf is None:
+        raise ValueError(f"No PRICE_FILTER for symbol {s.get('symbol')}")
+    lot = filters.get("LOT_SIZE", {})
+    notional = filters.get("MIN_NOTIONAL", {})
+    step = lot.get("stepSize") or "1"
+    return SymbolInfo(
+        symbol=s["symbol"],
+        status=s.get("status", ""),
+        tick_size=float(pf["tickSize"]),
+        step_size=float(step),
+        min_qty=float(lot.get("minQty", 0.0)),
+        min_notional=float(notional.get("notional", notional.get("minNotional", 0.0))),
+        price_precision=_decimals(pf["tickSize"]),
+        qty_precision=_decimals(step),
+    )
+
+
+class SymbolMetadataCache:
+    """Индекс символ -> SymbolInfo, построенный из futures_exchange_info().
+
+    Загружается один раз и обновляется фоновым потоком раз в ttl секунд;
+    чтение не делает сетевых запросов.
+    """
+
+    def __init__(self, fetch: Callable[[], dict], ttl: float = 3600.0):
+        self._fetch = fetch
+        self.ttl = ttl
+        self._index: dict[str, SymbolInfo] = {}
+        self.loaded_at: float = 0.0
+        self._load_lock = Lock()
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def load(self) -> None:
+        info = self._fetch()
+        index = {}
+        for s in info.get("symbols", []):
+            try:
+                index[s["symbol"]] = parse_symbol(s)
+            except (KeyError, ValueError) as e:
+                logger.debug(f"Skipping symbol metadata: {e}")
+        # Подменяем словарь целиком: читатели видят либо старый, либо новый индекс
+        self._index = index
+        self.loaded_at = time.time()
+        logger.info(f"Symbol metadata loaded: {len(index)} symbols")
+
+    def ensure_loaded(self) -> None:
+        if self.loaded_at:
+            return
+        with self._load_lock:
+            if not self.loaded_at:
+                self.load()
+
+    def get(self, symbol: str) -> SymbolInfo:
+        self.ensure_loaded()
+        info = self._index.get(symbol)
+        if info is None:
+            raise ValueError(f"Unknown symbol {symbol}")
+        return info
+
+    def peek(self, symbol: str) -> SymbolInfo | None:
+        """Как get(), но без загрузки: None, если индекс ещё пуст или символа нет."""
+        return self._index.get(symbol)
+
+    def symbols(self) -> set[str]:
+        self.ensure_loaded()
+        return set(self._index)
+
+    def is_stale(self) -> bool:
+        return not self.loaded_at or time.time() - self.loaded_at > self.ttl
+
+    def start(self) -> None:
+        if not (self._thread and self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = Thread(target=self._refresh_loop, name="symbol-metadata", daemon=True)
+            self._thread.start()
+        try:
+            self.ensure_loaded()
+        except Exception as e:
+            logger.warning(f"Symbol metadata preload failed, will retry in background: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _refresh_loop(self) -> None:
+        # Пока индекс не загружен, повторяем чаще, чем раз в ttl
+        while not self._stop.wait(self.ttl if self.loaded_at else min(self.ttl, 30.0)):
+            try:
+                with self._load_lock:
+                    self.load()
+            except Exception as e:
+                logger.warning(f"Symbol metadata refresh failed, keeping cached copy: {e}")
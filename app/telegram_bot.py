@@ -1,20 +1,32 @@
 # File: app/telegram_bot.py
 
+import math
 import logging
 import asyncio
-from threading import Lock
 
 from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
 from telegram.request import HTTPXRequest
 
 from app.config import settings
+from app.accounts import Account
 from app.binance_client import (
+    accounts,
+    get_symbol_info,
+    order_scheduler,
+    risk_engine,
+)
+from app.async_binance_client import (
+    get_async_client,
+    close_async_client,
     get_position_amount,
     cancel_open_orders,
     place_post_only_with_retries,
-    _client,
+    flatten_positions,
 )
+from app import metrics, runtime
+from app.handlers import webhook_paused
+from app.symbol_locks import symbol_locks
 
 # Отключаем подробные логи httpx
 logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -23,32 +35,41 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-# Состояния бота
-webhook_lock = Lock()
-webhook_paused = False
+# Плечи, выставленные через бота: (аккаунт, символ) -> плечо; сделки и PnL — в журнале аккаунта
+leverage_map: dict[tuple[str, str], int] = {}
+
+
+def _split_accounts(args: list[str]) -> tuple[list[str], list[Account]]:
+    """Отделяет цели вида @sub1 / @group / @all от остальных аргументов команды."""
+    rest, targets = [], []
+    for a in args:
+        (targets if a.startswith("@") else rest).append(a.lstrip("@"))
+    return rest, accounts.resolve(targets)
+
 
-# Хранилища данных о плечах и сделках
-leverage_map: dict[str, int] = {}
-trade_records: dict[str, list[dict]] = {}  # symbol -> list of {"orderId","qty","price","commission"}
+def _account_header(account: Account) -> str:
+    # С одним аккаунтом ответы остаются прежними
+    return f"Аккаунт: {account.id}\n" if len(accounts.all()) > 1 else ""
 
 
 def pause(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global webhook_paused
-    webhook_paused = True
+    webhook_paused.set()
     return update.message.reply_text("Webhooks processing paused.")
 
 
 def resume(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global webhook_paused
-    webhook_paused = False
+    webhook_paused.clear()
     return update.message.reply_text("Webhooks processing resumed.")
 
 
 async def create_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    args = context.args
+    try:
+        args, targets = _split_accounts(context.args or [])
+    except ValueError as e:
+        return await update.message.reply_text(str(e))
     if len(args) < 4 or len(args) > 5:
         return await update.message.reply_text(
-            "Usage: /create_order <SYMBOL> <BUY|SELL> <AMOUNT> <LEVERAGE> [PRICE]"
+            "Usage: /create_order <SYMBOL> <BUY|SELL> <AMOUNT> <LEVERAGE> [PRICE] [@ACCOUNT|@GROUP ...]"
         )
 
     symbol = args[0].upper()
@@ -57,86 +78,82 @@ async def create_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     lev    = int(args[3])
     price  = float(args[4]) if len(args) == 5 else None
 
-    # Закрываем противоположную позицию
+    async def run(account: Account):
+        # Тот же замок, что и у вебхуков: по символу аккаунта не уходят встречные ордера
+        try:
+            async with symbol_locks.hold_async(account.lock_key(symbol)):
+                await _create_order(update, account, symbol, side, qty, lev, price)
+        except Exception as e:
+            logger.exception(f"create_order {symbol} ({account.id}) failed")
+            await update.message.reply_text(f"{_account_header(account)}Ошибка: {e}")
+
+    await asyncio.gather(*(run(a) for a in targets))
+
+
+async def _create_order(
+    update: Update, account: Account, symbol: str, side: str, qty: float, lev: int, price: float | None
+):
+    client = await get_async_client(account)
+
     signed_qty   = qty if side == "BUY" else -qty
-    existing_amt = get_position_amount(symbol)
+    position = account.state.position(symbol)
+    if position.amount * signed_qty < 0:
+        position.amount = 0.0  # противоположная позиция ниже закрывается целиком
+    risk_engine.check_order(account.id, position, side, qty, price=price, leverage=lev)
+
+    # Закрываем противоположную позицию
+    existing_amt = await get_position_amount(symbol, account)
     if existing_amt and existing_amt * signed_qty < 0:
-        cancel_open_orders(symbol)
+        await cancel_open_orders(symbol, account=account)
         opp_side = "SELL" if existing_amt > 0 else "BUY"
-        close_ord = place_post_only_with_retries(symbol, opp_side, abs(existing_amt))
+        close_ord = await place_post_only_with_retries(symbol, opp_side, abs(existing_amt), account=account)
         await update.message.reply_text(
-            f"Closed existing position: order_id={close_ord['orderId']}"
+            f"{_account_header(account)}Closed existing position: order_id={close_ord['orderId']}"
         )
 
     # Устанавливаем плечо
-    leverage_map[symbol] = lev
-    cancel_open_orders(symbol)
+    leverage_map[(account.id, symbol)] = lev
+    await cancel_open_orders(symbol, account=account)
     try:
-        _client.futures_change_leverage(symbol=symbol, leverage=lev)
+        await client.futures_change_leverage(symbol=symbol, leverage=lev)
     except Exception as e:
         logger.warning(f"Leverage set failed: {e}")
 
     # Ставим ордер
     if price is not None:
-        order = _client.futures_create_order(
+        order = await client.futures_create_order(
             symbol=symbol,
             side=side,
             type="LIMIT",
             timeInForce="GTC",
-            price=f"{price:.8f}",
-            quantity=str(qty),
+            price=get_symbol_info(symbol).format_price(price),
+            quantity=get_symbol_info(symbol).format_qty(qty),
         )
     else:
-        order = place_post_only_with_retries(symbol, side, qty)
+        order = await place_post_only_with_retries(symbol, side, qty, account=account)
 
     order_id = order["orderId"]
 
-    # Ждём, чтобы сделки появились в истории
-    await asyncio.sleep(1)
-
-    # Получаем трейды этого ордера
-    all_trades   = _client.futures_account_trades(symbol=symbol)
-    entry_trades = [t for t in all_trades if t["orderId"] == order_id]
-
-    total_qty   = sum(abs(float(t["qty"])) for t in entry_trades)
-    entry_price = (
-        sum(float(t["price"]) * abs(float(t["qty"])) for t in entry_trades) / total_qty
-        if total_qty else 0.0
-    )
-    entry_comm  = sum(
-        float(t["commission"])
-        for t in entry_trades
-        if t.get("commissionAsset") == "USDT"
-    )
-
-    # DEBUG: raw fills and calculations
-    logger.debug(f"[DEBUG {symbol}] entry_trades for {order_id}: {entry_trades!r}")
-    logger.debug(
-        f"[DEBUG {symbol}] total_qty={total_qty}, "
-        f"entry_price={entry_price:.8f}, entry_comm={entry_comm:.8f}"
-    )
-
-    # Сохраняем запись
-    trade_records.setdefault(symbol, []).append({
-        "orderId":   order_id,
-        "qty":       signed_qty,
-        "price":     entry_price,
-        "commission": entry_comm
-    })
+    # Исполнения ордера приходят в журнал из пользовательского потока
+    fills = await asyncio.to_thread(account.journal.wait_for_order, order_id, qty)
+    entry_price = fills.avg_price if fills else 0.0
+    entry_comm  = fills.commission if fills else 0.0
+    logger.debug(f"[DEBUG {symbol}] fills for {order_id}: {fills!r}")
 
     # Маржа и ликвидация
-    pos = next(x for x in _client.futures_position_information(symbol=symbol) if x["symbol"] == symbol)
-    margin_used = float(pos.get("initialMargin", 0.0))
-    liq_price   = float(pos.get("liquidationPrice", 0.0))
+    state = account.state
+    if not state.is_fresh():
+        await asyncio.to_thread(state.reconcile)
+    pos = state.position(symbol)
+    margin_used = pos.initial_margin
+    liq_price   = pos.liquidation_price
 
     # Баланс USDT
-    usdt_balance = next(
-        (float(a["balance"]) for a in _client.futures_account_balance() if a["asset"] == "USDT"),
-        0.0
-    )
+    usdt_balance = state.balance("USDT")
 
     # Ответ в Telegram
     await update.message.reply_text(
+        f"{_account_header(account)}"
         f"Символ: {symbol}\n"
         f"Направление: {side}\n"
         f"Количество: {signed_qty}\n"
@@ -150,32 +167,40 @@ async def create_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def active_trade(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    positions = _client.futures_position_information()
-    msgs = []
-    for p in positions:
-        amt = float(p.get("positionAmt", 0))
-        if not amt:
-            continue
-        sym = p["symbol"]
-        recs = trade_records.get(sym, [])
-        total_in_qty = sum(abs(r["qty"]) for r in recs)
-        entry_price = (
-            sum(r["price"] * abs(r["qty"]) for r in recs) / total_in_qty
-            if total_in_qty else float(p.get("entryPrice", 0.0))
-        )
-        entry_comm = sum(r["commission"] for r in recs)
+    try:
+        _, targets = _split_accounts(context.args or [])
+    except ValueError as e:
+        return await update.message.reply_text(str(e))
+    msgs = [m for chunk in await asyncio.gather(*(_active_trades(a) for a in targets)) for m in chunk]
+    await update.message.reply_text("\n\n".join(msgs) or "No active positions.")
+
 
-        mark_price = float(_client.futures_mark_price(symbol=sym)["markPrice"])
+async def _active_trades(account: Account) -> list[str]:
+    client = await get_async_client(account)
+    if not account.state.is_fresh():
+        await asyncio.to_thread(account.state.reconcile)
+    msgs = []
+    for p in account.state.positions():
+        amt = p.amount
+        sym = p.symbol
+        ledger = account.journal.ledger(sym)
+        # Журнал мог пропустить сделки до первого запуска — тогда берём цену входа биржи
+        tracked = abs(ledger.qty - amt) < 1e-9
+        entry_price = ledger.entry_price if tracked else p.entry_price
+        entry_comm = ledger.entry_commission if tracked else 0.0
+
+        mark_price = float((await client.futures_mark_price(symbol=sym))["markPrice"])
         pnl_gross  = (mark_price - entry_price) * amt
         pnl_net    = pnl_gross - entry_comm
 
-        margin_used = float(p.get("initialMargin", 0.0))
-        liq_price   = float(p.get("liquidationPrice", 0.0))
-        # lev         = leverage_map.get(sym, int(p.get("leverage", 1)))
-        lev         = int(p.get("leverage", 1))
+        margin_used = p.initial_margin
+        liq_price   = p.liquidation_price
+        # lev         = leverage_map.get(sym, p.leverage)
+        lev         = p.leverage
         side_str    = "LONG" if amt > 0 else "SHORT"
 
         msgs.append(
+            f"{_account_header(account)}"
             f"Символ: {sym}\n"
             f"Направление: {side_str}\n"
             f"Количество: {amt}\n"
@@ -187,81 +212,169 @@ async def active_trade(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Комиссия входа: {entry_comm:.8f}\n"
             f"PNL нетто: {pnl_net:.8f}"
         )
-    await update.message.reply_text("\n\n".join(msgs) or "No active positions.")
+    return msgs
 
 
-async def close_trades(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    for symbol, recs in list(trade_records.items()):
-        amt = get_position_amount(symbol)
-        if not amt:
+def _parse_close_args(args: list[str]) -> tuple[list[str], float | None]:
+    symbols, deadline = [], None
+    for a in args:
+        try:
+            deadline = float(a)
+        except ValueError:
+            symbols.append(a.upper())
             continue
+        if not (math.isfinite(deadline) and deadline > 0):
+            raise ValueError(f"DEADLINE must be a positive number of seconds, got {a}")
+    return symbols, deadline
 
-        side = "SELL" if amt > 0 else "BUY"
-        cancel_open_orders(symbol)
-        order = place_post_only_with_retries(symbol, side, abs(amt))
-        close_id = order["orderId"]
-
-        await asyncio.sleep(1)
-        all_trades  = _client.futures_account_trades(symbol=symbol)
-        exit_trades = [t for t in all_trades if t["orderId"] == close_id]
 
-        total_exit_qty = sum(abs(float(t["qty"])) for t in exit_trades)
-        exit_price     = (
-            sum(float(t["price"]) * abs(float(t["qty"])) for t in exit_trades) / total_exit_qty
-            if total_exit_qty else 0.0
-        )
-        exit_comm      = sum(
-            float(t["commission"])
-            for t in exit_trades
-            if t.get("commissionAsset") == "USDT"
-        )
+async def close_trades(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/close_trades [SYMBOL ...] [DEADLINE] [@ACCOUNT|@GROUP ...] — закрывает позиции параллельно.
 
-        # DEBUG: raw exit fills and calculations
-        logger.debug(f"[DEBUG {symbol}] exit_trades for {close_id}: {exit_trades!r}")
-        logger.debug(
-            f"[DEBUG {symbol}] total_exit_qty={total_exit_qty}, "
-            f"exit_price={exit_price:.8f}, exit_comm={exit_comm:.8f}"
+    Без DEADLINE закрывает только post-only ордерами; с DEADLINE (секунды)
+    остаток по истечении срока закрывается рыночным reduceOnly ордером.
+    Аккаунты закрываются одновременно, каждый в пределах своих лимитов.
+    """
+    try:
+        args, targets = _split_accounts(context.args or [])
+        symbols, deadline = _parse_close_args(args)
+    except ValueError as e:
+        return await update.message.reply_text(str(e))
+    await asyncio.gather(*(_close_trades(update, a, symbols, deadline) for a in targets))
+
+
+async def _close_trades(update: Update, account: Account, symbols: list[str], deadline: float | None):
+    state, journal, header = account.state, account.journal, _account_header(account)
+    if not state.is_fresh():
+        await asyncio.to_thread(state.reconcile)
+    positions = {p.symbol: p for p in state.positions()}
+    targets = [s for s in (symbols or positions) if s in positions]
+    if not targets:
+        return await update.message.reply_text(f"{header}No active positions.")
+
+    # Цены и комиссии входа фиксируем до закрытия: после него журнал их обнулит
+    entries = {}
+    for symbol in targets:
+        p = positions[symbol]
+        ledger = journal.ledger(symbol)
+        tracked = abs(ledger.qty - p.amount) < 1e-9
+        entries[symbol] = (
+            p.amount,
+            ledger.entry_price if tracked else p.entry_price,
+            ledger.entry_commission if tracked else 0.0
         )
+    mode = f", market after {deadline:g}s" if deadline is not None else ""
+    await update.message.reply_text(f"{header}Closing {len(targets)} positions{mode}: {', '.join(targets)}")
+
+    async def report(res: dict):
+        symbol = res['symbol']
+        amt, entry_price, entry_comm = entries[symbol]
+        if res['status'] == 'failed':
+            return await update.message.reply_text(f"{header}Символ: {symbol}\nОшибка закрытия: {res['error']}")
+        exit_qty = exit_notional = exit_comm = 0.0
+        for order_id, qty in res['orders']:
+            fills = await asyncio.to_thread(journal.wait_for_order, order_id, qty)
+            if fills:
+                exit_qty += fills.qty
+                exit_notional += fills.notional
+                exit_comm += fills.commission
+        exit_price = exit_notional / exit_qty if exit_qty else 0.0
+        logger.debug(f"[DEBUG {symbol}] close result {res!r}, exit_qty={exit_qty}")
 
-        total_in_qty = sum(abs(r["qty"]) for r in recs)
-        entry_price  = (
-            sum(r["price"] * abs(r["qty"]) for r in recs) / total_in_qty
-            if total_in_qty else 0.0
-        )
-        entry_comm   = sum(r["commission"] for r in recs)
         total_comm   = entry_comm + exit_comm
         pnl          = (exit_price - entry_price) * amt - total_comm
-
-        usdt_balance = next(
-            (float(a["balance"]) for a in _client.futures_account_balance() if a["asset"] == "USDT"),
-            0.0
-        )
+        usdt_balance = state.balance("USDT")
 
         await update.message.reply_text(
+            f"{header}"
             f"Символ: {symbol}\n"
-            f"Направление: {side}\n"
+            f"Направление: {'SELL' if amt > 0 else 'BUY'}\n"
             f"Количество: {amt}\n"
+            f"Способ: {res['mode']}\n"
             f"Цена входа: {entry_price}\n"
             f"Цена выхода: {exit_price}\n"
             f"Общая комиссия: {total_comm:.8f}\n"
             f"Реализованный PnL: {pnl:.8f}\n"
             f"Futures USDT баланс: {usdt_balance:.8f}"
         )
-        trade_records.pop(symbol, None)
+
+    await flatten_positions(targets, deadline=deadline, on_progress=report, account=account)
 
 
 async def close_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    for sym in settings.symbols:
-        cancel_open_orders(sym)
-    await update.message.reply_text("All open orders cancelled.")
+    """/close_orders [@ACCOUNT|@GROUP ...] — снимает открытые LIMIT-ордера по всем символам.
+
+    Защитные STOP/TAKE_PROFIT ордера остаются на месте.
+    """
+    try:
+        _, targets = _split_accounts(context.args or [])
+    except ValueError as e:
+        return await update.message.reply_text(str(e))
+    jobs = [(a, sym) for a in targets for sym in settings.symbols]
+    results = await asyncio.gather(
+        *(cancel_open_orders(sym, account=a) for a, sym in jobs), return_exceptions=True
+    )
+    failed = []
+    for (a, sym), res in zip(jobs, results):
+        if isinstance(res, Exception):
+            logger.error(f"Cancel of open orders for {sym} ({a.id}) failed: {res}")
+            failed.append(f"{sym} ({a.id}): {res}")
+        elif res:
+            failed.append(f"{sym} ({a.id}): " + "; ".join(str(r.get('msg')) for r in res))
+    if failed:
+        return await update.message.reply_text("Failed to cancel open orders:\n" + "\n".join(failed))
+    await update.message.reply_text("All open LIMIT orders cancelled.")
 
 
 async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    lines = [f"{a['asset']}: {a['balance']}" for a in _client.futures_account_balance()]
-    await update.message.reply_text("\n".join(lines) or "No balance data.")
+    try:
+        _, targets = _split_accounts(context.args or [])
+    except ValueError as e:
+        return await update.message.reply_text(str(e))
+    blocks = []
+    for account in targets:
+        if not account.state.is_fresh():
+            await asyncio.to_thread(account.state.reconcile)
+        lines = [f"{asset}: {amount}" for asset, amount in account.state.balances().items()]
+        if lines:
+            blocks.append(_account_header(account) + "\n".join(lines))
+    await update.message.reply_text("\n\n".join(blocks) or "No balance data.")
+
+
+async def parents(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        _, targets = _split_accounts(context.args or [])
+    except ValueError as e:
+        return await update.message.reply_text(str(e))
+    ids = {a.id for a in targets}
+    lines = [
+        f"{p.parent_id[:8]} {p.algo.name} {p.side} {p.symbol}: {p.filled}/{p.quantity} "
+        f"({p.children} children) {p.account}"
+        for p in order_scheduler.parents(active_only=True) if p.account in ids
+    ]
+    await update.message.reply_text("\n".join(lines) or "No active parent orders.")
 
 
-if __name__ == "__main__":
+async def cancel_parent(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.args:
+        return await update.message.reply_text("Usage: /cancel_parent <parent_id>")
+    prefix = context.args[0]
+    matched = [p for p in order_scheduler.parents(active_only=True) if p.parent_id.startswith(prefix)]
+    if len(matched) != 1:
+        return await update.message.reply_text(f"Parent order {prefix} not found or ambiguous.")
+    order_scheduler.cancel(matched[0].parent_id)
+    await update.message.reply_text(f"Parent order {matched[0].parent_id[:8]} cancelled.")
+
+
+async def on_startup(application):
+    application.create_task(metrics.monitor_event_loop_lag())
+
+
+async def on_shutdown(application):
+    await close_async_client()
+
+
+def build_application():
     request = HTTPXRequest(
         connect_timeout=5.0,
         read_timeout=30.0,
@@ -272,6 +385,9 @@ if __name__ == "__main__":
         ApplicationBuilder()
         .token(settings.telegram_token)
         .request(request)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .concurrent_updates(True)
         .build()
     )
 
@@ -282,5 +398,14 @@ if __name__ == "__main__":
     app.add_handler(CommandHandler("close_trades", close_trades))
     app.add_handler(CommandHandler("close_orders", close_orders))
     app.add_handler(CommandHandler("balance", balance))
+    app.add_handler(CommandHandler("parents", parents))
+    app.add_handler(CommandHandler("cancel_parent", cancel_parent))
+    return app
+
 
-    app.run_polling()
+if __name__ == "__main__":
+    # Отдельный процесс бота без HTTP; в Docker бот работает внутри app.main (RUN_TELEGRAM_BOT)
+    runtime.start_services()
+    if settings.metrics_port:
+        metrics.serve(settings.metrics_port)
+    build_application().run_polling()
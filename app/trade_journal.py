@@ -0,0 +1,360 @@
+import time
+import sqlite3
+import logging
+from dataclasses import dataclass, asdict
+from threading import Condition, Event, Lock, Thread
+from typing import Callable, Iterable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+FETCH_LIMIT = 1000
+SINCE_MARGIN_MS = 60_000  # запас на расхождение наших часов с биржей для курсора по времени
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fills (
+    symbol TEXT NOT NULL,
+    trade_id INTEGER NOT NULL,
+    order_id INTEGER NOT NULL,
+    side TEXT NOT NULL,
+    price REAL NOT NULL,
+    qty REAL NOT NULL,
+    commission REAL NOT NULL,
+    realized_pnl REAL NOT NULL,
+    maker INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    PRIMARY KEY (symbol, trade_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS orders (
+    order_id INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL,
+    qty REAL NOT NULL,
+    notional REAL NOT NULL,
+    commission REAL NOT NULL,
+    realized_pnl REAL NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ledgers (
+    symbol TEXT PRIMARY KEY,
+    qty REAL NOT NULL,
+    entry_price REAL NOT NULL,
+    entry_commission REAL NOT NULL,
+    realized_pnl REAL NOT NULL,
+    commission REAL NOT NULL,
+    last_trade_id INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cursors (
+    symbol TEXT PRIMARY KEY,
+    trade_id INTEGER NOT NULL,
+    since INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+@dataclass(slots=True)
+class Fill:
+    symbol: str
+    trade_id: int
+    order_id: int
+    side: str
+    price: float
+    qty: float
+    commission: float
+    realized_pnl: float
+    maker: bool
+    time: int
+
+
+@dataclass(slots=True)
+class OrderFills:
+    order_id: int
+    symbol: str
+    side: str
+    qty: float = 0.0
+    notional: float = 0.0
+    commission: float = 0.0
+    realized_pnl: float = 0.0
+
+    @property
+    def avg_price(self) -> float:
+        return self.notional / self.qty if self.qty else 0.0
+
+
+@dataclass(slots=True)
+class Ledger:
+    """Текущая позиция символа по журналу: VWAP входа, комиссии, реализованный PnL."""
+    symbol: str
+    qty: float = 0.0
+    entry_price: float = 0.0
+    entry_commission: float = 0.0
+    realized_pnl: float = 0.0
+    commission: float = 0.0
+    last_trade_id: int = 0
+
+    def apply(self, fill: Fill) -> None:
+        signed = fill.qty if fill.side == "BUY" else -fill.qty
+        self.commission += fill.commission
+        if self.qty == 0 or (self.qty > 0) == (signed > 0):
+            total = abs(self.qty) + fill.qty
+            self.entry_price = (abs(self.qty) * self.entry_price + fill.qty * fill.price) / total
+            self.entry_commission += fill.commission
+            self.qty += signed
+        else:
+            closing = min(fill.qty, abs(self.qty))
+            self.realized_pnl += closing * (fill.price - self.entry_price) * (1 if self.qty > 0 else -1)
+            # Комиссия входа списывается пропорционально закрытой части
+            self.entry_commission -= self.entry_commission * closing / abs(self.qty)
+            self.qty = round(self.qty + signed, 12)
+            opened = fill.qty - closing
+            if opened > 0:
+                self.entry_price = fill.price
+                self.entry_commission = fill.commission * opened / fill.qty
+            elif self.qty == 0:
+                self.entry_price = 0.0
+                self.entry_commission = 0.0
+        self.last_trade_id = max(self.last_trade_id, fill.trade_id)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def fill_from_event(event: dict) -> Fill | None:
+    """Fill из ORDER_TRADE_UPDATE с x=TRADE."""
+    o = event.get('o', {})
+    if o.get('x') != 'TRADE' or not float(o.get('l', 0)):
+        return None
+    return Fill(
+        symbol=o['s'],
+        trade_id=int(o['t']),
+        order_id=int(o['i']),
+        side=o['S'],
+        price=float(o['L']),
+        qty=float(o['l']),
+        commission=float(o.get('n') or 0) if o.get('N', 'USDT') == 'USDT' else 0.0,
+        realized_pnl=float(o.get('rp') or 0),
+        maker=bool(o.get('m')),
+        time=int(o.get('T') or event.get('E') or 0),
+    )
+
+
+def fill_from_rest(t: dict) -> Fill:
+    """Fill из ответа futures_account_trades."""
+    return Fill(
+        symbol=t['symbol'],
+        trade_id=int(t['id']),
+        order_id=int(t['orderId']),
+        side=t['side'],
+        price=float(t['price']),
+        qty=abs(float(t['qty'])),
+        commission=float(t['commission']) if t.get('commissionAsset', 'USDT') == 'USDT' else 0.0,
+        realized_pnl=float(t.get('realizedPnl', 0)),
+        maker=bool(t.get('maker')),
+        time=int(t.get('time', 0)),
+    )
+
+
+class TradeJournal:
+    """Append-only журнал исполнений в SQLite с агрегатами по ордерам и символам.
+
+    Исполнения приходят из пользовательского потока (on_order_update) и
+    догружаются через futures_account_trades по курсору fromId (catch_up);
+    повторы отбрасываются по (symbol, trade_id). Курсор REST хранится отдельно
+    и двигается только догрузкой: исполнения из потока его не сдвигают, иначе
+    пропущенные во время обрыва потока сделки были бы потеряны. Агрегаты
+    (Ledger, OrderFills) обновляются инкрементально, поэтому чтение — один
+    lookup без истории.
+    """
+
+    def __init__(self, path: str, fetch_trades: Callable[..., list[dict]] | None = None):
+        self.path = path
+        self._fetch_trades = fetch_trades
+        self._cond = Condition()
+        self._wakeup = Event()
+        self._thread: Thread | None = None
+        # Файл базы открывается при старте или первом обращении, не при импорте модулей клиента
+        self._conn: sqlite3.Connection | None = None
+        self._open_lock = Lock()
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        return self._conn or self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        with self._open_lock:
+            if self._conn is None:
+                # Транзакции открываем сами (BEGIN IMMEDIATE): журнал могут писать бот и веб-процесс
+                db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                db.executescript(_SCHEMA)
+                self._conn = db
+            return self._conn
+
+    def close(self) -> None:
+        with self._cond:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _load_ledger(self, symbol: str) -> Ledger:
+        row = self._db.execute(
+            "SELECT symbol, qty, entry_price, entry_commission, realized_pnl, commission, last_trade_id "
+            "FROM ledgers WHERE symbol = ?", (symbol,)
+        ).fetchone()
+        return Ledger(*row) if row else Ledger(symbol)
+
+    def _save_ledger(self, ledger: Ledger) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO ledgers VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (ledger.symbol, ledger.qty, ledger.entry_price, ledger.entry_commission,
+             ledger.realized_pnl, ledger.commission, ledger.last_trade_id)
+        )
+
+    def _load_cursor(self, symbol: str) -> tuple[int, int] | None:
+        """(trade_id, since) курсора REST; None — догрузок по символу ещё не было.
+
+        trade_id = 0 — сделок на момент догрузки не было: следующая идёт от since (мс).
+        Курсор никогда не выводится из записей потока (Ledger.last_trade_id).
+        """
+        return self._db.execute("SELECT trade_id, since FROM cursors WHERE symbol = ?", (symbol,)).fetchone()
+
+    def _save_cursor(self, symbol: str, trade_id: int, since: int = 0) -> None:
+        # Параллельные догрузки (фоновая и по переподключению) не откатывают курсор назад
+        self._db.execute(
+            "INSERT INTO cursors VALUES (?, ?, ?) ON CONFLICT(symbol) DO UPDATE SET "
+            "trade_id = max(trade_id, excluded.trade_id), since = max(since, excluded.since)",
+            (symbol, trade_id, since)
+        )
+
+    def record(self, fill: Fill) -> bool:
+        """Записывает исполнение; False, если оно уже есть в журнале."""
+        with self._cond:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                added = self._record(fill)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            if added:
+                self._cond.notify_all()
+        if added:
+            logger.debug(f"Journal {fill.symbol} trade {fill.trade_id}: {fill.side} {fill.qty}@{fill.price}")
+        return added
+
+    def _record(self, fill: Fill) -> bool:
+        cur = self._db.execute(
+            "INSERT OR IGNORE INTO fills VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (fill.symbol, fill.trade_id, fill.order_id, fill.side, fill.price, fill.qty,
+             fill.commission, fill.realized_pnl, int(fill.maker), fill.time)
+        )
+        if cur.rowcount == 0:
+            return False
+        self._db.execute(
+            "INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(order_id) DO UPDATE SET "
+            "qty = qty + excluded.qty, notional = notional + excluded.notional, "
+            "commission = commission + excluded.commission, "
+            "realized_pnl = realized_pnl + excluded.realized_pnl, updated_at = excluded.updated_at",
+            (fill.order_id, fill.symbol, fill.side, fill.qty, fill.qty * fill.price,
+             fill.commission, fill.realized_pnl, fill.time)
+        )
+        ledger = self._load_ledger(fill.symbol)
+        ledger.apply(fill)
+        self._save_ledger(ledger)
+        return True
+
+    def on_order_update(self, event: dict) -> None:
+        fill = fill_from_event(event)
+        if fill is not None:
+            self.record(fill)
+
+    def catch_up(self, symbol: str) -> int:
+        """Догружает исполнения после курсора REST; возвращает число новых."""
+        with self._cond:
+            saved = self._load_cursor(symbol)
+        checked_at = int(time.time() * 1000) - SINCE_MARGIN_MS
+        if saved is None:
+            # Первая догрузка: историю до запуска не импортируем, только ставим курсор —
+            # на последнюю сделку или, если сделок нет, на текущее время
+            latest = self._fetch_trades(symbol=symbol, limit=1)
+            with self._cond:
+                self._save_cursor(symbol, int(latest[-1]['id']) if latest else 0, checked_at)
+            return 0
+        cursor, since = saved
+        added = 0
+        while True:
+            if cursor:
+                batch = self._fetch_trades(symbol=symbol, fromId=cursor + 1, limit=FETCH_LIMIT)
+            else:
+                # Сделок ещё не было: всё, что появилось после прошлой проверки
+                batch = self._fetch_trades(symbol=symbol, startTime=since, limit=FETCH_LIMIT)
+                if not batch:
+                    with self._cond:
+                        self._save_cursor(symbol, 0, checked_at)
+            for t in batch:
+                added += self.record(fill_from_rest(t))
+                cursor = max(cursor, int(t['id']))
+            if batch:
+                with self._cond:
+                    self._save_cursor(symbol, cursor)
+            if len(batch) < FETCH_LIMIT:
+                break
+        if added:
+            logger.info(f"Journal {symbol}: caught up {added} fills")
+        return added
+
+    def catch_up_many(self, symbols: Iterable[str]) -> None:
+        for symbol in symbols:
+            try:
+                self.catch_up(symbol)
+            except Exception as e:
+                logger.warning(f"Journal catch-up for {symbol} failed: {e}")
+
+    def start(
+        self,
+        symbols: Callable[[], Iterable[str]],
+        interval: float = settings.journal_catch_up_interval,
+        name: str = "journal-catch-up"
+    ) -> None:
+        """Открывает журнал и запускает фоновую догрузку: сразу, затем каждые interval секунд и по request_catch_up()."""
+        if self._thread is not None:
+            return
+        self._open()  # ошибка открытия базы — ошибка этапа прогрева
+        self._thread = Thread(target=self._run, args=(symbols, interval), name=name, daemon=True)
+        self._thread.start()
+
+    def request_catch_up(self) -> None:
+        """Внеочередная догрузка, например после переподключения пользовательского потока."""
+        self._wakeup.set()
+
+    def _run(self, symbols: Callable[[], Iterable[str]], interval: float) -> None:
+        while True:
+            self.catch_up_many(symbols())
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+
+    def ledger(self, symbol: str) -> Ledger:
+        with self._cond:
+            return self._load_ledger(symbol)
+
+    def order(self, order_id: int) -> OrderFills | None:
+        with self._cond:
+            row = self._db.execute(
+                "SELECT order_id, symbol, side, qty, notional, commission, realized_pnl "
+                "FROM orders WHERE order_id = ?", (order_id,)
+            ).fetchone()
+        return OrderFills(*row) if row else None
+
+    def wait_for_order(self, order_id: int, qty: float, timeout: float = 2.0) -> OrderFills | None:
+        """Ждёт, пока в журнале наберётся qty исполнений ордера (события приходят асинхронно)."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                fills = self.order(order_id)
+                remaining = deadline - time.monotonic()
+                if (fills is not None and fills.qty >= qty - 1e-12) or remaining <= 0:
+                    return fills
+                self._cond.wait(remaining)
@@ -0,0 +1,83 @@
+import time
+import logging
+from dataclasses import dataclass
+from threading import Event, Thread
+from typing import Callable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+RETRY_INTERVAL = 5.0
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[], str | None]  # необязательная строка — подробности для /ready
+    required: bool = True
+    status: str = "pending"  # pending | running | ok | failed
+    detail: str | None = None
+    attempts: int = 0
+    seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "status": self.status, "required": self.required, "detail": self.detail,
+            "attempts": self.attempts, "seconds": round(self.seconds, 3),
+        }
+
+
+class WarmUp:
+    """Этапы прогрева процесса перед приёмом трафика.
+
+    Этапы идут по порядку в фоновом потоке. Упавший обязательный этап
+    повторяется каждые retry_interval секунд, пока не пройдёт; необязательный
+    отмечается failed и не держит готовность. ready ставится, когда все
+    обязательные этапы прошли.
+    """
+
+    def __init__(self, stages: list[Stage], retry_interval: float = RETRY_INTERVAL):
+        self.stages = stages
+        self.retry_interval = retry_interval
+        self.ready = Event()
+        self.started_at: float | None = None
+        self.ready_at: float | None = None
+        self._thread: Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = Thread(target=self.run, name="warm-up", daemon=True)
+            self._thread.start()
+
+    def run(self) -> None:
+        self.started_at = time.monotonic()
+        for stage in self.stages:
+            while not self._run_stage(stage) and stage.required:
+                time.sleep(self.retry_interval)
+        self.ready_at = time.monotonic()
+        self.ready.set()
+        logger.info(
+            f"Warm-up finished in {self.ready_at - self.started_at:.2f}s: "
+            + ", ".join(f"{s.name}={s.status} ({s.seconds:.2f}s)" for s in self.stages)
+        )
+
+    def _run_stage(self, stage: Stage) -> bool:
+        stage.status, stage.attempts = "running", stage.attempts + 1
+        started = time.monotonic()
+        try:
+            stage.detail = stage.run()
+            stage.status = "ok"
+        except Exception as e:
+            stage.status, stage.detail = "failed", str(e)
+            logger.warning(f"Warm-up stage {stage.name} failed (attempt {stage.attempts}): {e}")
+        stage.seconds = time.monotonic() - started
+        return stage.status == "ok"
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready.is_set(),
+            "seconds": round((self.ready_at or time.monotonic()) - self.started_at, 3) if self.started_at else None,
+            "stages": {s.name: s.as_dict() for s in self.stages},
+        }
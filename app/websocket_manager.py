@@ -1,35 +1,349 @@
+import time
 import logging
-from threading import Thread
-from binance import ThreadedWebsocketManager
+from functools import partial
+from threading import Thread, Lock
+from typing import TYPE_CHECKING, Callable
 from app.config import settings
+from app.market_hub import MarketDataHub
+from app.order_book import LocalOrderBook
+from app.order_tracker import order_tracker
+
+if TYPE_CHECKING:
+    from binance import ThreadedWebsocketManager
 
 logger = logging.getLogger(__name__)
 logger.setLevel(settings.log_level)
 
-_order_books: dict[str, dict] = {}
+_order_books: dict[str, LocalOrderBook] = {}
 
-latest_book = _order_books
+# События, пришедшие пока грузится REST-снимок: symbol -> buffered depthUpdate
+_pending: dict[str, list[dict]] = {}
+_sync_lock = Lock()
+_rest_client = None
+_started = False
+_symbols: set[str] = set()
+# Аккаунты с запущенным пользовательским потоком и их менеджеры (кроме основного _twm)
+_user_streams: set[str] = set()
+_user_twms: dict[str, "ThreadedWebsocketManager"] = {}
+
+# Подписчики на изменения локальных стаканов (получают symbol)
+_book_listeners: list[Callable[[str], None]] = []
+
+# Подписчики на сырые рыночные события: ("snapshot" | "depth" | "trade", payload)
+_market_listeners: list[Callable[[str, dict], None]] = []
+
+# Обработчики событий пользовательского потока: event type -> callbacks (для всех аккаунтов)
+_user_handlers: dict[str, list[Callable[[dict], None]]] = {
+    'ORDER_TRADE_UPDATE': [order_tracker.on_order_update],
+}
+# Обработчики конкретного аккаунта: account -> event type -> callbacks
+_account_handlers: dict[str, dict[str, list[Callable[[dict], None]]]] = {}
+# Вызываются, когда пользовательский поток аккаунта ожил после обрыва или тишины: account -> callbacks
+_resume_handlers: dict[str, list[Callable[[], None]]] = {}
+
+MAX_PENDING_EVENTS = 1000
+SNAPSHOT_LIMIT = 1000
+MANAGER_START_TIMEOUT = 15.0  # ожидание AsyncClient внутри потока менеджера
+
+_twm: "ThreadedWebsocketManager | None" = None
+_twm_lock = Lock()
+
+
+def _start_manager(api_key: str, api_secret: str) -> "ThreadedWebsocketManager":
+    """Запускает ThreadedWebsocketManager и ждёт его клиента.
+
+    AsyncClient.create выполняется в потоке менеджера; если он падает (нет DNS
+    при старте контейнера), поток умирает, а start_*_socket ждёт клиента вечно.
+    Поэтому ждём с таймаутом и бросаем исключение — прогрев повторит этап.
+    """
+    from binance import ThreadedWebsocketManager
+    twm = ThreadedWebsocketManager(api_key=api_key, api_secret=api_secret)
+    twm.start()
+    deadline = time.monotonic() + MANAGER_START_TIMEOUT
+    while twm._bsm is None:
+        if not twm.is_alive() or time.monotonic() > deadline:
+            twm.stop()
+            raise RuntimeError(f"Websocket manager did not start in {MANAGER_START_TIMEOUT:g}s")
+        time.sleep(0.05)
+    return twm
+
+
+def _live(twm: "ThreadedWebsocketManager | None", name: str) -> bool:
+    if twm is not None and not twm.is_alive():
+        logger.warning(f"Websocket manager {name} thread is dead, rebuilding it")
+        return False
+    return twm is not None
+
+
+def _manager():
+    """Основной ThreadedWebsocketManager; создаётся при первом сокете, не при импорте.
+
+    Менеджер с умершим потоком (вместе с ним умерли и его сокеты) пересоздаётся.
+    """
+    global _twm
+    with _twm_lock:
+        if not _live(_twm, settings.default_account):
+            _twm = None
+            _twm = _start_manager(settings.binance_api_key, settings.binance_api_secret)
+        return _twm
+
+
+def _stop_market_socket(name: str) -> None:
+    # Остановка не создаёт менеджер: без него сокета уже нет
+    if _twm is not None:
+        _twm.stop_socket(name)
+
+
+def _get_book(symbol: str) -> LocalOrderBook:
+    book = _order_books.get(symbol)
+    if book is None:
+        book = _order_books.setdefault(symbol, LocalOrderBook(symbol))
+    return book
+
+
+def _load_snapshot(symbol: str) -> None:
+    book = _get_book(symbol)
+    while True:
+        try:
+            snapshot = _rest_client.futures_order_book(symbol=symbol, limit=SNAPSHOT_LIMIT)
+        except Exception as e:
+            logger.warning(f"Depth snapshot for {symbol} failed ({e}), retrying")
+            time.sleep(1)
+            continue
+
+        with _sync_lock:
+            events = _pending.get(symbol, [])
+            book.apply_snapshot(snapshot)
+            if all(book.apply_diff(e) for e in events):
+                _pending.pop(symbol, None)
+                logger.info(f"Order book {symbol} synced at lastUpdateId={book.last_update_id}")
+                if _market_listeners:
+                    _notify_market("snapshot", book.top(SNAPSHOT_LIMIT))
+                _notify_book(symbol)
+                return
+            # Снимок старше буферизованных событий — берём новый
+            _pending[symbol] = []
+        logger.info(f"Order book {symbol} snapshot is behind the stream, reloading")
+
+
+def _resync(symbol: str, event: dict) -> None:
+    with _sync_lock:
+        if symbol in _pending:
+            return
+        _pending[symbol] = [event]
+    Thread(target=_load_snapshot, args=(symbol,), name=f"depth-sync-{symbol}", daemon=True).start()
 
-_twm = ThreadedWebsocketManager(
-    api_key=settings.binance_api_key,
-    api_secret=settings.binance_api_secret
-)
 
 def _on_depth_update(msg):
     payload = msg.get('data', msg)
+    event_type = payload.get('e')
+    if event_type == 'error':
+        logger.error(f"Depth stream error: {payload.get('m')}")
+        return
+    if event_type == 'aggTrade':
+        _notify_market("trade", payload)
+        return
+    if event_type in ('bookTicker', 'markPriceUpdate'):
+        # Последние значения хранит хаб (market_hub.latest)
+        return
     symbol = payload.get('s')
-    if not symbol:
-        return
-    bids = payload.get('b', [])
-    asks = payload.get('a', [])
-    _order_books[symbol] = {
-        'symbol': symbol,
-        'bids': bids,
-        'asks': asks,
-        'timestamp': payload.get('E')
-    }
-    logger.debug(f"Depth update {symbol}: bids={len(bids)}, asks={len(asks)}")
-
-def get_order_book_snapshot(symbol: str = 'ETHUSDT') -> dict:
-    default = {'symbol': symbol, 'bids': [], 'asks': [], 'timestamp': None}
-    return _order_books.get(symbol, default)
+    if not symbol or 'u' not in payload:
+        return
+
+    with _sync_lock:
+        pending = _pending.get(symbol)
+        if pending is not None:
+            if len(pending) < MAX_PENDING_EVENTS:
+                pending.append(payload)
+            return
+
+    book = _get_book(symbol)
+    if not book.apply_diff(payload):
+        if book.last_update_id:
+            logger.warning(
+                f"Depth gap for {symbol}: pu={payload.get('pu')} "
+                f"last={book.last_update_id}, resyncing"
+            )
+        _resync(symbol, payload)
+        return
+    logger.debug(f"Depth update {symbol}: u={payload['u']} E={payload.get('E')}")
+    if _market_listeners:
+        _notify_market("depth", payload)
+    _notify_book(symbol)
+
+
+def _drop_symbols(symbols: list[str]) -> None:
+    # Хаб снял простаивающие символы, добавленные на лету: их стаканы больше не обновляются
+    with _sync_lock:
+        for symbol in symbols:
+            _symbols.discard(symbol)
+            _order_books.pop(symbol, None)
+            _pending.pop(symbol, None)
+
+
+market_hub = MarketDataHub(
+    start_socket=lambda streams, callback: _manager().start_futures_multiplex_socket(
+        callback=callback, streams=streams
+    ),
+    stop_socket=_stop_market_socket,
+    on_message=_on_depth_update,
+    channels=settings.market_channels,
+    stall_timeout=settings.stream_stall_timeout,
+    idle_ttl=settings.dynamic_symbol_ttl,
+    on_remove=_drop_symbols,
+)
+
+
+def start(rest_client, symbols: list[str] | None = None, trades: bool = False) -> None:
+    """Рыночные потоки символов через хаб (aggTrade обязательно при trades) плюс пользовательский поток."""
+    global _rest_client, _started
+    if _started:
+        return
+    # Шаги повторяемы: при ошибке прогрев вызовет start снова, а _started ставится только после успеха
+    _rest_client = rest_client
+    symbols = symbols or settings.symbols
+    _manager()  # менеджер не поднялся — ошибка этапа прогрева, а не вечное ожидание в хабе
+    _symbols.update(symbols)
+    if trades and "aggTrade" not in market_hub.channels:
+        market_hub.channels += ("aggTrade",)
+    market_hub.add_symbols(symbols, pinned=True)
+    market_hub.start()
+    logger.info(f"Market streams ({', '.join(market_hub.channels)}) started for {', '.join(symbols)}")
+    start_user_stream()
+    _started = True
+
+
+def track_symbol(symbol: str) -> bool:
+    """Подписывает символ на лету (сигнал по символу вне SYMBOLS); True — потоки уже идут.
+
+    Стакан синхронизируется сам по первому diff; пока он грузится, get_best
+    отдаёт bookTicker.
+    """
+    if not _started:
+        return False
+    if market_hub.touch(symbol):
+        return True
+    _symbols.add(symbol)
+    market_hub.add_symbols([symbol], pinned=False)
+    return False
+
+
+def add_book_listener(listener: Callable[[str], None]) -> None:
+    _book_listeners.append(listener)
+
+
+def add_market_listener(listener: Callable[[str, dict], None]) -> None:
+    """Сырые события рынка: снимок после синхронизации, применённый diff, сделка."""
+    _market_listeners.append(listener)
+
+
+def _notify_market(kind: str, payload: dict) -> None:
+    for listener in _market_listeners:
+        try:
+            listener(kind, payload)
+        except Exception as e:
+            logger.error(f"Market listener failed for {kind}: {e}")
+
+
+def _notify_book(symbol: str) -> None:
+    for listener in _book_listeners:
+        try:
+            listener(symbol)
+        except Exception as e:
+            logger.error(f"Book listener failed for {symbol}: {e}")
+
+
+def add_user_handler(event_type: str, handler: Callable[[dict], None], account: str | None = None) -> None:
+    handlers = _user_handlers if account is None else _account_handlers.setdefault(account, {})
+    handlers.setdefault(event_type, []).append(handler)
+
+
+def add_resume_handler(handler: Callable[[], None], account: str) -> None:
+    """handler не должен блокировать: он вызывается из потока websocket."""
+    _resume_handlers.setdefault(account, []).append(handler)
+
+
+def _on_user_event(msg, account: str = settings.default_account):
+    payload = msg.get('data', msg)
+    event_type = payload.get('e')
+    if event_type == 'error':
+        logger.error(f"User data stream error ({account}): {payload.get('m')}")
+        order_tracker.set_active(account, False)
+        return
+    if event_type == 'listenKeyExpired':
+        logger.warning(f"User data stream listen key expired ({account}), falling back to REST polling")
+        order_tracker.set_active(account, False)
+        return
+    if order_tracker.set_active(account, True):
+        logger.info(f"User data stream of {account} is live again, trusting stream order states")
+        # Исполнения, пришедшие пока поток молчал, догружаются через REST
+        for handler in _resume_handlers.get(account, []):
+            try:
+                handler()
+            except Exception as e:
+                logger.error(f"User stream resume handler failed ({account}): {e}")
+    handlers = _user_handlers.get(event_type, []) + _account_handlers.get(account, {}).get(event_type, [])
+    for handler in handlers:
+        try:
+            handler(payload)
+        except Exception as e:
+            logger.error(f"User event handler failed for {event_type} ({account}): {e}")
+
+
+def start_user_stream(account: str | None = None, api_key: str | None = None, api_secret: str | None = None) -> None:
+    """Пользовательский поток аккаунта; у дополнительных аккаунтов — свой менеджер с их ключами."""
+    # Продление listen key каждые 30 минут делает сам KeepAliveWebsocket из python-binance
+    account = account or settings.default_account
+    if account in _user_streams:
+        return
+    if account == settings.default_account:
+        twm = _manager()
+    else:
+        twm = _user_twms.get(account)
+        if not _live(twm, account):
+            twm = _user_twms[account] = _start_manager(api_key, api_secret)
+    twm.start_futures_user_socket(callback=partial(_on_user_event, account=account))
+    _user_streams.add(account)
+    order_tracker.set_active(account, True)
+    logger.info(f"Futures user data stream started for account {account}")
+
+
+def get_best(symbol: str, max_age: float = 10.0) -> dict | None:
+    book = _order_books.get(symbol)
+    if book is not None and book.synced and time.time() - book.updated_at <= max_age:
+        best = book.best()
+        if best is not None:
+            return {'bid': best[0], 'ask': best[1]}
+    # Стакан ещё грузится или отстал — лучшие цены из bookTicker
+    ticker = market_hub.latest("bookTicker", symbol, max_age)
+    if ticker is None:
+        return None
+    return {'bid': float(ticker['b']), 'ask': float(ticker['a'])}
+
+
+def get_mark_price(symbol: str, max_age: float = 10.0) -> float | None:
+    mark = market_hub.latest("markPrice", symbol, max_age)
+    return float(mark['p']) if mark is not None else None
+
+
+def get_level_qty(symbol: str, side: str, price: float) -> float | None:
+    book = _order_books.get(symbol)
+    if book is None or not book.synced:
+        return None
+    return book.level_qty(side, price)
+
+
+def tracked_symbols() -> set[str]:
+    return set(_symbols)
+
+
+def get_book_version(symbol: str) -> int:
+    book = _order_books.get(symbol)
+    return book.version if book is not None and book.synced else 0
+
+
+def get_order_book_snapshot(symbol: str = 'ETHUSDT', depth: int = 20) -> dict:
+    book = _order_books.get(symbol)
+    if book is None or not book.synced:
+        return {'symbol': symbol, 'bids': [], 'asks': [], 'timestamp': None}
+    return book.top(depth)
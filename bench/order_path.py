@@ -0,0 +1,117 @@
+"""Бенчмарк пути ордера handle_signal -> place_post_only_with_retries на симуляторе биржи.
+
+    python -m bench.order_path --symbols 8 --signals 20 --latency 0.02
+
+Печатает перцентили задержки сигнала, число REST-вызовов и вес на исполнение
+и пропускную способность при параллельных сигналах по разным символам.
+"""
+import os
+import time
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+for _key in ("BINANCE_API_KEY", "BINANCE_API_SECRET", "WEBHOOK_SECRET", "TELEGRAM_TOKEN"):
+    os.environ.setdefault(_key, "bench")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("JOURNAL_PATH", ":memory:")
+
+from bench.simulator import SimExchange, synthetic_feed, interleave, install, load_feed, save_feed  # noqa: E402
+from app.handlers import handle_signal  # noqa: E402
+from app import metrics  # noqa: E402
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+def run_symbol(symbol: str, signals: int, quantity: float) -> list[tuple[float, dict]]:
+    results = []
+    for i in range(signals):
+        side = "BUY" if i % 2 == 0 else "SELL"
+        started = time.perf_counter()
+        result = handle_signal({"symbol": symbol, "side": side, "quantity": quantity})
+        results.append((time.perf_counter() - started, result))
+    return results
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=4, help="число символов, торгуемых параллельно")
+    parser.add_argument("--signals", type=int, default=10, help="сигналов на символ")
+    parser.add_argument("--quantity", type=float, default=0.01)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка REST, с")
+    parser.add_argument("--ws-latency", type=float, default=0.0, help="задержка событий потока, с")
+    parser.add_argument("--step-interval", type=float, default=0.002, help="пауза между событиями рынка, с")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--feed", help="проиграть сохранённый поток (JSON lines) вместо синтетического")
+    parser.add_argument("--save-feed", help="сохранить сгенерированный поток для повторного прогона")
+    args = parser.parse_args(argv)
+
+    if args.feed:
+        feed = load_feed(args.feed)
+        names = sorted({e["symbol"] for e in feed})
+    else:
+        names = [f"SIM{i}USDT" for i in range(args.symbols)]
+        feed = interleave(*(
+            synthetic_feed(name, 100.0 + 10 * i, 0.01, 20000, seed=args.seed + i)
+            for i, name in enumerate(names)
+        ))
+        if args.save_feed:
+            save_feed(feed, args.save_feed)
+
+    exchange = SimExchange(
+        {name: {"tick": 0.01, "step": 0.001} for name in names},
+        latency=args.latency,
+        ws_latency=args.ws_latency
+    )
+    exchange.load_feed(feed)
+    for _ in names:
+        exchange.step()
+    install(exchange)
+    setup_calls = sum(exchange.rest_calls.values())
+    setup_weight = exchange.weight_used
+    exchange.start(args.step_interval)
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=len(names)) as pool:
+            runs = list(pool.map(lambda s: run_symbol(s, args.signals, args.quantity), names))
+    finally:
+        elapsed = time.perf_counter() - started
+        exchange.stop()
+
+    latencies = [lat for run in runs for lat, _ in run]
+    ok = sum(1 for run in runs for _, r in run if r["status"] == "ok")
+    calls = sum(exchange.rest_calls.values()) - setup_calls
+    weight = exchange.weight_used - setup_weight
+    fills = max(exchange.fills, 1)
+    report = {
+        "symbols": len(names),
+        "signals": len(latencies),
+        "ok": ok,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p90_ms": percentile(latencies, 90) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "rest_calls_per_fill": calls / fills,
+        "weight_per_fill": weight / fills,
+        "throughput_signals_per_s": len(latencies) / elapsed if elapsed else 0.0,
+    }
+    for key, value in report.items():
+        print(f"{key:>26}: {value:.2f}" if isinstance(value, float) else f"{key:>26}: {value}")
+    print("Mean time per stage, ms:")
+    for (stage,), (count, total) in sorted(metrics.signal_stage_seconds.totals().items()):
+        print(f"{stage:>32}: {total / count * 1000:.3f} (n={count})")
+    print("REST calls by method:")
+    for method, count in exchange.rest_calls.most_common():
+        print(f"{method:>32}: {count}")
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,105 @@
+"""Проигрывание записи depth-потока (RECORD_DIR) через локальный стакан и путь ордера.
+
+    python -m bench.replay recordings/ --from 2026-10-16T12:00:00 --to 2026-10-16T12:05:00 --speed 100
+    python -m bench.replay recordings/ETHUSDT-1760612400000.depth --signals 5 --quantity 0.01
+
+Поток идёт через SimExchange и websocket_manager тем же кодом, что и в бою; без
+--speed — с максимальной скоростью. С --signals по каждому символу исполняются
+сигналы handle_signal, как в bench.order_path.
+"""
+import os
+import time
+import argparse
+import logging
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+for _key in ("BINANCE_API_KEY", "BINANCE_API_SECRET", "WEBHOOK_SECRET", "TELEGRAM_TOKEN"):
+    os.environ.setdefault(_key, "bench")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("JOURNAL_PATH", ":memory:")
+
+from bench.simulator import SimExchange, install  # noqa: E402
+from app.depth_recorder import replay_feed  # noqa: E402
+from app import metrics, websocket_manager  # noqa: E402
+from bench.order_path import percentile, run_symbol  # noqa: E402
+
+
+def parse_ts(value: str | None) -> int | None:
+    """Метка времени в мс из числа мс или ISO-даты (UTC, если без зоны)."""
+    if value is None:
+        return None
+    if value.isdigit():
+        return int(value)
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="файлы .depth или каталоги записи")
+    parser.add_argument("--from", dest="start", help="начало: мс или ISO-дата")
+    parser.add_argument("--to", dest="end", help="конец: мс или ISO-дата")
+    parser.add_argument("--speed", type=float, help="ускорение относительно записи; без него — максимум")
+    parser.add_argument("--tick", type=float, default=0.01)
+    parser.add_argument("--step", type=float, default=0.001)
+    parser.add_argument("--signals", type=int, default=0, help="сигналов на символ во время проигрывания")
+    parser.add_argument("--quantity", type=float, default=0.01)
+    args = parser.parse_args(argv)
+
+    feed = list(replay_feed(args.paths, parse_ts(args.start), parse_ts(args.end)))
+    if not feed:
+        raise SystemExit("Nothing to replay in the given range")
+    names = sorted({e["symbol"] for e in feed})
+    span = (feed[-1]["ts"] - feed[0]["ts"]) / 1000
+
+    exchange = SimExchange({name: {"tick": args.tick, "step": args.step} for name in names})
+    exchange.load_feed(feed)
+    # Первые события — снимки стаканов; без них install() не загрузит книги
+    while any(not exchange.symbols[n].bids for n in names) and exchange.step():
+        pass
+    install(exchange)
+    versions = {n: websocket_manager.get_book_version(n) for n in names}
+    exchange.start(step_interval=0, speed=args.speed)
+
+    started = time.perf_counter()
+    runs = []
+    try:
+        if args.signals:
+            with ThreadPoolExecutor(max_workers=len(names)) as pool:
+                runs = list(pool.map(lambda s: run_symbol(s, args.signals, args.quantity), names))
+        while exchange.feed_remaining():
+            time.sleep(0.01)
+        exchange.drain()
+    finally:
+        elapsed = time.perf_counter() - started
+        exchange.stop()
+
+    latencies = [lat for run in runs for lat, _ in run]
+    report = {
+        "symbols": len(names),
+        "events": len(feed),
+        "book_updates": sum(websocket_manager.get_book_version(n) - versions[n] for n in names),
+        "recorded_span_s": span,
+        "replay_s": elapsed,
+        "speedup": span / elapsed if elapsed else 0.0,
+        "events_per_s": len(feed) / elapsed if elapsed else 0.0,
+    }
+    if latencies:
+        report.update({
+            "signals": len(latencies),
+            "ok": sum(1 for run in runs for _, r in run if r["status"] == "ok"),
+            "latency_p50_ms": percentile(latencies, 50) * 1000,
+            "latency_p99_ms": percentile(latencies, 99) * 1000,
+            "maker_rejects": int(metrics.maker_rejects_total.total()),
+        })
+    for key, value in report.items():
+        print(f"{key:>20}: {value:.2f}" if isinstance(value, float) else f"{key:>20}: {value}")
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
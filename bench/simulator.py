@@ -0,0 +1,702 @@
+import copy
+import json
+import asyncio
+import time
+import heapq
+import random
+import logging
+import itertools
+from collections import Counter, deque
+from threading import Condition, Event, RLock, Thread
+from typing import Callable, Iterable
+
+from binance.exceptions import BinanceAPIException
+from app.config import settings
+from app.rate_limiter import request_cost
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+
+MAKER_FEE = 0.0002
+TAKER_FEE = 0.0005
+
+
+class _Response:
+    def __init__(self, status_code: int = 200, text: str = "", headers: dict | None = None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+
+def _api_error(code: int, msg: str, status: int = 400) -> BinanceAPIException:
+    text = json.dumps({"code": code, "msg": msg})
+    return BinanceAPIException(_Response(status, text), status, text)
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def synthetic_feed(
+    symbol: str,
+    mid: float,
+    tick: float,
+    steps: int,
+    seed: int = 0,
+    levels: int = 20,
+    spread_ticks: int = 1,
+    trade_prob: float = 0.5
+) -> list[dict]:
+    """Детерминированный случайный поток стакана и сделок для одного символа."""
+    rng = random.Random(seed)
+    bid_t = int(round(mid / tick))
+    events = []
+    for _ in range(steps):
+        bid_t += rng.choice((-1, 0, 0, 1))
+        ask_t = bid_t + spread_ticks
+        events.append({
+            "type": "depth",
+            "symbol": symbol,
+            "bids": [[(bid_t - i) * tick, round(rng.uniform(0.1, 5.0), 3)] for i in range(levels)],
+            "asks": [[(ask_t + i) * tick, round(rng.uniform(0.1, 5.0), 3)] for i in range(levels)],
+        })
+        if rng.random() < trade_prob:
+            sell = rng.random() < 0.5
+            events.append({
+                "type": "trade",
+                "symbol": symbol,
+                "side": "SELL" if sell else "BUY",
+                "price": (bid_t if sell else ask_t) * tick,
+                "qty": round(rng.uniform(0.01, 2.0), 3),
+            })
+    return events
+
+
+def interleave(*feeds: list[dict]) -> list[dict]:
+    return [e for group in itertools.zip_longest(*feeds) for e in group if e is not None]
+
+
+def save_feed(events: Iterable[dict], path: str) -> None:
+    with open(path, "w") as f:
+        for e in events:
+            f.write(json.dumps(e) + "\n")
+
+
+def load_feed(path: str) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class _SimSymbol:
+    def __init__(self, symbol: str, tick: float, step: float, min_notional: float):
+        self.symbol = symbol
+        self.tick = tick
+        self.step = step
+        self.min_notional = min_notional
+        self.precision = max(0, -int(f"{tick:e}".split("e")[1]))
+        self.bids: dict[float, float] = {}
+        self.asks: dict[float, float] = {}
+        self.update_id = 1
+        self.position = 0.0
+        self.entry_price = 0.0
+        self.leverage = 20
+
+    def best_bid(self) -> float | None:
+        return max(self.bids) if self.bids else None
+
+    def best_ask(self) -> float | None:
+        return min(self.asks) if self.asks else None
+
+    def fmt(self, price: float) -> str:
+        return f"{price:.{self.precision}f}"
+
+
+class SimExchange:
+    """Офлайн-заменитель USDⓈ-M фьючерсов Binance для одного счёта.
+
+    Хранит стаканы, проигрывает поток событий (depth/trade), исполняет
+    наши лимитные ордера: GTX отклоняется, если пересекает спред; стоящий
+    ордер исполняется, когда сделка проходит по его цене (частично, на
+    объём сделки) или когда противоположная сторона стакана его пересекает.
+    Считаем, что наш ордер стоит первым в очереди на своём уровне.
+    События стакана и пользовательского потока доставляются колбэкам в
+    формате Binance с задержкой ws_latency, REST-вызовы спят latency.
+    """
+
+    def __init__(
+        self,
+        symbols: dict[str, dict] | None = None,
+        latency: float = 0.0,
+        ws_latency: float = 0.0,
+        balance: float = 10000.0
+    ):
+        symbols = symbols or {"ETHUSDT": {"tick": 0.01, "step": 0.001}}
+        self.symbols = {
+            name: _SimSymbol(name, cfg.get("tick", 0.01), cfg.get("step", 0.001), cfg.get("min_notional", 5.0))
+            for name, cfg in symbols.items()
+        }
+        self.latency = latency
+        self.ws_latency = ws_latency
+        self.balance = balance
+        self._lock = RLock()
+        # Как и на бирже, id ордеров уникальны между запусками (трекер ордеров — глобальный)
+        self._order_ids = itertools.count(_now_ms())
+        self._trade_ids = itertools.count(1)
+        self.orders: dict[int, dict] = {}
+        self.trades: list[dict] = []
+        self.rest_calls: Counter = Counter()
+        self.weight_used = 0
+        self._weight_log: deque[tuple[float, int]] = deque()
+        self.fills = 0
+        self._depth_callbacks: list[Callable[[dict], None]] = []
+        self._user_callbacks: list[Callable[[dict], None]] = []
+        self._feed: deque[dict] = deque()
+        self._outbox: list[tuple[float, int, Callable, dict]] = []
+        self._outbox_seq = itertools.count()
+        self._outbox_cond = Condition()
+        self._delivering = False
+        self._stop = Event()
+        self._threads: list[Thread] = []
+
+    # --- подписки и поток событий ---
+
+    def subscribe_depth(self, callback: Callable[[dict], None]) -> None:
+        self._depth_callbacks.append(callback)
+
+    def subscribe_user(self, callback: Callable[[dict], None]) -> None:
+        self._user_callbacks.append(callback)
+
+    def load_feed(self, events: Iterable[dict]) -> None:
+        with self._lock:
+            self._feed.extend(events)
+
+    def _emit(self, callbacks: list[Callable], msg: dict) -> None:
+        deliver_at = time.monotonic() + self.ws_latency
+        with self._outbox_cond:
+            for cb in callbacks:
+                heapq.heappush(self._outbox, (deliver_at, next(self._outbox_seq), cb, msg))
+            self._outbox_cond.notify()
+
+    def _dispatch_loop(self) -> None:
+        while not self._stop.is_set():
+            with self._outbox_cond:
+                while not self._outbox and not self._stop.is_set():
+                    self._outbox_cond.wait(0.1)
+                if self._stop.is_set():
+                    return
+                deliver_at, _, cb, msg = self._outbox[0]
+                delay = deliver_at - time.monotonic()
+                if delay > 0:
+                    self._outbox_cond.wait(delay)
+                    continue
+                heapq.heappop(self._outbox)
+                self._delivering = True
+            try:
+                cb(msg)
+            except Exception as e:
+                logger.error(f"Simulator callback failed: {e}")
+            finally:
+                self._delivering = False
+
+    def step(self) -> bool:
+        """Применяет следующее событие потока; False, если поток закончился."""
+        with self._lock:
+            if not self._feed:
+                return False
+            event = self._feed.popleft()
+            sym = self.symbols.get(event["symbol"])
+            if sym is None:
+                return True
+            if event["type"] == "depth":
+                self._apply_depth(sym, event)
+            elif event["type"] == "diff":
+                self._apply_diff(sym, event)
+            elif event["type"] == "trade":
+                self._apply_trade(sym, event)
+            return True
+
+    def _feed_loop(self, interval: float) -> None:
+        while not self._stop.is_set():
+            if not self.step():
+                self._stop.wait(0.01)
+                continue
+            if interval:
+                self._stop.wait(interval)
+
+    def _paced_feed_loop(self, speed: float) -> None:
+        # События с меткой ts (мс) идут в темпе записи, ускоренном в speed раз
+        origin = None
+        while not self._stop.is_set():
+            with self._lock:
+                ts = self._feed[0].get("ts") if self._feed else None
+            if ts is not None:
+                if origin is None:
+                    origin = (ts, time.monotonic())
+                delay = origin[1] + (ts - origin[0]) / 1000 / speed - time.monotonic()
+                if delay > 0:
+                    self._stop.wait(delay)
+                    continue
+            if not self.step():
+                self._stop.wait(0.01)
+
+    def start(self, step_interval: float = 0.005, speed: float | None = None) -> None:
+        """Запускает поток рынка: с шагом step_interval или, при speed, по меткам ts событий."""
+        self._stop.clear()
+        feed = Thread(target=self._paced_feed_loop, args=(speed,), name="sim-feed", daemon=True) if speed \
+            else Thread(target=self._feed_loop, args=(step_interval,), name="sim-feed", daemon=True)
+        self._threads = [
+            Thread(target=self._dispatch_loop, name="sim-dispatch", daemon=True),
+            feed,
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._outbox_cond:
+            self._outbox_cond.notify_all()
+        for t in self._threads:
+            t.join(1)
+
+    def feed_remaining(self) -> int:
+        with self._lock:
+            return len(self._feed)
+
+    def drain(self, timeout: float = 1.0) -> None:
+        """Ждёт доставки всех отправленных событий (для тестов)."""
+        deadline = time.monotonic() + timeout
+        while (self._outbox or self._delivering) and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    # --- рынок ---
+
+    def _apply_depth(self, sym: _SimSymbol, event: dict) -> None:
+        new_bids = {round(p, sym.precision): q for p, q in event["bids"]}
+        new_asks = {round(p, sym.precision): q for p, q in event["asks"]}
+        b_diff = [[p, 0.0] for p in sym.bids if p not in new_bids] + \
+                 [[p, q] for p, q in new_bids.items() if sym.bids.get(p) != q]
+        a_diff = [[p, 0.0] for p in sym.asks if p not in new_asks] + \
+                 [[p, q] for p, q in new_asks.items() if sym.asks.get(p) != q]
+        sym.bids, sym.asks = new_bids, new_asks
+        self._publish_depth(sym, b_diff, a_diff)
+
+    def _apply_diff(self, sym: _SimSymbol, event: dict) -> None:
+        """Инкрементальное обновление уровней (запись depth-потока), объём 0 удаляет уровень."""
+        for levels, changes in ((sym.bids, event["b"]), (sym.asks, event["a"])):
+            for p, q in changes:
+                p = round(p, sym.precision)
+                if q:
+                    levels[p] = q
+                else:
+                    levels.pop(p, None)
+        self._publish_depth(sym, [list(x) for x in event["b"]], [list(x) for x in event["a"]])
+
+    def _publish_depth(self, sym: _SimSymbol, b_diff: list, a_diff: list) -> None:
+        prev = sym.update_id
+        sym.update_id += 1
+        now = _now_ms()
+        self._emit(self._depth_callbacks, {
+            "stream": f"{sym.symbol.lower()}@depth@100ms",
+            "data": {
+                "e": "depthUpdate", "E": now, "T": now, "s": sym.symbol,
+                # U перекрывает предыдущее событие: снимок с lastUpdateId=prev
+                # корректно продолжается этим событием (уровни абсолютные, повтор безвреден)
+                "U": prev, "u": sym.update_id, "pu": prev,
+                "b": [[sym.fmt(p), str(q)] for p, q in b_diff],
+                "a": [[sym.fmt(p), str(q)] for p, q in a_diff],
+            },
+        })
+        best_bid, best_ask = sym.best_bid(), sym.best_ask()
+        for o in self._open_orders(sym.symbol):
+            price = float(o["price"])
+            if o["side"] == "BUY" and best_ask is not None and best_ask <= price:
+                self._fill(o, self._remaining(o), price, maker=True)
+            elif o["side"] == "SELL" and best_bid is not None and best_bid >= price:
+                self._fill(o, self._remaining(o), price, maker=True)
+
+    def _apply_trade(self, sym: _SimSymbol, event: dict) -> None:
+        qty_left = event["qty"]
+        for o in self._open_orders(sym.symbol):
+            if qty_left <= 0:
+                break
+            price = float(o["price"])
+            hit = (event["side"] == "SELL" and o["side"] == "BUY" and event["price"] <= price) or \
+                  (event["side"] == "BUY" and o["side"] == "SELL" and event["price"] >= price)
+            if hit:
+                qty = min(qty_left, self._remaining(o))
+                qty_left -= qty
+                self._fill(o, qty, price, maker=True)
+
+    # --- ордера и позиции ---
+
+    def _open_orders(self, symbol: str) -> list[dict]:
+        return [o for o in self.orders.values()
+                if o["symbol"] == symbol and o["status"] in ("NEW", "PARTIALLY_FILLED")]
+
+    @staticmethod
+    def _remaining(o: dict) -> float:
+        return float(o["origQty"]) - float(o["executedQty"])
+
+    def _order_event(self, o: dict, exec_type: str, last_qty: float = 0.0, last_price: float = 0.0,
+                     commission: float = 0.0, realized: float = 0.0) -> None:
+        now = _now_ms()
+        self._emit(self._user_callbacks, {
+            "e": "ORDER_TRADE_UPDATE", "E": now, "T": now,
+            "o": {
+                "s": o["symbol"], "c": o["clientOrderId"], "S": o["side"], "o": o["type"],
+                "f": o["timeInForce"], "q": o["origQty"], "p": o["price"], "ap": o["avgPrice"],
+                "x": exec_type, "X": o["status"], "i": o["orderId"], "l": str(last_qty),
+                "z": o["executedQty"], "L": str(last_price), "N": "USDT", "n": str(commission),
+                "T": now, "t": next(self._trade_ids) if exec_type == "TRADE" else 0,
+                "m": True, "rp": str(realized), "ps": "BOTH",
+            },
+        })
+
+    def _account_event(self, sym: _SimSymbol) -> None:
+        now = _now_ms()
+        self._emit(self._user_callbacks, {
+            "e": "ACCOUNT_UPDATE", "E": now, "T": now,
+            "a": {
+                "m": "ORDER",
+                "B": [{"a": "USDT", "wb": str(self.balance), "cw": str(self.balance), "bc": "0"}],
+                "P": [{"s": sym.symbol, "pa": str(sym.position), "ep": str(sym.entry_price),
+                       "up": "0", "mt": "cross", "iw": "0", "ps": "BOTH"}],
+            },
+        })
+
+    def _fill(self, o: dict, qty: float, price: float, maker: bool) -> None:
+        if qty <= 0:
+            return
+        sym = self.symbols[o["symbol"]]
+        executed = float(o["executedQty"])
+        total = executed + qty
+        avg = (float(o["avgPrice"]) * executed + price * qty) / total
+        o["executedQty"] = str(round(total, 8))
+        o["avgPrice"] = str(avg)
+        o["cumQuote"] = str(avg * total)
+        o["status"] = "FILLED" if total >= float(o["origQty"]) - 1e-12 else "PARTIALLY_FILLED"
+        o["updateTime"] = _now_ms()
+
+        signed = qty if o["side"] == "BUY" else -qty
+        realized = 0.0
+        if sym.position == 0 or (sym.position > 0) == (signed > 0):
+            new_pos = sym.position + signed
+            sym.entry_price = (abs(sym.position) * sym.entry_price + qty * price) / abs(new_pos)
+            sym.position = new_pos
+        else:
+            closing = min(qty, abs(sym.position))
+            realized = closing * (price - sym.entry_price) * (1 if sym.position > 0 else -1)
+            sym.position = round(sym.position + signed, 8)
+            if sym.position == 0:
+                sym.entry_price = 0.0
+            elif (sym.position > 0) == (signed > 0):
+                sym.entry_price = price
+        commission = qty * price * (MAKER_FEE if maker else TAKER_FEE)
+        self.balance += realized - commission
+        self.fills += 1
+        self.trades.append({
+            "symbol": sym.symbol, "id": len(self.trades) + 1, "orderId": o["orderId"],
+            "side": o["side"], "price": str(price), "qty": str(qty), "realizedPnl": str(realized),
+            "commission": str(commission), "commissionAsset": "USDT", "time": _now_ms(),
+            "maker": maker, "buyer": o["side"] == "BUY",
+        })
+        self._order_event(o, "TRADE", qty, price, commission, realized)
+        self._account_event(sym)
+
+    def _new_order(self, params: dict) -> dict:
+        sym = self.symbols.get(params["symbol"])
+        if sym is None:
+            raise _api_error(-1121, "Invalid symbol.")
+        side = params["side"]
+        order_type = params.get("type", "LIMIT")
+        tif = params.get("timeInForce", "GTC")
+        qty = float(params["quantity"])
+        if qty <= 0 or abs(round(qty / sym.step) * sym.step - qty) > 1e-9:
+            raise _api_error(-1111, "Precision is over the maximum defined for this asset.")
+        best_bid, best_ask = sym.best_bid(), sym.best_ask()
+        price = float(params["price"]) if order_type == "LIMIT" else (best_ask if side == "BUY" else best_bid)
+        if price is None:
+            raise _api_error(-2010, "No liquidity.")
+        crosses = (side == "BUY" and best_ask is not None and price >= best_ask) or \
+                  (side == "SELL" and best_bid is not None and price <= best_bid)
+        if tif == "GTX" and crosses:
+            raise _api_error(-5022, "Due to the order could not be executed as maker, "
+                                    "the Post Only order will be rejected.")
+        order_id = next(self._order_ids)
+        o = {
+            "orderId": order_id, "symbol": sym.symbol, "status": "NEW",
+            "clientOrderId": params.get("newClientOrderId", f"sim{order_id}"),
+            "price": sym.fmt(price) if order_type == "LIMIT" else "0", "avgPrice": "0",
+            "origQty": params["quantity"], "executedQty": "0", "cumQuote": "0",
+            "timeInForce": tif, "type": order_type, "side": side,
+            "reduceOnly": bool(params.get("reduceOnly", False)), "updateTime": _now_ms(),
+        }
+        self.orders[order_id] = o
+        self._order_event(o, "NEW")
+        if crosses or order_type == "MARKET":
+            self._fill(o, qty, best_ask if side == "BUY" else best_bid, maker=False)
+        elif tif == "IOC":
+            o["status"] = "EXPIRED"
+            self._order_event(o, "EXPIRED")
+        return dict(o)
+
+    def _get(self, params: dict) -> dict:
+        o = self.orders.get(int(params.get("orderId", 0)))
+        if o is None or o["symbol"] != params.get("symbol"):
+            raise _api_error(-2013, "Order does not exist.")
+        return o
+
+    def _cancel(self, params: dict) -> dict:
+        try:
+            o = self._get(params)
+        except BinanceAPIException:
+            raise _api_error(-2011, "Unknown order sent.")
+        if o["status"] not in ("NEW", "PARTIALLY_FILLED"):
+            raise _api_error(-2011, "Unknown order sent.")
+        o["status"] = "CANCELED"
+        o["updateTime"] = _now_ms()
+        self._order_event(o, "CANCELED")
+        return dict(o)
+
+    # --- REST ---
+
+    def call(self, method: str, params: dict):
+        if self.latency:
+            time.sleep(self.latency)
+        weight, _, _ = request_cost(method, params)
+        now = time.monotonic()
+        with self._lock:
+            self.rest_calls[method] += 1
+            self.weight_used += weight
+            self._weight_log.append((now, weight))
+            while self._weight_log and self._weight_log[0][0] < now - 60:
+                self._weight_log.popleft()
+            handler = getattr(self, "_rest_" + method.removeprefix("futures_"), None)
+            if handler is None:
+                raise _api_error(-1000, f"Simulator does not implement {method}")
+            return handler(params)
+
+    def used_weight_1m(self) -> int:
+        return sum(w for _, w in self._weight_log)
+
+    def _rest_ping(self, params):
+        return {}
+
+    def _rest_time(self, params):
+        return {"serverTime": _now_ms()}
+
+    def _rest_exchange_info(self, params):
+        return {"symbols": [
+            {
+                "symbol": s.symbol, "status": "TRADING",
+                "filters": [
+                    {"filterType": "PRICE_FILTER", "tickSize": f"{s.tick:.{s.precision}f}"},
+                    {"filterType": "LOT_SIZE", "stepSize": repr(s.step), "minQty": repr(s.step)},
+                    {"filterType": "MIN_NOTIONAL", "notional": str(s.min_notional)},
+                ],
+            }
+            for s in self.symbols.values()
+        ]}
+
+    def _rest_order_book(self, params):
+        sym = self.symbols[params["symbol"]]
+        limit = int(params.get("limit", 500))
+        now = _now_ms()
+        return {
+            "lastUpdateId": sym.update_id, "E": now, "T": now,
+            "bids": [[sym.fmt(p), str(sym.bids[p])] for p in sorted(sym.bids, reverse=True)[:limit]],
+            "asks": [[sym.fmt(p), str(sym.asks[p])] for p in sorted(sym.asks)[:limit]],
+        }
+
+    def _rest_mark_price(self, params):
+        sym = self.symbols[params["symbol"]]
+        mid = ((sym.best_bid() or 0.0) + (sym.best_ask() or 0.0)) / 2
+        return {"symbol": sym.symbol, "markPrice": sym.fmt(mid), "time": _now_ms()}
+
+    def _rest_create_order(self, params):
+        return self._new_order(params)
+
+    def _rest_place_batch_order(self, params):
+        results = []
+        for order in params["batchOrders"]:
+            try:
+                results.append(self._new_order(order))
+            except BinanceAPIException as e:
+                results.append({"code": e.code, "msg": e.message})
+        return results
+
+    def _rest_get_order(self, params):
+        return dict(self._get(params))
+
+    def _rest_cancel_order(self, params):
+        return self._cancel(params)
+
+    def _rest_cancel_orders(self, params):
+        results = []
+        for oid in params.get("orderidlist", []):
+            try:
+                results.append(self._cancel({"symbol": params["symbol"], "orderId": oid}))
+            except BinanceAPIException as e:
+                results.append({"code": e.code, "msg": e.message})
+        return results
+
+    def _rest_cancel_all_open_orders(self, params):
+        for o in self._open_orders(params["symbol"]):
+            self._cancel({"symbol": o["symbol"], "orderId": o["orderId"]})
+        return {"code": 200, "msg": "The operation of cancel all open order is done."}
+
+    def _rest_modify_order(self, params):
+        o = self._get(params)
+        if o["status"] not in ("NEW", "PARTIALLY_FILLED"):
+            raise _api_error(-2013, "Order does not exist.")
+        sym = self.symbols[o["symbol"]]
+        price = float(params["price"])
+        if sym.fmt(price) == o["price"] and params["quantity"] == o["origQty"]:
+            raise _api_error(-5027, "No need to modify the order.")
+        best_bid, best_ask = sym.best_bid(), sym.best_ask()
+        crosses = (o["side"] == "BUY" and best_ask is not None and price >= best_ask) or \
+                  (o["side"] == "SELL" and best_bid is not None and price <= best_bid)
+        if o["timeInForce"] == "GTX" and crosses:
+            raise _api_error(-5022, "Due to the order could not be executed as maker, "
+                                    "the Post Only order will be rejected.")
+        o["price"] = sym.fmt(price)
+        o["origQty"] = params["quantity"]
+        o["updateTime"] = _now_ms()
+        self._order_event(o, "AMENDMENT")
+        return dict(o)
+
+    def _rest_get_open_orders(self, params):
+        return [dict(o) for o in self._open_orders(params["symbol"])]
+
+    def _rest_position_information(self, params):
+        symbols = [params["symbol"]] if params.get("symbol") else list(self.symbols)
+        result = []
+        for name in symbols:
+            s = self.symbols[name]
+            notional = abs(s.position) * s.entry_price
+            result.append({
+                "symbol": name, "positionAmt": str(s.position), "entryPrice": str(s.entry_price),
+                "unRealizedProfit": "0", "initialMargin": str(notional / s.leverage),
+                "liquidationPrice": "0", "leverage": str(s.leverage), "positionSide": "BOTH",
+            })
+        return result
+
+    def _rest_account_balance(self, params):
+        return [{"asset": "USDT", "balance": str(self.balance), "availableBalance": str(self.balance)}]
+
+    def _rest_account_trades(self, params):
+        trades = [t for t in self.trades if t["symbol"] == params["symbol"]]
+        if "fromId" in params:
+            trades = [t for t in trades if t["id"] >= int(params["fromId"])]
+        if "startTime" in params:
+            trades = [t for t in trades if t["time"] >= int(params["startTime"])]
+        if "orderId" in params:
+            trades = [t for t in trades if t["orderId"] == int(params["orderId"])]
+        limit = int(params.get("limit", 500))
+        if "fromId" not in params and "startTime" not in params:
+            return trades[-limit:]  # как у биржи: без курсора — последние сделки
+        return trades[:limit]
+
+    def _rest_change_leverage(self, params):
+        self.symbols[params["symbol"]].leverage = int(params["leverage"])
+        return {"symbol": params["symbol"], "leverage": int(params["leverage"])}
+
+
+class SimClient:
+    """Тот же интерфейс futures_*, что и у binance.client.Client, поверх SimExchange."""
+
+    def __init__(self, exchange: SimExchange):
+        self._exchange = exchange
+        self.response = _Response()
+
+    def __getattr__(self, name):
+        if not name.startswith("futures_"):
+            raise AttributeError(name)
+
+        def call(**params):
+            result = self._exchange.call(name, params)
+            self.response = _Response(headers={"X-MBX-USED-WEIGHT-1M": str(self._exchange.used_weight_1m())})
+            return result
+
+        return call
+
+
+class AsyncSimClient:
+    """Асинхронный вариант SimClient (как AsyncClient); вызовы идут в пуле потоков."""
+
+    def __init__(self, client: SimClient):
+        self._client = client
+
+    @property
+    def response(self):
+        return self._client.response
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        async def call(**params):
+            return await asyncio.to_thread(method, **params)
+
+        return call
+
+    async def close_connection(self) -> None:
+        pass
+
+
+def _snapshot(obj, *names: str) -> Callable[[], None]:
+    """Снимок атрибутов; словари и множества восстанавливаются на месте — на них держат ссылки."""
+    saved = {name: copy.copy(getattr(obj, name)) for name in names}
+
+    def restore() -> None:
+        for name, value in saved.items():
+            current = getattr(obj, name)
+            if isinstance(value, (dict, set)) and type(current) is type(value):
+                current.clear()
+                current.update(value)
+            else:
+                setattr(obj, name, value)
+
+    return restore
+
+
+def install(exchange: SimExchange) -> Callable[[], None]:
+    """Подключает приложение (sync/async клиенты, websocket_manager) к симулятору.
+
+    Возвращает функцию, которая отключает симулятор и возвращает глобальное
+    состояние модулей к прежнему — тесты вызывают её при завершении.
+    """
+    from app import async_binance_client, binance_client, websocket_manager
+    from app.order_tracker import order_tracker
+    from app.rate_limiter import GovernedAsyncClient, rate_governor
+
+    restores = [
+        _snapshot(binance_client._client, "_client"),
+        _snapshot(async_binance_client, "_async_client"),
+        _snapshot(websocket_manager, "_rest_client", "_order_books", "_pending", "_symbols"),
+        _snapshot(websocket_manager.market_hub, "_latest", "_last_seen"),
+        _snapshot(order_tracker, "_heartbeats"),
+        _snapshot(binance_client.symbol_metadata, "_index"),
+        _snapshot(binance_client.account_state, "_positions", "_balances", "updated_at", "reconciled_at"),
+    ]
+    client = SimClient(exchange)
+    binance_client._client.set_target(client)
+    async_binance_client._async_client = GovernedAsyncClient(AsyncSimClient(client), rate_governor)
+    websocket_manager._rest_client = binance_client._client
+    websocket_manager._order_books.clear()
+    websocket_manager._pending.clear()
+    websocket_manager._symbols.update(exchange.symbols)
+    exchange.subscribe_depth(websocket_manager.market_hub.dispatch)
+    exchange.subscribe_user(websocket_manager._on_user_event)
+    order_tracker.set_active(settings.default_account, True)
+    binance_client.symbol_metadata.load()
+    binance_client.account_state.reconcile()
+
+    def uninstall() -> None:
+        # Остановленная или нет, биржа больше не шлёт события в модули приложения
+        exchange.stop()
+        exchange._depth_callbacks.remove(websocket_manager.market_hub.dispatch)
+        exchange._user_callbacks.remove(websocket_manager._on_user_event)
+        for restore in reversed(restores):
+            restore()
+
+    return uninstall
@@ -0,0 +1,115 @@
+"""Микробенчмарк приёма вебхука: разбор тела, проверка секрета и валидация сигнала.
+
+    python -m bench.webhook_intake --requests 20000
+
+Сравнивает прежний путь (json.loads, сравнение секрета через !=, модель с
+валидаторами в стиле pydantic v1) с текущим decode_webhook (разбор байтов
+сразу в модель, hmac.compare_digest, белый список символов) и печатает
+стоимость одного запроса в микросекундах.
+"""
+import os
+import json
+import time
+import argparse
+import logging
+import warnings
+
+for _key in ("BINANCE_API_KEY", "BINANCE_API_SECRET", "WEBHOOK_SECRET", "TELEGRAM_TOKEN"):
+    os.environ.setdefault(_key, "bench")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("JOURNAL_PATH", ":memory:")
+
+from pydantic import BaseModel, validator  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.handlers import decode_webhook, secret_ok  # noqa: E402
+from bench.simulator import SimExchange, install  # noqa: E402
+from app import metrics  # noqa: E402
+from bench.order_path import percentile  # noqa: E402
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+
+    class LegacySignal(BaseModel):
+        """Модель сигнала до перехода на валидаторы v2."""
+        symbol: str
+        side: str
+        quantity: float
+        action: str = 'open'
+        account: str | list[str] | None = None
+
+        @validator('side')
+        def validate_side(cls, v):
+            v2 = v.upper()
+            if v2 not in ('BUY', 'SELL'):
+                raise ValueError("Поле 'side' должно быть 'BUY' или 'SELL'")
+            return v2
+
+        @validator('action')
+        def validate_action(cls, v):
+            v2 = v.lower()
+            if v2 not in ('open', 'close'):
+                raise ValueError("Поле 'action' должно быть 'open' или 'close'")
+            return v2
+
+
+def legacy_intake(body: bytes, query_secret: str) -> LegacySignal:
+    if query_secret != settings.webhook_secret:
+        raise PermissionError
+    data = json.loads(body)
+    if data.get("secret") != settings.webhook_secret:
+        raise PermissionError
+    data.pop("secret", None)
+    return LegacySignal(**data)
+
+
+def fast_intake(body: bytes, query_secret: str):
+    if not secret_ok(query_secret):
+        raise PermissionError
+    sig = decode_webhook(body)
+    if sig is None:
+        raise PermissionError
+    return sig
+
+
+def measure(intake, body: bytes, requests: int) -> list[float]:
+    for _ in range(min(1000, requests)):
+        intake(body, settings.webhook_secret)
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        intake(body, settings.webhook_secret)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    # Спаны пишут гистограммы на каждый запрос в обоих путях одинаково — выключаем, чтобы мерить сам разбор
+    metrics.enabled = False
+
+    # Кэш метаданных нужен белому списку символов
+    install(SimExchange({"ETHUSDT": {"tick": 0.01, "step": 0.001}}))
+    body = json.dumps({
+        "secret": settings.webhook_secret, "symbol": "ETHUSDT", "side": "buy", "quantity": 0.05, "action": "open"
+    }).encode()
+
+    report = {}
+    for name, intake in (("legacy", legacy_intake), ("fast", fast_intake)):
+        samples = measure(intake, body, args.requests)
+        report[name] = {
+            "mean_us": sum(samples) / len(samples) * 1e6,
+            "p50_us": percentile(samples, 50) * 1e6,
+            "p99_us": percentile(samples, 99) * 1e6,
+        }
+        print(f"{name:>6}: mean {report[name]['mean_us']:.1f} us, "
+              f"p50 {report[name]['p50_us']:.1f} us, p99 {report[name]['p99_us']:.1f} us")
+    print(f"speedup: {report['legacy']['mean_us'] / report['fast']['mean_us']:.2f}x")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+# Конфигурация gunicorn: импорт app.main ничего не запускает, сервисы и бот стартуют в воркере
+bind = "0.0.0.0:8000"
+workers = 1  # воркер один: стаканы, состояние аккаунтов, замки символов и бот живут в его памяти
+worker_class = "gthread"
+threads = 16
+timeout = 0
+
+
+def post_worker_init(worker):
+    from app import runtime
+    runtime.start_process()
@@ -0,0 +1,22 @@
+import os
+
+import pytest
+
+# Настройки читаются из окружения при импорте app.config (validate() в тестах не вызывается);
+# тесты вебхука подписывают запросы секретом "test"
+for key in ("BINANCE_API_KEY", "BINANCE_API_SECRET", "WEBHOOK_SECRET", "TELEGRAM_TOKEN"):
+    os.environ.setdefault(key, "test")
+
+# Журнал сделок в тестах не должен оставлять файл в рабочем каталоге
+os.environ.setdefault("JOURNAL_PATH", ":memory:")
+
+
+@pytest.fixture
+def install_sim():
+    """install() симулятора; глобальное состояние приложения восстанавливается после теста."""
+    from bench.simulator import install
+
+    restores = []
+    yield lambda exchange: restores.append(install(exchange))
+    for restore in reversed(restores):
+        restore()
@@ -0,0 +1,44 @@
+from app.account_state import AccountState
+
+
+POSITIONS = [
+    {"symbol": "ETHUSDT", "positionSide": "BOTH", "positionAmt": "0.5", "entryPrice": "2000",
+     "unRealizedProfit": "1", "initialMargin": "100", "liquidationPrice": "1500", "leverage": "10"},
+    {"symbol": "BTCUSDT", "positionSide": "BOTH", "positionAmt": "0", "entryPrice": "0"},
+]
+BALANCES = [{"asset": "USDT", "balance": "1000"}, {"asset": "BNB", "balance": "1"}]
+
+
+def _state():
+    return AccountState(lambda: POSITIONS, lambda: BALANCES, reconcile_interval=30)
+
+
+def test_reconcile_from_rest():
+    state = _state()
+    assert not state.is_fresh()
+    state.reconcile()
+    assert state.is_fresh()
+    assert state.position_amount("ETHUSDT") == 0.5
+    assert state.position("ETHUSDT").liquidation_price == 1500.0
+    assert [p.symbol for p in state.positions()] == ["ETHUSDT"]
+    assert state.balance() == 1000.0
+    assert state.position_amount("XRPUSDT") == 0.0
+
+
+def test_account_update_event():
+    state = _state()
+    state.reconcile()
+    state.apply_account_update({
+        "e": "ACCOUNT_UPDATE",
+        "a": {
+            "B": [{"a": "USDT", "wb": "990.5", "cw": "990.5"}],
+            "P": [{"s": "ETHUSDT", "pa": "0", "ep": "0", "up": "0", "ps": "BOTH"},
+                  {"s": "BTCUSDT", "pa": "-0.01", "ep": "60000", "up": "0", "ps": "BOTH"}],
+        },
+    })
+    assert state.position_amount("ETHUSDT") == 0.0
+    assert state.position("BTCUSDT").entry_price == 60000.0
+    assert state.balance("USDT") == 990.5
+    # Возвращаются копии, а не внутренние объекты
+    state.position("BTCUSDT").amount = 5
+    assert state.position_amount("BTCUSDT") == -0.01
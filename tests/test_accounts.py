@@ -0,0 +1,53 @@
+import pytest
+
+from app.accounts import Account, AccountRegistry
+from app.config import _parse_groups
+
+
+def _account(account_id: str) -> Account:
+    return Account(account_id, client=None, governor=None, state=None, journal=None)
+
+
+@pytest.fixture
+def registry():
+    reg = AccountRegistry({"subs": ["sub1", "sub2"], "alts": ["sub2"]})
+    for account_id in ("main", "sub1", "sub2"):
+        reg.register(_account(account_id), default=account_id == "main")
+    return reg
+
+
+def test_resolve_accounts_and_groups(registry):
+    assert [a.id for a in registry.resolve(None)] == ["main"]
+    assert [a.id for a in registry.resolve("sub1")] == ["sub1"]
+    assert [a.id for a in registry.resolve("subs")] == ["sub1", "sub2"]
+    # Повторы из пересекающихся групп схлопываются
+    assert [a.id for a in registry.resolve(["alts", "subs", "main"])] == ["sub2", "sub1", "main"]
+    assert [a.id for a in registry.resolve("all")] == ["main", "sub1", "sub2"]
+
+
+def test_unknown_target_is_rejected(registry):
+    with pytest.raises(ValueError):
+        registry.resolve("nope")
+    with pytest.raises(ValueError):
+        registry.get("nope")
+
+
+def test_lock_key_is_per_account():
+    assert _account("sub1").lock_key("ETHUSDT") != _account("sub2").lock_key("ETHUSDT")
+
+
+def test_parse_groups():
+    assert _parse_groups("subs=sub1, sub2;alts=sub2;;bad") == {"subs": ["sub1", "sub2"], "alts": ["sub2"]}
+
+
+def test_validate_reports_missing_account_credentials(monkeypatch):
+    from app.config import Settings
+
+    monkeypatch.setenv("BINANCE_API_KEY_SUB9", "key")
+    monkeypatch.delenv("BINANCE_API_SECRET_SUB9", raising=False)
+    config = Settings()
+    monkeypatch.setattr(config, "run_telegram_bot", False)
+    monkeypatch.setattr(config, "account_credentials", {"sub9": ("key", "")})
+    with pytest.raises(RuntimeError, match="BINANCE_API_SECRET_SUB9") as e:
+        config.validate()
+    assert "BINANCE_API_KEY_SUB9" not in str(e.value)
@@ -0,0 +1,66 @@
+import pytest
+
+from app.book_analytics import BookAnalytics
+from app.order_book import LocalOrderBook
+
+
+def _book():
+    book = LocalOrderBook("ETHUSDT")
+    book.apply_snapshot({
+        "lastUpdateId": 1,
+        "bids": [["99.9", "2"], ["99.8", "3"], ["99.0", "10"]],
+        "asks": [["100.1", "1"], ["100.2", "4"], ["101.0", "10"]],
+    })
+    calls = []
+
+    def snapshot(symbol, depth):
+        calls.append(symbol)
+        return book.top(depth)
+
+    return book, BookAnalytics(snapshot, lambda s: book.version if book.synced else 0), calls
+
+
+def test_summary_depth_imbalance_microprice():
+    _, analytics, _ = _book()
+    s = analytics.summary("ETHUSDT", bps=(5, 50), imbalance_levels=2)
+    assert s["mid"] == pytest.approx(100.0)
+    assert s["spread"] == pytest.approx(0.2)
+    # 5 bps от 100 — только [99.95, 100.05], там уровней нет; 50 bps — два уровня с каждой стороны
+    assert s["depth_bps"]["5"] == {"bid": 0.0, "ask": 0.0}
+    assert s["depth_bps"]["50"] == {"bid": 5.0, "ask": 5.0}
+    assert s["imbalance"] == pytest.approx(0.0)
+    # На touch бидов больше — microprice смещена к аску
+    assert s["microprice"] == pytest.approx((99.9 * 1 + 100.1 * 2) / 3)
+    assert s["top_qty"] == {"bid": 15.0, "ask": 15.0}
+
+
+def test_vwap_walks_levels():
+    _, analytics, _ = _book()
+    buy = analytics.vwap("ETHUSDT", "BUY", 3)
+    assert buy["filled"] == 3
+    assert buy["vwap"] == pytest.approx((100.1 + 2 * 100.2) / 3)
+    assert buy["worst_price"] == 100.2 and buy["levels"] == 2
+    assert buy["slippage_bps"] == pytest.approx((buy["vwap"] - 100.1) / 100.1 * 1e4)
+
+    sell = analytics.vwap("ETHUSDT", "SELL", 2)
+    assert sell["vwap"] == pytest.approx(99.9) and sell["slippage_bps"] == pytest.approx(0.0)
+
+    # Объёма в книге не хватает — filled показывает, сколько есть
+    assert analytics.vwap("ETHUSDT", "BUY", 100)["filled"] == 15
+
+
+def test_levels_cached_per_version():
+    book, analytics, calls = _book()
+    analytics.summary("ETHUSDT")
+    analytics.vwap("ETHUSDT", "BUY", 1)
+    assert len(calls) == 1
+    book.apply_diff({"U": 1, "u": 2, "pu": 0, "b": [["99.95", "1"]], "a": []})
+    assert analytics.summary("ETHUSDT")["bid"] == 99.95
+    assert len(calls) == 2
+
+
+def test_no_book():
+    book, analytics, _ = _book()
+    book.invalidate()
+    assert analytics.summary("ETHUSDT") is None
+    assert analytics.vwap("ETHUSDT", "BUY", 1) is None
@@ -0,0 +1,97 @@
+import pytest
+
+from app.clock_sync import ClockSync, DEFAULT_RECV_WINDOW, MIN_RECV_WINDOW
+from app.rate_limiter import GovernedClient, RateLimitGovernor
+from bench.simulator import _api_error
+
+
+class FakeTime:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_offset_comes_from_the_fastest_sample():
+    clock = ClockSync(clock=FakeTime(), monotonic=FakeTime())
+    # Биржа впереди на 250 мс; медленный замер искажён асимметрией пути
+    clock.add_sample(100.0, 100_000 + 250 + 300, 100.2)
+    clock.add_sample(200.0, 200_000 + 250 + 10, 200.02)
+    clock.add_sample(300.0, 300_000 + 250 - 80, 300.4)
+    status = clock.status()
+    assert status["offset_ms"] == 250.0
+    assert status["uncertainty_ms"] == 10.0
+    assert clock.offset_ms() == 240
+
+
+def test_stream_events_raise_a_lagging_offset_and_report_latency():
+    clock = ClockSync(clock=FakeTime(50.0), monotonic=FakeTime())
+    clock.add_sample(10.0, 10_000 + 100, 10.0)
+    assert clock.status()["offset_ms"] == 100.0
+    # Событие с меткой биржи 50 130 мс пришло в 50 000 мс по локальным часам: смещение не меньше 130
+    clock.on_market_event("depth", {"E": 50_130})
+    assert clock.status()["offset_ms"] == 130.0
+    assert clock.status()["stream_floor_ms"] == 130.0
+    # Медленный замер REST не опускает смещение ниже границы из потока
+    clock.add_sample(60.0, 60_000 + 90, 60.5)
+    assert clock.status()["offset_ms"] == 130.0
+    clock.on_market_event("snapshot", {"bids": [], "asks": []})
+
+
+def test_recv_window_follows_request_latency():
+    monotonic = FakeTime()
+    clock = ClockSync(clock=FakeTime(), monotonic=monotonic)
+    assert clock.recv_window() == DEFAULT_RECV_WINDOW
+    for _ in range(20):
+        clock.observe_request(0.02)
+    # Быстрая сеть не сужает окно ниже прежнего для python-binance значения
+    assert clock.recv_window() == MIN_RECV_WINDOW == 10000
+    clock.on_timestamp_error("Timestamp for this request is outside of the recvWindow.")
+    assert clock.recv_window() == 2 * MIN_RECV_WINDOW
+    monotonic.now += 120
+    for _ in range(20):
+        clock.observe_request(8.0)
+    slow = clock.recv_window()
+    assert slow > MIN_RECV_WINDOW
+    clock.on_timestamp_error("Timestamp for this request is outside of the recvWindow.")
+    assert clock.recv_window() == pytest.approx(2 * slow, abs=1)
+    monotonic.now += 120
+    assert clock.recv_window() == slow
+
+
+def test_ahead_error_shifts_the_offset_back():
+    clock = ClockSync(clock=FakeTime(), monotonic=FakeTime())
+    clock.add_sample(10.0, 10_000 + 3000, 10.0)
+    clock.on_timestamp_error("Timestamp for this request was 1000ms ahead of the server's time.")
+    assert clock.status()["offset_ms"] == 2000.0
+
+
+def test_governed_client_signs_with_clock_and_retries_timestamp_error():
+    class FakeClient:
+        timestamp_offset = 0
+        REQUEST_RECVWINDOW = 10000
+
+        def __init__(self):
+            self.calls = []
+
+        def futures_create_order(self, **params):
+            self.calls.append((self.timestamp_offset, self.REQUEST_RECVWINDOW))
+            if len(self.calls) == 1:
+                raise _api_error(-1021, "Timestamp for this request is outside of the recvWindow.")
+            return {"orderId": 1}
+
+        def futures_time(self):
+            return {"serverTime": 0}
+
+    clock = ClockSync(clock=FakeTime(100.0), monotonic=FakeTime())
+    clock.add_sample(100.0, 100_000 + 400, 100.0)
+    fake = FakeClient()
+    client = GovernedClient(fake, RateLimitGovernor(safety=1.0), clock=clock)
+    assert client.futures_create_order(symbol="ETHUSDT")["orderId"] == 1
+    assert len(fake.calls) == 2
+    assert fake.calls[0][0] == 400
+    assert fake.calls[1][1] == 2 * fake.calls[0][1]
+    # Эндпоинт времени не подписывается и часы не трогает
+    client.futures_time()
+    assert len(fake.calls) == 2
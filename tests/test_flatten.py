@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from app import async_binance_client
+from app.binance_client import account_state
+from bench.simulator import SimClient, SimExchange, interleave, synthetic_feed
+
+SYMBOLS = ["AAAUSDT", "BBBUSDT", "CCCUSDT"]
+
+
+def _open_positions(ex: SimExchange) -> None:
+    client = SimClient(ex)
+    for i, symbol in enumerate(SYMBOLS):
+        client.futures_create_order(symbol=symbol, side="BUY" if i % 2 else "SELL", type="MARKET", quantity="0.5")
+    account_state.reconcile()
+
+
+def _exchange(install, feed_steps: int) -> SimExchange:
+    ex = SimExchange({s: {"tick": 0.01, "step": 0.001} for s in SYMBOLS})
+    ex.load_feed(interleave(*(
+        synthetic_feed(s, 100.0, 0.01, feed_steps, seed=i, trade_prob=0.8 if feed_steps > 1 else 0)
+        for i, s in enumerate(SYMBOLS)
+    )))
+    for _ in SYMBOLS:
+        ex.step()
+    install(ex)
+    _open_positions(ex)
+    return ex
+
+
+def test_flatten_closes_all_symbols_concurrently(install_sim):
+    ex = _exchange(install_sim, 20000)
+    ex.start(step_interval=0.001)
+    progress = []
+
+    async def on_progress(res):
+        progress.append(res["symbol"])
+
+    try:
+        results = asyncio.run(async_binance_client.flatten_positions(on_progress=on_progress))
+    finally:
+        ex.stop()
+    assert sorted(progress) == SYMBOLS
+    assert all(r["status"] == "closed" and r["mode"] == "maker" for r in results)
+    assert all(ex.symbols[s].position == pytest.approx(0.0) for s in SYMBOLS)
+
+
+def test_flatten_goes_to_market_after_deadline(install_sim):
+    ex = _exchange(install_sim, 1)  # стакан стоит на месте — post-only не исполнится
+    ex.start(step_interval=0.001)
+    try:
+        results = asyncio.run(async_binance_client.flatten_positions(SYMBOLS[:2], deadline=0.3))
+    finally:
+        ex.stop()
+    assert [r["mode"] for r in results] == ["market", "market"]
+    assert all(r["status"] == "closed" for r in results)
+    assert ex.symbols[SYMBOLS[0]].position == pytest.approx(0.0)
+    assert ex.symbols[SYMBOLS[2]].position == pytest.approx(-0.5)
+    # Погоня снята перед рыночным ордером
+    assert not ex._rest_get_open_orders({"symbol": SYMBOLS[0]})
+
+
+def test_flatten_partial_maker_fill_is_measured_and_finished_urgently(install_sim):
+    symbol = SYMBOLS[0]
+    book = synthetic_feed(symbol, 100.0, 0.01, 1, trade_prob=0)[0]
+    ex = SimExchange({symbol: {"tick": 0.01, "step": 0.001}})
+    ex.load_feed([book])
+    ex.step()
+    install_sim(ex)
+    SimClient(ex).futures_create_order(symbol=symbol, side="BUY", type="MARKET", quantity="0.5")
+    account_state.reconcile()
+    # Встречная сделка меньше позиции: post-only ордер исполнится частично
+    ask = book["asks"][0][0]
+    ex.load_feed([
+        {**book, "ts": 0},
+        {"type": "trade", "symbol": symbol, "side": "BUY", "price": ask + 0.05, "qty": 0.2, "ts": 300},
+    ])
+    ex.start(speed=1.0)
+    try:
+        [res] = asyncio.run(async_binance_client.flatten_positions([symbol], deadline=2.0))
+    finally:
+        ex.stop()
+    assert res["status"] == "closed" and res["mode"] == "market"
+    assert [qty for _, qty in res["orders"]] == [pytest.approx(0.2), pytest.approx(0.3)]
+    assert ex.symbols[symbol].position == pytest.approx(0.0)
+    assert not ex._rest_get_open_orders({"symbol": symbol})
+
+
+@pytest.mark.parametrize("deadline", [0, -1.0, float("nan")])
+def test_flatten_rejects_non_positive_deadline(deadline):
+    with pytest.raises(ValueError, match="positive"):
+        asyncio.run(async_binance_client.flatten_positions(["ETHUSDT"], deadline=deadline))
+    with pytest.raises(ValueError, match="positive"):
+        asyncio.run(async_binance_client.flatten_position("ETHUSDT", deadline=deadline))
@@ -0,0 +1,57 @@
+import pytest
+
+from app.handlers import decode_webhook, handle_signal, parse_signal
+from bench.simulator import SimExchange, synthetic_feed
+
+
+@pytest.fixture
+def exchange(install_sim):
+    ex = SimExchange({"ETHUSDT": {"tick": 0.01, "step": 0.001}})
+    ex.load_feed(synthetic_feed("ETHUSDT", 2000.0, 0.01, 20000, seed=7))
+    ex.step()
+    install_sim(ex)
+    ex.start(step_interval=0.001)
+    yield ex
+    ex.stop()
+
+
+def test_open_and_close_through_simulator(exchange):
+    result = handle_signal({"symbol": "ETHUSDT", "side": "BUY", "quantity": 0.05})
+    assert result["status"] == "ok"
+    exchange.drain()
+    assert exchange.symbols["ETHUSDT"].position == pytest.approx(0.05)
+
+    result = handle_signal({"symbol": "ETHUSDT", "side": "BUY", "quantity": 0, "action": "close"})
+    assert result["status"] == "ok"
+    assert exchange.symbols["ETHUSDT"].position == pytest.approx(0.0)
+    # Все исполнения — мейкерские, без единого пересечения спреда
+    assert all(t["maker"] for t in exchange.trades)
+
+
+def test_quantity_below_step_is_rejected(exchange):
+    result = handle_signal({"symbol": "ETHUSDT", "side": "SELL", "quantity": 0.0001})
+    assert result["status"] == "error"
+    assert exchange.rest_calls["futures_create_order"] == 0
+
+
+def test_decode_webhook_checks_secret(exchange):
+    sig = decode_webhook(b'{"secret": "test", "symbol": "ethusdt", "side": "buy", "quantity": 0.01}')
+    assert (sig.symbol, sig.side, sig.quantity, sig.action) == ("ETHUSDT", "BUY", 0.01, "open")
+    assert "secret" not in sig.model_dump() and "test" not in repr(sig)
+    assert decode_webhook(b'{"secret": "wrong", "symbol": "ETHUSDT", "side": "BUY", "quantity": 1}') is None
+    assert decode_webhook(b'{"symbol": "ETHUSDT", "side": "BUY", "quantity": 1}') is None
+    assert decode_webhook(b'[1, 2]') is None
+    assert decode_webhook(b'{"secret": ') is None
+    # Детали ошибок валидации — только с верным секретом
+    assert decode_webhook(b'{"secret": "wrong", "side": "UP"}') is None
+    with pytest.raises(ValueError, match="side"):
+        decode_webhook(b'{"secret": "test", "symbol": "ETHUSDT", "side": "UP", "quantity": 1}')
+    with pytest.raises(ValueError, match="not traded"):
+        decode_webhook(b'{"secret": "test", "symbol": "DOGEUSDT", "side": "BUY", "quantity": 1}')
+
+
+def test_parse_signal_whitelists_symbols(exchange):
+    sig = parse_signal({"symbol": "ethusdt", "side": "sell", "quantity": 0.01, "action": "CLOSE"})
+    assert (sig.symbol, sig.side, sig.action) == ("ETHUSDT", "SELL", "close")
+    with pytest.raises(ValueError, match="not traded"):
+        parse_signal({"symbol": "DOGEUSDT", "side": "BUY", "quantity": 1})
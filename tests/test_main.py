@@ -0,0 +1,86 @@
+import json
+import time
+
+import pytest
+
+from app.main import app, order_scheduler, orderbook_broadcaster
+from app.order_scheduler import TwapAlgo
+from bench.simulator import SimExchange, synthetic_feed
+
+SECRET = "?secret=test"
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def exchange(install_sim):
+    ex = SimExchange({"ETHUSDT": {"tick": 0.01, "step": 0.001}})
+    ex.load_feed(synthetic_feed("ETHUSDT", 2000.0, 0.01, 20000, seed=7))
+    ex.step()
+    install_sim(ex)
+    ex.start(step_interval=0.001)
+    yield ex
+    ex.stop()
+
+
+def _signal(client, signal_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while True:
+        resp = client.get(f"/signals/{signal_id}{SECRET}")
+        if resp.json["status"] not in ("queued", "running") or time.time() > deadline:
+            return resp
+        time.sleep(0.01)
+
+
+def test_webhook_accepts_signal_and_reports_its_status(client, exchange):
+    body = json.dumps({"secret": "test", "symbol": "ETHUSDT", "side": "BUY", "quantity": 0.05})
+    assert client.post("/webhook", data=body).status_code == 401
+    resp = client.post(f"/webhook{SECRET}", data=body)
+    assert resp.status_code == 202 and resp.json["status"] == "accepted"
+    signal_id = resp.json["signal_id"]
+
+    assert client.get(f"/signals/{signal_id}").status_code == 401
+    resp = _signal(client, signal_id)
+    assert resp.status_code == 200 and resp.json["status"] == "done"
+    assert client.get(f"/signals/unknown{SECRET}").status_code == 404
+
+
+def test_parent_can_be_cancelled(client, exchange):
+    parent = order_scheduler.submit("ETHUSDT", "BUY", 0.05, TwapAlgo(60, 60), "main")
+    assert client.delete(f"/api/parents/{parent.parent_id}").status_code == 401
+    assert parent.status == "active"
+    resp = client.delete(f"/api/parents/{parent.parent_id}{SECRET}")
+    assert resp.status_code == 200 and resp.json["status"] == "cancelled"
+    assert client.delete(f"/api/parents/unknown{SECRET}").status_code == 404
+    # Начатый дочерний ордер дорабатывает свой бюджет — ждём его, пока симулятор подключён
+    deadline = time.time() + 5
+    while parent.child_running and time.time() < deadline:
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("path", ["/api/parents", "/api/parents/unknown", "/api/risk", "/api/clock"])
+def test_state_endpoints_require_the_secret(client, path):
+    assert client.get(path).status_code == 401
+    assert client.get(path + "?secret=wrong").status_code == 401
+    assert client.get(path + SECRET).status_code in (200, 404)
+
+
+def test_ready_and_metrics(client):
+    resp = client.get("/ready")
+    assert resp.status_code == (200 if resp.json["ready"] else 503)
+    resp = client.get("/metrics")
+    assert resp.status_code == 200 and b"orderbook_ws_subscribers" in resp.data
+
+
+def test_orderbook_socket_is_refused_when_full(client, monkeypatch):
+    monkeypatch.setattr(orderbook_broadcaster, "max_subscribers", 1)
+    sub = orderbook_broadcaster.subscribe({"ETHUSDT"})
+    try:
+        resp = client.get("/ws/orderbook")
+        assert resp.status_code == 503
+        assert resp.json["detail"] == "Too many order book subscribers"
+    finally:
+        orderbook_broadcaster.unsubscribe(sub)
@@ -0,0 +1,166 @@
+import time
+from threading import Event
+
+import pytest
+
+from app.market_hub import MarketDataHub
+
+
+class FakeSockets:
+    def __init__(self):
+        self.open: dict[str, tuple[list[str], object]] = {}
+        self.started = 0
+        self.stopped = []
+
+    def start(self, streams, callback):
+        self.started += 1
+        name = f"sock{self.started}"
+        self.open[name] = (streams, callback)
+        return name
+
+    def stop(self, name):
+        self.stopped.append(name)
+        self.open.pop(name)
+
+    def send(self, stream, payload):
+        for streams, callback in list(self.open.values()):
+            if stream in streams:
+                callback({"stream": stream, "data": payload})
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _hub(sockets, **kwargs):
+    return MarketDataHub(sockets.start, sockets.stop, **kwargs)
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_streams_are_packed_into_few_sockets():
+    sockets = FakeSockets()
+    hub = _hub(sockets, max_streams=5)
+    hub.add_symbols(["ETHUSDT", "BTCUSDT"])
+    assert sorted(len(s) for s, _ in sockets.open.values()) == [3, 5]
+    assert "ethusdt@markPrice@1s" in sum((s for s, _ in sockets.open.values()), [])
+    # Повторная подписка ничего не пересоздаёт
+    assert hub.add_symbols(["ETHUSDT"]) == []
+    assert sockets.started == 2
+
+
+def test_dispatch_feeds_inline_handler_and_latest_cache():
+    sockets = FakeSockets()
+    seen = []
+    hub = _hub(sockets, on_message=seen.append)
+    hub.add_symbols(["ETHUSDT"])
+    sockets.send("ethusdt@bookTicker", {"e": "bookTicker", "s": "ETHUSDT", "b": "10", "a": "11"})
+    assert seen[0]["e"] == "bookTicker"
+    assert hub.latest("bookTicker", "ETHUSDT")["a"] == "11"
+    assert hub.symbol_age("ETHUSDT") < 1
+    assert hub.stale_symbols() == []
+
+
+def test_slow_subscriber_gets_conflated_tickers_and_bounded_queue():
+    sockets = FakeSockets()
+    hub = _hub(sockets)
+    hub.add_symbols(["ETHUSDT"])
+    release = Event()
+    received = []
+
+    def slow(kind, payload):
+        release.wait(2)
+        received.append((kind, payload.get("b") or payload.get("a")))
+
+    sub = hub.subscribe(slow, kinds=("bookTicker", "aggTrade"), maxsize=2, name="slow")
+    sockets.send("ethusdt@aggTrade", {"e": "aggTrade", "s": "ETHUSDT", "a": 0})
+    time.sleep(0.05)  # первое событие уже в обработке
+    for i in range(1, 4):
+        sockets.send("ethusdt@aggTrade", {"e": "aggTrade", "s": "ETHUSDT", "a": i})
+    for b in ("1", "2", "3"):
+        sockets.send("ethusdt@bookTicker", {"e": "bookTicker", "s": "ETHUSDT", "b": b, "a": "9"})
+    sockets.send("ethusdt@markPrice@1s", {"e": "markPriceUpdate", "s": "ETHUSDT", "p": "5"})
+    assert sub.dropped == 1 and sub.conflated == 2
+    release.set()
+    assert _wait_for(lambda: len(received) == 4)
+    assert received == [("aggTrade", 0), ("aggTrade", 2), ("aggTrade", 3), ("bookTicker", "3")]
+    hub.unsubscribe(sub)
+
+
+def test_stalled_socket_reconnects_with_backoff():
+    sockets = FakeSockets()
+    clock = Clock()
+    hub = _hub(sockets, stall_timeout=10, clock=clock)
+    hub.add_symbols(["ETHUSDT"])
+    clock.now += 11
+    hub.check()
+    assert sockets.stopped == ["sock1"] and not sockets.open
+    assert hub.status()["sockets"][0]["connected"] is False
+    clock.now += 2  # задержка 1 с * [0.5, 1.5]
+    hub.check()
+    assert sockets.started == 2
+    sockets.send("ethusdt@depth@100ms", {"e": "depthUpdate", "s": "ETHUSDT", "U": 1, "u": 2})
+    assert hub.status()["sockets"][0]["failures"] == 0
+
+
+def test_socket_error_schedules_reconnect():
+    sockets = FakeSockets()
+    hub = _hub(sockets)
+    hub.add_symbols(["ETHUSDT"])
+    sockets.send("ethusdt@aggTrade", {"e": "error", "m": "Max reconnections reached"})
+    assert not sockets.open
+
+
+def test_dynamic_symbols_expire_when_idle():
+    sockets = FakeSockets()
+    clock = Clock()
+    removed = []
+    hub = _hub(sockets, idle_ttl=60, on_remove=removed.extend, clock=clock, max_streams=8, stall_timeout=1000)
+    hub.add_symbols(["ETHUSDT"])
+    hub.add_symbols(["SOLUSDT"], pinned=False)
+    hub.add_symbols(["XRPUSDT"], pinned=False)
+    # Символы на лету открывают свои сокеты, не трогая общий
+    assert sockets.started == 3 and not sockets.stopped
+    clock.now += 50
+    assert hub.touch("SOLUSDT") and hub.touch("XRPUSDT")
+    clock.now += 50
+    hub.check()
+    assert hub.symbols() == {"ETHUSDT", "SOLUSDT", "XRPUSDT"}
+    hub.touch("XRPUSDT")
+    clock.now += 11
+    hub.check()
+    assert removed == ["SOLUSDT"] and hub.symbols() == {"ETHUSDT", "XRPUSDT"}
+    assert sockets.stopped == ["sock2"]
+    assert sorted(streams[0].split("@")[0] for streams, _ in sockets.open.values()) == ["ethusdt", "xrpusdt"]
+    # Освободившийся сокет символа переиспользуется
+    hub.add_symbols(["ADAUSDT"], pinned=False)
+    assert len(hub.status()["sockets"]) == 3 and sockets.stopped == ["sock2"]
+
+
+def test_unknown_channel_rejected():
+    with pytest.raises(ValueError):
+        MarketDataHub(lambda s, c: "x", lambda n: None, channels=("depth", "kline"))
+
+
+def test_sockets_start_outside_the_hub_lock():
+    sockets = FakeSockets()
+    locked = []
+
+    def start(streams, callback):
+        locked.append(hub._lock.locked())
+        return sockets.start(streams, callback)
+
+    hub = MarketDataHub(start, sockets.stop)
+    hub.add_symbols(["ETHUSDT"])
+    hub.add_symbols(["SOLUSDT"], pinned=False)
+    assert locked == [False, False]
+    assert hub.status()["sockets"][0]["connected"]
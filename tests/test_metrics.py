@@ -0,0 +1,42 @@
+import time
+
+import pytest
+
+from app import metrics
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", True)
+
+
+def test_histogram_renders_cumulative_buckets(enabled):
+    h = metrics.Histogram("test_seconds", "test", ("stage",), buckets=(0.1, 1.0))
+    h.observe(0.05, ("book",))
+    h.observe(0.5, ("book",))
+    h.observe(5.0, ("book",))
+    lines = h.render()
+    assert 'test_seconds_bucket{stage="book",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="book",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{stage="book",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="book"} 3' in lines
+
+
+def test_span_records_stage(enabled):
+    before = metrics.signal_stage_seconds.count(("unit",))
+    with metrics.span("unit"):
+        pass
+    assert metrics.signal_stage_seconds.count(("unit",)) == before + 1
+    assert "signal_stage_seconds_count{stage=\"unit\"}" in metrics.render()
+
+
+def test_disabled_span_is_cheap(monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", False)
+    n = 200_000
+    started = time.perf_counter()
+    for _ in range(n):
+        with metrics.span("noop"):
+            pass
+    per_span = (time.perf_counter() - started) / n
+    assert per_span < 1e-6
+    assert metrics.signal_stage_seconds.count(("noop",)) == 0
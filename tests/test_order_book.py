@@ -0,0 +1,50 @@
+from app.order_book import LocalOrderBook
+
+
+SNAPSHOT = {
+    "lastUpdateId": 100,
+    "bids": [["99.0", "1"], ["98.5", "2"], ["98.0", "3"]],
+    "asks": [["100.0", "1"], ["100.5", "2"]],
+}
+
+
+def _event(first, final, prev, bids=(), asks=()):
+    return {"e": "depthUpdate", "s": "ETHUSDT", "E": 1, "U": first, "u": final, "pu": prev,
+            "b": [list(b) for b in bids], "a": [list(a) for a in asks]}
+
+
+def test_snapshot_and_best():
+    book = LocalOrderBook("ETHUSDT")
+    assert book.best() is None
+    book.apply_snapshot(SNAPSHOT)
+    assert book.best() == (99.0, 100.0)
+    top = book.top(2)
+    assert top["bids"] == [[99.0, 1.0], [98.5, 2.0]]
+    assert top["asks"] == [[100.0, 1.0], [100.5, 2.0]]
+
+
+def test_incremental_updates():
+    book = LocalOrderBook("ETHUSDT")
+    book.apply_snapshot(SNAPSHOT)
+    # Устаревшее событие игнорируется
+    assert book.apply_diff(_event(90, 95, 89, bids=[("99.5", "5")]))
+    assert book.best() == (99.0, 100.0)
+
+    assert book.apply_diff(_event(98, 102, 97, bids=[("99.5", "5")], asks=[("100.0", "0")]))
+    assert book.best() == (99.5, 100.5)
+    assert book.apply_diff(_event(103, 104, 102, bids=[("99.5", "0"), ("99.0", "0")]))
+    assert book.best() == (98.5, 100.5)
+    assert book.last_update_id == 104
+
+
+def test_gap_detection():
+    book = LocalOrderBook("ETHUSDT")
+    assert not book.apply_diff(_event(1, 2, 0))
+    book.apply_snapshot(SNAPSHOT)
+    assert not book.apply_diff(_event(105, 106, 104))
+    assert not book.synced
+
+    book.apply_snapshot(SNAPSHOT)
+    assert book.apply_diff(_event(99, 101, 98))
+    assert not book.apply_diff(_event(110, 111, 109))
+    assert book.best() is None
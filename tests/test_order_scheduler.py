@@ -0,0 +1,144 @@
+import time
+from threading import Event
+
+import pytest
+
+from app.config import settings
+from app.order_scheduler import ParentOrder, ParentOrderScheduler, TwapAlgo, IcebergAlgo, PovAlgo, make_algo
+from bench.simulator import SimExchange, synthetic_feed
+from app.symbol_metadata import SymbolInfo
+
+INFO = SymbolInfo("ETHUSDT", "TRADING", 0.01, 0.001, 0.001, 5.0, 2, 3)
+
+
+def _wait(parent, timeout=3.0):
+    deadline = time.time() + timeout
+    while parent.status == "active" and time.time() < deadline:
+        time.sleep(0.01)
+    return parent
+
+
+def _scheduler(run_child):
+    return ParentOrderScheduler(run_child, lambda symbol: INFO)
+
+
+def test_twap_splits_into_equal_slices():
+    children = []
+
+    def run_child(parent, qty, budget):
+        children.append((qty, time.monotonic()))
+        return qty
+
+    scheduler = _scheduler(run_child)
+    parent = scheduler.submit("ETHUSDT", "buy", 0.9, TwapAlgo(duration=0.3, slices=3), "main")
+    _wait(parent)
+    assert parent.status == "done" and parent.filled == pytest.approx(0.9)
+    assert [q for q, _ in children] == pytest.approx([0.3, 0.3, 0.3])
+    # Части разнесены по интервалам duration / slices
+    assert children[2][1] - children[0][1] >= 0.18
+
+
+def test_twap_carries_shortfall_into_next_slices():
+    fills = iter([0.1, 0.4, 0.4])
+    scheduler = _scheduler(lambda parent, qty, budget: min(qty, next(fills)))
+    parent = scheduler.submit("ETHUSDT", "SELL", 0.9, TwapAlgo(duration=0.15, slices=3), "main")
+    _wait(parent)
+    assert parent.filled == pytest.approx(0.9)
+    assert parent.children == 3
+
+
+def test_iceberg_shows_only_visible_qty():
+    children = []
+    scheduler = _scheduler(lambda parent, qty, budget: children.append(qty) or qty)
+    parent = scheduler.submit("ETHUSDT", "BUY", 1.0, IcebergAlgo(visible_qty=0.3), "main")
+    _wait(parent)
+    assert children == pytest.approx([0.3, 0.3, 0.3, 0.1])
+    assert parent.status == "done"
+
+
+def test_pov_waits_for_market_volume():
+    children = []
+    scheduler = _scheduler(lambda parent, qty, budget: children.append(qty) or qty)
+    parent = scheduler.submit("ETHUSDT", "BUY", 1.0, PovAlgo(participation=0.1, interval=0.05), "main")
+    time.sleep(0.15)
+    assert children == []
+    scheduler.on_market_event("trade", {"s": "ETHUSDT", "q": "5"})
+    deadline = time.time() + 2
+    while not children and time.time() < deadline:
+        time.sleep(0.01)
+    assert children == pytest.approx([0.5])
+    scheduler.cancel(parent.parent_id)
+
+
+def test_cancel_stops_new_children_and_failure_marks_parent():
+    started = Event()
+    release = Event()
+
+    def run_child(parent, qty, budget):
+        started.set()
+        release.wait(2)
+        return qty
+
+    scheduler = _scheduler(run_child)
+    parent = scheduler.submit("ETHUSDT", "BUY", 1.0, IcebergAlgo(visible_qty=0.2), "main")
+    assert started.wait(2)
+    assert scheduler.cancel_symbol("main", "ETHUSDT") == 1
+    release.set()
+    time.sleep(0.1)
+    assert parent.status == "cancelled"
+    assert parent.children == 1 and parent.filled == pytest.approx(0.2)
+
+    failing = _scheduler(lambda parent, qty, budget: 1 / 0)
+    parent = failing.submit("ETHUSDT", "BUY", 1.0, IcebergAlgo(visible_qty=0.2), "main")
+    _wait(parent)
+    assert parent.status == "failed" and "division" in parent.error
+
+
+def test_make_algo_validates_params():
+    assert make_algo("twap", duration=60, slices=6, visible_qty=None).interval == 10
+    with pytest.raises(ValueError):
+        make_algo("vwap")
+    with pytest.raises(ValueError):
+        make_algo("pov", participation=2)
+
+
+def test_child_order_returns_the_measured_partial_fill(install_sim):
+    from app.binance_client import place_child_order
+
+    book = synthetic_feed("ETHUSDT", 2000.0, 0.01, 1, trade_prob=0)[0]
+    ex = SimExchange({"ETHUSDT": {"tick": 0.01, "step": 0.001}})
+    ex.load_feed([book])
+    ex.step()
+    install_sim(ex)
+    # Встречная сделка меньше дочернего ордера: погоня вернётся с PARTIALLY_FILLED
+    ex.load_feed([
+        {**book, "ts": 0},
+        {"type": "trade", "symbol": "ETHUSDT", "side": "SELL", "price": book["bids"][0][0] - 0.05,
+         "qty": 0.02, "ts": 300},
+    ])
+    parent = ParentOrder("p-partial", settings.default_account, "ETHUSDT", "BUY", 0.05, TwapAlgo(60, 1))
+    ex.start(speed=1.0)
+    try:
+        filled = place_child_order(parent, 0.05, 2.0)
+    finally:
+        ex.stop()
+    assert filled == pytest.approx(0.02)
+    assert ex.symbols["ETHUSDT"].position == pytest.approx(0.02)
+    assert not ex._rest_get_open_orders({"symbol": "ETHUSDT"})
+
+
+def test_children_are_raised_to_min_qty():
+    children = []
+
+    def run_child(parent, qty, budget):
+        children.append(qty)
+        return qty
+
+    info = SymbolInfo("ETHUSDT", "TRADING", 0.01, 0.001, 0.4, 5.0, 2, 3)
+    scheduler = ParentOrderScheduler(run_child, lambda symbol: info)
+    with pytest.raises(ValueError, match="min qty"):
+        scheduler.submit("ETHUSDT", "buy", 0.3, TwapAlgo(duration=0.3, slices=3), "main")
+    parent = scheduler.submit("ETHUSDT", "buy", 0.9, TwapAlgo(duration=0.3, slices=3), "main")
+    _wait(parent)
+    assert children == pytest.approx([0.4, 0.4])
+    assert parent.status == "partial" and parent.filled == pytest.approx(0.8)
@@ -0,0 +1,82 @@
+import time
+from threading import Thread
+
+from app import websocket_manager
+from app.order_tracker import OrderTracker, order_tracker
+
+
+def _update(order_id, status, filled="0", exec_type="NEW"):
+    return {
+        "e": "ORDER_TRADE_UPDATE",
+        "o": {"s": "ETHUSDT", "c": "abc", "S": "BUY", "q": "1", "p": "100", "ap": "100",
+              "x": exec_type, "X": status, "i": order_id, "l": filled, "z": filled,
+              "L": "100", "n": "0.01", "rp": "0"},
+    }
+
+
+def test_wait_resolves_on_fill():
+    tracker = OrderTracker()
+    tracker.on_order_update(_update(1, "NEW"))
+
+    def fill():
+        time.sleep(0.05)
+        tracker.on_order_update(_update(1, "FILLED", "1", "TRADE"))
+
+    Thread(target=fill).start()
+    started = time.time()
+    state = tracker.wait(1, timeout=2.0)
+    assert time.time() - started < 1.0
+    assert state.status == "FILLED"
+    assert state.filled_qty == 1.0
+    assert state.commission == 0.01
+    assert state.as_dict()["executedQty"] == "1.0"
+
+
+def test_wait_timeout_returns_last_state():
+    tracker = OrderTracker()
+    assert tracker.wait(2, timeout=0.01) is None
+    tracker.on_order_update(_update(2, "NEW"))
+    assert tracker.wait(2, timeout=0.01).status == "NEW"
+    tracker.on_order_update(_update(2, "EXPIRED", exec_type="EXPIRED"))
+    assert tracker.wait(2, timeout=0.01).status == "EXPIRED"
+
+
+def test_wait_async_resolved_from_other_thread():
+    import asyncio
+
+    tracker = OrderTracker()
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, lambda: Thread(
+            target=tracker.on_order_update, args=(_update(3, "PARTIALLY_FILLED", "0.5", "TRADE"),)
+        ).start())
+        state = await tracker.wait_async(3, timeout=2.0)
+        assert state.status == "PARTIALLY_FILLED"
+        assert not tracker._waiters
+        assert (await tracker.wait_async(4, timeout=0.01)) is None
+
+    asyncio.run(scenario())
+
+
+def test_stream_health_is_tracked_per_account():
+    websocket_manager._on_user_event({"e": "ACCOUNT_UPDATE", "a": {}}, account="stream-a")
+    websocket_manager._on_user_event({"e": "ACCOUNT_UPDATE", "a": {}}, account="stream-b")
+    websocket_manager._on_user_event({"e": "error", "m": "connection lost"}, account="stream-b")
+    assert order_tracker.is_active("stream-a")
+    assert not order_tracker.is_active("stream-b")
+    websocket_manager._on_user_event({"e": "listenKeyExpired"}, account="stream-a")
+    websocket_manager._on_user_event({"e": "ACCOUNT_UPDATE", "a": {}}, account="stream-b")
+    assert not order_tracker.is_active("stream-a")
+    assert order_tracker.is_active("stream-b")
+
+
+def test_silent_stream_goes_stale_until_the_next_event():
+    tracker = OrderTracker(stale_after=0.05)
+    assert tracker.set_active("stream-c", True)
+    assert not tracker.set_active("stream-c", True)
+    assert tracker.is_active("stream-c")
+    time.sleep(0.08)
+    assert not tracker.is_active("stream-c")
+    assert tracker.set_active("stream-c", True)
+    assert tracker.is_active("stream-c")
@@ -0,0 +1,84 @@
+import pytest
+
+from app.book_analytics import BookAnalytics
+from app.order_book import LocalOrderBook
+from app.orderbook_stream import OrderBookBroadcaster, SubscriberLimitReached
+
+
+def _setup():
+    book = LocalOrderBook("ETHUSDT")
+    book.apply_snapshot({"lastUpdateId": 1, "bids": [["99", "1"], ["98", "2"]], "asks": [["100", "1"]]})
+    calls = []
+
+    def snapshot(symbol, depth):
+        calls.append(symbol)
+        return book.top(depth)
+
+    broadcaster = OrderBookBroadcaster(snapshot, lambda s: book.version, depth=2, min_interval=0)
+    return book, broadcaster, calls
+
+
+def test_snapshot_then_delta():
+    book, broadcaster, _ = _setup()
+    sub = broadcaster.subscribe({"ETHUSDT"})
+    first = broadcaster.next_messages(sub, timeout=0)
+    assert first[0]["type"] == "snapshot"
+    assert first[0]["bids"] == [[99.0, 1.0], [98.0, 2.0]]
+
+    assert broadcaster.next_messages(sub, timeout=0) == []
+    book.apply_diff({"U": 1, "u": 2, "pu": 0, "b": [["99", "0"], ["97", "5"]], "a": []})
+    broadcaster.on_book_update("ETHUSDT")
+    delta = broadcaster.next_messages(sub, timeout=0)[0]
+    assert delta["type"] == "delta"
+    assert sorted(delta["bids"]) == [[97.0, 5.0], [99.0, 0]]
+    assert delta["asks"] == []
+
+
+def test_updates_coalesce_and_top_is_shared():
+    book, broadcaster, calls = _setup()
+    subs = [broadcaster.subscribe({"ETHUSDT"}) for _ in range(5)]
+    for sub in subs:
+        broadcaster.next_messages(sub, timeout=0)
+    assert len(calls) == 1
+
+    for i in range(2, 12):
+        book.apply_diff({"U": i - 1, "u": i, "pu": i - 1, "b": [["98", str(i)]], "a": []})
+        broadcaster.on_book_update("ETHUSDT")
+    messages = [broadcaster.next_messages(sub, timeout=0) for sub in subs]
+    assert all(len(m) == 1 for m in messages)
+    assert messages[0][0]["bids"] == [[98.0, 11.0]]
+    assert len(calls) == 2
+
+
+def test_unsubscribed_symbols_ignored():
+    _, broadcaster, _ = _setup()
+    sub = broadcaster.subscribe(set())
+    broadcaster.on_book_update("ETHUSDT")
+    assert broadcaster.next_messages(sub, timeout=0) == []
+    broadcaster.update_symbols(sub, add={"ETHUSDT"})
+    assert broadcaster.next_messages(sub, timeout=0)[0]["type"] == "snapshot"
+
+
+def test_messages_carry_server_side_stats():
+    book, _, _ = _setup()
+    analytics = BookAnalytics(lambda s, d: book.top(d), lambda s: book.version)
+    broadcaster = OrderBookBroadcaster(
+        lambda s, d: book.top(d), lambda s: book.version, depth=2, min_interval=0, stats=analytics.summary
+    )
+    sub = broadcaster.subscribe({"ETHUSDT"})
+    stats = broadcaster.next_messages(sub, timeout=0)[0]["stats"]
+    assert stats["top_qty"] == {"bid": 3.0, "ask": 1.0}
+    assert stats["spread"] == 1.0
+
+
+def test_subscriber_limit():
+    _, broadcaster, _ = _setup()
+    broadcaster.max_subscribers = 2
+    first = broadcaster.subscribe({"ETHUSDT"})
+    broadcaster.subscribe({"ETHUSDT"})
+    assert broadcaster.is_full()
+    with pytest.raises(SubscriberLimitReached):
+        broadcaster.subscribe({"ETHUSDT"})
+    broadcaster.unsubscribe(first)
+    assert not broadcaster.is_full()
+    broadcaster.subscribe({"ETHUSDT"})
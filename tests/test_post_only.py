@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+import pytest
+
+from app import post_only
+from app.repricer import JoinTouchPolicy, RepricingEngine
+from app.symbol_metadata import SymbolInfo
+from bench.simulator import _api_error
+
+
+class FakeIO:
+    def __init__(self):
+        self.calls = []
+
+    def futures_modify_order(self, **params):
+        self.calls.append("modify")
+        raise _api_error(-2013, "Order does not exist.")
+
+    def futures_cancel_order(self, **params):
+        self.calls.append("cancel")
+        raise _api_error(-2011, "Unknown order sent.")
+
+    def futures_create_order(self, **params):
+        self.calls.append("create")
+        return {"orderId": 2, **params}
+
+    def futures_get_open_orders(self, symbol):
+        return [
+            {"orderId": 1, "type": "LIMIT", "side": "BUY"},
+            {"orderId": 3, "type": "LIMIT", "side": "SELL"},
+            {"orderId": 4, "type": "STOP_MARKET", "side": "BUY"},
+        ]
+
+    def cancel_orders(self, symbol, order_ids):
+        self.calls.append(("cancel_orders", order_ids))
+        return []
+
+
+class ChaseIO(FakeIO):
+    def position(self, symbol):
+        return 0.0
+
+    def book(self, symbol):
+        return {"bid": 100.0, "ask": 100.01}
+
+    def wait(self, symbol, seq, timeout):
+        return False
+
+
+class AsyncFakeIO:
+    def __init__(self, io: FakeIO):
+        self._io = io
+
+    def __getattr__(self, name):
+        method = getattr(self._io, name)
+
+        async def call(**params):
+            return method(**params)
+
+        return call
+
+
+def test_replace_falls_back_to_cancel_and_create_in_both_runners():
+    sync_io = FakeIO()
+    order = post_only.run(post_only.replace_order("ETHUSDT", 1, "BUY", "0.1", "100.00"), sync_io)
+    assert order["orderId"] == 2 and order["timeInForce"] == "GTX"
+
+    async_io = FakeIO()
+    order = asyncio.run(
+        post_only.run_async(post_only.replace_order("ETHUSDT", 1, "BUY", "0.1", "100.00"), AsyncFakeIO(async_io))
+    )
+    assert order["orderId"] == 2
+    assert sync_io.calls == async_io.calls == ["modify", "cancel", "create"]
+
+
+def test_cancel_open_orders_keeps_protective_orders():
+    io = FakeIO()
+    post_only.run(post_only.cancel_open_orders("ETHUSDT", "BUY"), io)
+    assert io.calls == [("cancel_orders", [1])]
+
+
+@pytest.mark.parametrize("quantity, error", [(0.0015, "min qty"), (0.04, "min notional")])
+def test_chase_rejects_orders_below_symbol_minimums(quantity, error):
+    info = SymbolInfo("ETHUSDT", "TRADING", 0.01, 0.001, 0.002, 5.0, 2, 3)
+    repricer = RepricingEngine(lambda s: None, lambda *a: None, JoinTouchPolicy())
+    io = ChaseIO()
+    steps = post_only.chase_post_only(repricer, info, "BUY", quantity, "main", 0.1, 0.01, 3)
+    with pytest.raises(ValueError, match=error):
+        post_only.run(steps, io)
+    assert "create" not in io.calls
+
+
+def test_cancel_open_orders_returns_rejected_cancels():
+    class RejectingIO(FakeIO):
+        def cancel_orders(self, symbol, order_ids):
+            return [{"code": -2011, "msg": "Unknown order sent."}]
+
+    errors = post_only.run(post_only.cancel_open_orders("ETHUSDT"), RejectingIO())
+    assert errors == [{"code": -2011, "msg": "Unknown order sent."}]
+    assert post_only.run(post_only.cancel_open_orders("ETHUSDT"), FakeIO()) == []
+
+
+def test_cancel_orders_logs_rejected_entries(caplog):
+    from types import SimpleNamespace
+    from app.binance_client import cancel_orders
+
+    client = SimpleNamespace(futures_cancel_orders=lambda symbol, orderidlist: [
+        {"orderId": 1, "status": "CANCELED"}, {"code": -2011, "msg": "Unknown order sent."}
+    ])
+    results = cancel_orders("ETHUSDT", [1, 2], account=SimpleNamespace(client=client))
+    assert len(results) == 2
+    assert "Cancel of order 2 ETHUSDT rejected: Unknown order sent." in caplog.text
+
+
+def test_chase_follows_the_touch_and_cancels_the_resting_order_on_timeout():
+    class MovingIO(ChaseIO):
+        bid = 100.0
+
+        def book(self, symbol):
+            # Touch уходит на 1% за погоню — дальше max_deviation_pct от начального
+            self.bid = round(self.bid + 0.5, 2)
+            return {"bid": self.bid, "ask": self.bid + 0.01}
+
+        def futures_modify_order(self, **params):
+            self.calls.append(("modify", params["price"]))
+            return {"orderId": params["orderId"]}
+
+        def futures_get_order(self, symbol, orderId):
+            return {"orderId": orderId, "status": "NEW"}
+
+        def futures_cancel_order(self, symbol, orderId):
+            self.calls.append(("cancel", orderId))
+
+        def wait(self, symbol, seq, timeout):
+            time.sleep(timeout)
+            return False
+
+    info = SymbolInfo("ETHUSDT", "TRADING", 0.01, 0.001, 0.001, 5.0, 2, 3)
+    repricer = RepricingEngine(lambda s: None, lambda *a: None, JoinTouchPolicy(), min_amend_interval=0)
+    io = MovingIO()
+    steps = post_only.chase_post_only(repricer, info, "BUY", 0.1, "main", 0.1, 0.02, 5)
+    with pytest.raises(RuntimeError, match="not filled"):
+        post_only.run(steps, io)
+    assert io.calls[0] == "create"
+    assert [c[1] for c in io.calls if c[0] == "modify"][:2] == ["101.00", "101.50"]
+    assert io.calls[-1] == ("cancel", 2)
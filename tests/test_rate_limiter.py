@@ -0,0 +1,61 @@
+import time
+from threading import Thread
+
+from app.rate_limiter import (
+    GovernedClient,
+    RateLimitGovernor,
+    PRIORITY_ORDER,
+    PRIORITY_INFO,
+    request_cost,
+)
+
+
+def test_request_cost():
+    assert request_cost("futures_create_order", {}) == (1, 1, PRIORITY_ORDER)
+    assert request_cost("futures_order_book", {"limit": 1000})[0] == 20
+    assert request_cost("futures_get_open_orders", {})[0] == 40
+    assert request_cost("futures_place_batch_order", {"batchOrders": [{}, {}, {}]})[1] == 3
+
+
+def test_header_sync_and_metrics():
+    gov = RateLimitGovernor(limits={("REQUEST_WEIGHT", 60): 100}, safety=1.0)
+    gov.update_from_headers({"X-MBX-USED-WEIGHT-1M": "90"})
+    assert gov.metrics()["available"]["REQUEST_WEIGHT_60s"] == 10
+    gov.acquire(weight=5)
+    assert gov.metrics()["granted"] == 1
+
+
+def test_priority_order_goes_first():
+    gov = RateLimitGovernor(limits={("REQUEST_WEIGHT", 1): 10}, safety=1.0)
+    gov.acquire(weight=10)
+    granted = []
+
+    def worker(priority, name):
+        gov.acquire(weight=2, priority=priority)
+        granted.append(name)
+
+    info = Thread(target=worker, args=(PRIORITY_INFO, "info"))
+    info.start()
+    time.sleep(0.02)
+    order = Thread(target=worker, args=(PRIORITY_ORDER, "order"))
+    order.start()
+    info.join(2)
+    order.join(2)
+    assert granted == ["order", "info"]
+    assert gov.metrics()["waited"] == 2
+
+
+def test_governed_client_syncs_headers():
+    class Response:
+        headers = {"X-MBX-ORDER-COUNT-10S": "250"}
+
+    class FakeClient:
+        response = Response()
+
+        def futures_create_order(self, **params):
+            return {"orderId": 1, **params}
+
+    gov = RateLimitGovernor(safety=1.0)
+    client = GovernedClient(FakeClient(), gov)
+    assert client.futures_create_order(symbol="ETHUSDT")["orderId"] == 1
+    assert gov.metrics()["available"]["ORDERS_10s"] == 50
@@ -0,0 +1,57 @@
+import time
+from threading import Thread
+
+from app.repricer import AdaptivePolicy, Quote, RepricingEngine
+
+
+def _quote(**kw):
+    base = dict(side="BUY", bid=100.0, ask=100.01, tick=0.01, own_price=None,
+                own_qty=1.0, queue_ahead=0.0, volatility_ticks=0.0)
+    base.update(kw)
+    return Quote(**base)
+
+
+def test_adaptive_policy_keeps_competitive_order():
+    policy = AdaptivePolicy()
+    assert policy.reprice(_quote()) == 100.0
+    assert policy.reprice(_quote(own_price=100.0)) is None
+    # touch ушёл на тик вверх — догоняем
+    assert policy.reprice(_quote(bid=100.01, ask=100.02, own_price=100.0)) == 100.01
+
+
+def test_adaptive_policy_steps_inside_wide_spread_and_jumps_long_queue():
+    policy = AdaptivePolicy()
+    assert policy.reprice(_quote(ask=100.05)) == 100.02
+    assert policy.reprice(_quote(side="SELL", ask=100.05)) == 100.03
+    assert policy.reprice(_quote(ask=100.03, own_price=100.0, queue_ahead=10.0)) == 100.01
+    assert policy.reprice(_quote(ask=100.03, own_price=100.0, queue_ahead=2.0)) is None
+
+
+def test_adaptive_policy_tolerates_noise_in_volatile_market():
+    policy = AdaptivePolicy(vol_tolerance=0.5)
+    q = _quote(bid=100.02, ask=100.03, own_price=100.0, volatility_ticks=4.0)
+    assert policy.reprice(q) is None
+    q.volatility_ticks = 0.0
+    assert policy.reprice(q) == 100.02
+
+
+def test_engine_tracks_queue_and_wakes_on_book_update():
+    levels = {100.0: 5.0}
+    engine = RepricingEngine(
+        lambda s: {"bid": 100.0, "ask": 100.03},
+        lambda s, side, price: levels.get(price, 0.0),
+        min_amend_interval=0
+    )
+    chase = engine.chase("ETHUSDT", "BUY", 1.0, 0.01)
+    assert engine.decide(chase, 100.0, 100.03) == 100.01
+    engine.placed(chase, 1, 100.0)
+    assert chase.queue_ahead == 5.0
+    levels[100.0] = 3.0
+    assert engine.decide(chase, 100.0, 100.03) is None
+    assert chase.queue_ahead == 2.0
+
+    seq = engine.seq("ETHUSDT")
+    Thread(target=lambda: (time.sleep(0.05), engine.on_book_update("ETHUSDT"))).start()
+    started = time.time()
+    assert engine.wait("ETHUSDT", seq, timeout=2.0)
+    assert time.time() - started < 1.0
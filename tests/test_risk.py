@@ -0,0 +1,110 @@
+import pytest
+
+from app.account_state import PositionState
+from app.risk import RiskEngine, RiskLimits, RiskRejected, risk_rejects_total
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _engine(clock=None, **limits):
+    best = {"ETHUSDT": {"bid": 1999.0, "ask": 2001.0}}
+    return RiskEngine(RiskLimits(**limits), best.get, clock or Clock())
+
+
+def _reason(call) -> str:
+    with pytest.raises(RiskRejected) as exc:
+        call()
+    return exc.value.reason
+
+
+def test_position_and_notional_limits():
+    engine = _engine(max_position={"ETHUSDT": 2, "*": 1})
+    flat = PositionState("ETHUSDT")
+    engine.check_order("main", flat, "BUY", 2)
+    assert _reason(lambda: engine.check_order("main", PositionState("ETHUSDT", amount=1.5), "BUY", 1)) \
+        == "max_position"
+    assert _reason(lambda: engine.check_order("main", PositionState("BTCUSDT"), "SELL", 1.5)) == "max_position"
+    engine = _engine(max_notional=5000)
+    engine.check_order("main", PositionState("ETHUSDT"), "BUY", 2.4)
+    # 2.6 * 2000 > 5000
+    assert _reason(lambda: engine.check_order("main", PositionState("ETHUSDT", amount=-1), "SELL", 1.6)) \
+        == "max_notional"
+
+
+def test_reducing_orders_always_pass():
+    engine = _engine(max_position={"*": 1}, max_leverage=5, max_orders_per_minute=1)
+    big = PositionState("ETHUSDT", amount=3, leverage=20)
+    for _ in range(3):
+        engine.check_order("main", big, "SELL", 2)
+
+
+def test_leverage_and_price_band():
+    engine = _engine(max_leverage=10, price_band_bps=100)
+    flat = PositionState("ETHUSDT", leverage=5)
+    assert _reason(lambda: engine.check_order("main", flat, "BUY", 1, leverage=20)) == "max_leverage"
+    assert _reason(lambda: engine.check_order("main", PositionState("ETHUSDT", leverage=25), "BUY", 1)) \
+        == "max_leverage"
+    engine.check_order("main", flat, "BUY", 1, price=1990.0)
+    before = risk_rejects_total.value(("price_band",))
+    assert _reason(lambda: engine.check_order("main", flat, "BUY", 1, price=2100.0)) == "price_band"
+    assert risk_rejects_total.value(("price_band",)) == before + 1
+
+
+def test_order_rate_is_per_account_sliding_window():
+    clock = Clock()
+    engine = _engine(clock, max_orders_per_minute=2)
+    flat = PositionState("ETHUSDT")
+    engine.check_order("main", flat, "BUY", 1)
+    clock.now = 30
+    engine.check_order("main", flat, "BUY", 1)
+    assert _reason(lambda: engine.check_order("main", flat, "BUY", 1)) == "order_rate"
+    engine.check_order("sub1", flat, "BUY", 1)
+    clock.now = 61
+    engine.check_order("main", flat, "BUY", 1)
+
+
+def test_sliced_orders_count_each_child_placement():
+    engine = _engine(Clock(), max_orders_per_minute=2)
+    flat = PositionState("ETHUSDT")
+    engine.check_order("main", flat, "BUY", 1, count_rate=False)
+    engine.check_order_rate("main")
+    engine.check_order_rate("main")
+    assert _reason(lambda: engine.check_order_rate("main")) == "order_rate"
+    status = engine.status()
+    assert status["rejects"]["order_rate"] >= 1 and status["rejects_total"] >= status["rejects"]["order_rate"]
+
+
+def test_duplicate_signals_within_window():
+    clock = Clock()
+    engine = _engine(clock, duplicate_window=2)
+    engine.check_duplicate("main", "ETHUSDT", "BUY", 0.1, "open")
+    engine.check_duplicate("sub1", "ETHUSDT", "BUY", 0.1, "open")
+    engine.check_duplicate("main", "ETHUSDT", "BUY", 0.2, "open")
+    clock.now = 1.5
+    assert _reason(lambda: engine.check_duplicate("main", "ETHUSDT", "BUY", 0.1, "open")) == "duplicate"
+    clock.now = 2.5
+    engine.check_duplicate("main", "ETHUSDT", "BUY", 0.1, "open")
+
+
+def test_duplicate_for_one_account_records_none_of_the_group():
+    clock = Clock()
+    engine = _engine(clock, duplicate_window=2)
+    engine.check_duplicate("sub2", "ETHUSDT", "BUY", 0.1, "open")
+    group = ["main", "sub1", "sub2"]
+    assert _reason(lambda: engine.check_duplicates(group, "ETHUSDT", "BUY", 0.1, "open")) == "duplicate"
+    # Отклонённый сигнал никого не запомнил: первые аккаунты группы принимают его
+    engine.check_duplicates(["main", "sub1"], "ETHUSDT", "BUY", 0.1, "open")
+    assert _reason(lambda: engine.check_duplicate("sub1", "ETHUSDT", "BUY", 0.1, "open")) == "duplicate"
+
+
+def test_rejection_is_a_value_error_with_reason():
+    engine = _engine(max_position={"*": 1})
+    with pytest.raises(ValueError, match=r"Risk check failed \(max_position\)"):
+        engine.check_order("main", PositionState("ETHUSDT"), "BUY", 2)
+    assert engine.status()["limits"]["max_position"] == {"*": 1}
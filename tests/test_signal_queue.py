@@ -0,0 +1,78 @@
+import time
+from threading import Event
+
+from app.signal_queue import SignalQueue
+
+
+def _wait(record, timeout=2.0):
+    deadline = time.time() + timeout
+    while record.status in ("queued", "running") and time.time() < deadline:
+        time.sleep(0.01)
+    return record
+
+
+def test_signals_run_in_order_per_symbol():
+    executed = []
+    queue = SignalQueue(lambda r: executed.append((r.symbol, r.action)) or {"status": "ok"})
+    first = queue.submit("ETHUSDT", "BUY", 1, "open")
+    _wait(first)
+    second = queue.submit("ETHUSDT", "BUY", 1, "close")
+    _wait(second)
+    assert executed == [("ETHUSDT", "open"), ("ETHUSDT", "close")]
+    assert queue.get(first.signal_id).status == "done"
+    assert first.finished_at >= first.started_at >= first.received_at
+
+
+def test_pending_signals_coalesce():
+    release = Event()
+    executed = []
+
+    def execute(record):
+        release.wait(2)
+        executed.append((record.side, record.quantity, record.action))
+        return {"status": "ok"}
+
+    queue = SignalQueue(execute)
+    running = queue.submit("BTCUSDT", "BUY", 1, "open")
+    time.sleep(0.05)
+    a = queue.submit("BTCUSDT", "BUY", 1, "open")
+    b = queue.submit("BTCUSDT", "BUY", 2, "open")
+    assert b.status == "coalesced" and b.replaced_by == a.signal_id
+    c = queue.submit("BTCUSDT", "SELL", 1, "open")
+    assert a.status == "superseded"
+    d = queue.submit("BTCUSDT", "SELL", 1, "close")
+    assert c.status == "superseded" and c.replaced_by == d.signal_id
+    assert queue.depth() == {"BTCUSDT": 1}
+
+    release.set()
+    _wait(d)
+    assert executed == [("BUY", 1, "open"), ("SELL", 1, "close")]
+    assert running.status == "done"
+
+
+def test_failed_signal_recorded():
+    queue = SignalQueue(lambda r: {"status": "error", "detail": "boom"})
+    record = _wait(queue.submit("ETHUSDT", "BUY", 1, "open"))
+    assert record.status == "failed"
+    assert record.result["detail"] == "boom"
+
+
+def test_accounts_run_in_parallel_for_one_symbol():
+    release = Event()
+    started = []
+
+    def execute(record):
+        started.append(record.account)
+        release.wait(2)
+        return {"status": "ok"}
+
+    queue = SignalQueue(execute)
+    a = queue.submit("ETHUSDT", "BUY", 1, "open", account="sub1")
+    b = queue.submit("ETHUSDT", "BUY", 1, "open", account="sub2")
+    deadline = time.time() + 2
+    while len(started) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    # Сигнал второго аккаунта не ждёт первого и не схлопывается с ним
+    assert sorted(started) == ["sub1", "sub2"]
+    release.set()
+    assert _wait(a).status == _wait(b).status == "done"
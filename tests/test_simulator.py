@@ -0,0 +1,82 @@
+import pytest
+from binance.exceptions import BinanceAPIException
+
+from app.order_book import LocalOrderBook
+from bench.simulator import SimClient, SimExchange, synthetic_feed
+
+
+def _exchange():
+    ex = SimExchange({"ETHUSDT": {"tick": 0.01, "step": 0.001}})
+    ex.load_feed([{
+        "type": "depth", "symbol": "ETHUSDT",
+        "bids": [[100.0, 1.0], [99.99, 2.0]],
+        "asks": [[100.01, 1.0], [100.02, 2.0]],
+    }])
+    ex.step()
+    return ex, SimClient(ex)
+
+
+def test_post_only_crossing_is_rejected():
+    ex, client = _exchange()
+    with pytest.raises(BinanceAPIException) as err:
+        client.futures_create_order(
+            symbol="ETHUSDT", side="BUY", type="LIMIT", timeInForce="GTX", price="100.01", quantity="0.01"
+        )
+    assert err.value.code == -5022
+    assert "could not be executed as maker" in err.value.message
+    assert ex.rest_calls["futures_create_order"] == 1
+
+
+def test_resting_order_fills_on_trade_and_updates_position():
+    ex, client = _exchange()
+    events = []
+    ex.subscribe_user(events.append)
+    ex.start(step_interval=0)
+    try:
+        order = client.futures_create_order(
+            symbol="ETHUSDT", side="BUY", type="LIMIT", timeInForce="GTX", price="100.00", quantity="0.5"
+        )
+        ex.load_feed([{"type": "trade", "symbol": "ETHUSDT", "side": "SELL", "price": 100.0, "qty": 0.2}])
+        ex.load_feed([{"type": "trade", "symbol": "ETHUSDT", "side": "SELL", "price": 100.0, "qty": 1.0}])
+        while ex.step():
+            pass
+        ex.drain()
+    finally:
+        ex.stop()
+    assert client.futures_get_order(symbol="ETHUSDT", orderId=order["orderId"])["status"] == "FILLED"
+    assert ex.symbols["ETHUSDT"].position == pytest.approx(0.5)
+    statuses = [e["o"]["X"] for e in events if e["e"] == "ORDER_TRADE_UPDATE"]
+    assert statuses == ["NEW", "PARTIALLY_FILLED", "FILLED"]
+    assert any(e["e"] == "ACCOUNT_UPDATE" for e in events)
+
+
+def test_modify_to_same_price_reports_no_change():
+    _, client = _exchange()
+    order = client.futures_create_order(
+        symbol="ETHUSDT", side="SELL", type="LIMIT", timeInForce="GTX", price="100.02", quantity="0.01"
+    )
+    with pytest.raises(BinanceAPIException) as err:
+        client.futures_modify_order(
+            symbol="ETHUSDT", orderId=order["orderId"], side="SELL", quantity="0.01", price="100.02"
+        )
+    assert err.value.code == -5027
+    assert client.response.headers["X-MBX-USED-WEIGHT-1M"]
+
+
+def test_depth_stream_keeps_local_book_in_sync():
+    ex, client = _exchange()
+    diffs = []
+    ex.subscribe_depth(lambda msg: diffs.append(msg["data"]))
+    book = LocalOrderBook("ETHUSDT")
+    book.apply_snapshot(client.futures_order_book(symbol="ETHUSDT", limit=1000))
+    ex.load_feed(synthetic_feed("ETHUSDT", 100.0, 0.01, 50, seed=3))
+    while ex.step():
+        pass
+    ex.start()
+    try:
+        ex.drain()
+    finally:
+        ex.stop()
+    assert all(book.apply_diff(d) for d in diffs)
+    sim = ex.symbols["ETHUSDT"]
+    assert book.best() == (sim.best_bid(), sim.best_ask())
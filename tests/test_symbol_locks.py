@@ -0,0 +1,30 @@
+import asyncio
+import threading
+
+from app.symbol_locks import SymbolLocks
+
+
+def test_same_symbol_same_lock():
+    locks = SymbolLocks()
+    assert locks["BTCUSDT"] is locks["BTCUSDT"]
+    assert locks["BTCUSDT"] is not locks["ETHUSDT"]
+
+
+def test_hold_async_waits_for_thread_holder():
+    locks = SymbolLocks()
+    order = []
+    locks["BTCUSDT"].acquire()
+
+    def release():
+        order.append("thread")
+        locks["BTCUSDT"].release()
+
+    async def main():
+        threading.Timer(0.05, release).start()
+        async with locks.hold_async("BTCUSDT", poll_interval=0.005):
+            order.append("bot")
+            assert locks.busy() == ["BTCUSDT"]
+        assert locks.busy() == []
+
+    asyncio.run(main())
+    assert order == ["thread", "bot"]
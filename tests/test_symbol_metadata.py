@@ -0,0 +1,59 @@
+import pytest
+
+from app.symbol_metadata import SymbolMetadataCache, parse_symbol
+
+
+EXCHANGE_INFO = {
+    "symbols": [
+        {
+            "symbol": "ETHUSDT",
+            "status": "TRADING",
+            "filters": [
+                {"filterType": "PRICE_FILTER", "tickSize": "0.01"},
+                {"filterType": "LOT_SIZE", "stepSize": "0.001", "minQty": "0.001"},
+                {"filterType": "MIN_NOTIONAL", "notional": "20"},
+            ],
+        },
+        {
+            "symbol": "DOGEUSDT",
+            "status": "TRADING",
+            "filters": [
+                {"filterType": "PRICE_FILTER", "tickSize": "0.000010"},
+                {"filterType": "LOT_SIZE", "stepSize": "1", "minQty": "1"},
+            ],
+        },
+    ]
+}
+
+
+def test_parse_symbol_precision():
+    info = parse_symbol(EXCHANGE_INFO["symbols"][0])
+    assert info.tick_size == 0.01
+    assert info.price_precision == 2
+    assert info.qty_precision == 3
+    assert info.min_notional == 20.0
+
+
+def test_rounding():
+    info = parse_symbol(EXCHANGE_INFO["symbols"][1])
+    assert info.price_precision == 5
+    assert info.format_price(0.123456) == "0.12346"
+    assert info.format_qty(10.9) == "10"
+    eth = parse_symbol(EXCHANGE_INFO["symbols"][0])
+    assert eth.format_qty(0.0129) == "0.012"
+    assert eth.format_qty(0.3) == "0.300"
+
+
+def test_cache_loads_once():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return EXCHANGE_INFO
+
+    cache = SymbolMetadataCache(fetch, ttl=60)
+    assert cache.get("ETHUSDT").tick_size == 0.01
+    assert cache.get("DOGEUSDT").step_size == 1.0
+    assert len(calls) == 1
+    with pytest.raises(ValueError):
+        cache.get("XXXUSDT")
@@ -0,0 +1,147 @@
+import time
+
+import pytest
+
+from app.trade_journal import Fill, TradeJournal
+
+
+def _fill(trade_id, side, qty, price, order_id=1, commission=0.01, rp=0.0):
+    return Fill("ETHUSDT", trade_id, order_id, side, price, qty, commission, rp, True, trade_id)
+
+
+def test_ledger_tracks_vwap_and_realized_pnl(tmp_path):
+    journal = TradeJournal(str(tmp_path / "journal.db"))
+    journal.record(_fill(1, "BUY", 1.0, 100.0))
+    journal.record(_fill(2, "BUY", 1.0, 110.0))
+    ledger = journal.ledger("ETHUSDT")
+    assert ledger.qty == pytest.approx(2.0)
+    assert ledger.entry_price == pytest.approx(105.0)
+    assert ledger.entry_commission == pytest.approx(0.02)
+
+    journal.record(_fill(3, "SELL", 1.0, 120.0, order_id=2, rp=15.0))
+    ledger = journal.ledger("ETHUSDT")
+    assert ledger.qty == pytest.approx(1.0)
+    assert ledger.entry_price == pytest.approx(105.0)
+    assert ledger.entry_commission == pytest.approx(0.01)
+    assert ledger.realized_pnl == pytest.approx(15.0)
+    assert ledger.last_trade_id == 3
+
+    order = journal.order(1)
+    assert order.qty == pytest.approx(2.0)
+    assert order.avg_price == pytest.approx(105.0)
+
+
+def test_duplicates_are_ignored_and_state_survives_restart(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = TradeJournal(path)
+    assert journal.record(_fill(1, "BUY", 1.0, 100.0))
+    assert not journal.record(_fill(1, "BUY", 1.0, 100.0))
+    journal.close()
+
+    journal = TradeJournal(path)
+    assert journal.ledger("ETHUSDT").qty == pytest.approx(1.0)
+    assert journal.order(1).qty == pytest.approx(1.0)
+
+
+def test_catch_up_uses_from_id_cursor(tmp_path):
+    calls = []
+    trades = [
+        {"symbol": "ETHUSDT", "id": i, "orderId": 7, "side": "BUY", "price": "100", "qty": "0.5",
+         "commission": "0.01", "commissionAsset": "USDT", "realizedPnl": "0", "time": i}
+        for i in range(1, 6)
+    ]
+
+    def fetch(symbol, limit, fromId=None, startTime=None):
+        calls.append(fromId)
+        if fromId is None:
+            return trades[2:3]
+        return [t for t in trades if t["id"] >= fromId][:limit]
+
+    journal = TradeJournal(str(tmp_path / "journal.db"), fetch)
+    assert journal.catch_up("ETHUSDT") == 0  # первый запуск только ставит курсор
+    assert journal.catch_up("ETHUSDT") == 2
+    assert calls == [None, 4]
+    assert journal.ledger("ETHUSDT").qty == pytest.approx(1.0)
+
+
+def test_stream_event_is_journaled(tmp_path):
+    journal = TradeJournal(str(tmp_path / "journal.db"))
+    journal.on_order_update({"e": "ORDER_TRADE_UPDATE", "o": {
+        "s": "ETHUSDT", "S": "SELL", "x": "TRADE", "X": "FILLED", "i": 9, "t": 42,
+        "l": "0.3", "L": "2000", "n": "0.12", "N": "USDT", "rp": "0", "m": True, "T": 1}})
+    journal.on_order_update({"e": "ORDER_TRADE_UPDATE", "o": {"s": "ETHUSDT", "x": "NEW", "l": "0"}})
+    assert journal.wait_for_order(9, 0.3, timeout=0.1).avg_price == pytest.approx(2000.0)
+    assert journal.ledger("ETHUSDT").qty == pytest.approx(-0.3)
+
+
+def test_stream_fills_do_not_move_the_rest_cursor(tmp_path):
+    trades = [
+        {"symbol": "ETHUSDT", "id": i, "orderId": 7, "side": "BUY", "price": "100", "qty": "0.5",
+         "commission": "0.01", "commissionAsset": "USDT", "realizedPnl": "0", "time": i}
+        for i in range(1, 6)
+    ]
+
+    def fetch(symbol, limit, fromId=None, startTime=None):
+        if fromId is None:
+            return trades[:1]
+        return [t for t in trades if t["id"] >= fromId][:limit]
+
+    journal = TradeJournal(str(tmp_path / "journal.db"), fetch)
+    journal.catch_up("ETHUSDT")
+    # Поток оборвался на сделках 2–4 и ожил на сделке 5
+    journal.record(_fill(5, "BUY", 0.5, 100.0, order_id=7))
+    assert journal.catch_up("ETHUSDT") == 3
+    assert journal.ledger("ETHUSDT").qty == pytest.approx(2.0)
+
+
+def test_empty_first_catch_up_keeps_a_cursor_by_time(tmp_path):
+    now_ms = int(time.time() * 1000)
+    trades = []
+
+    def fetch(symbol, limit, fromId=None, startTime=None):
+        if fromId is not None:
+            return [t for t in trades if t["id"] >= fromId][:limit]
+        if startTime is not None:
+            return [t for t in trades if t["time"] >= startTime][:limit]
+        return trades[-limit:]
+
+    journal = TradeJournal(str(tmp_path / "journal.db"), fetch)
+    assert journal.catch_up("ETHUSDT") == 0  # сделок ещё нет, курсор — по времени
+    assert journal.catch_up("ETHUSDT") == 0
+    trades.extend(
+        {"symbol": "ETHUSDT", "id": i, "orderId": 7, "side": "BUY", "price": "100", "qty": "0.5",
+         "commission": "0.01", "commissionAsset": "USDT", "realizedPnl": "0", "time": now_ms + i}
+        for i in range(3, 6)
+    )
+    # Поток пропустил сделки 3–4 и записал 5: курсор от него не зависит
+    journal.record(_fill(5, "BUY", 0.5, 100.0, order_id=7))
+    assert journal.catch_up("ETHUSDT") == 2
+    assert journal.ledger("ETHUSDT").qty == pytest.approx(1.5)
+    trades.append({**trades[-1], "id": 6, "time": now_ms + 6})
+    assert journal.catch_up("ETHUSDT") == 1
+
+
+def test_background_catch_up_runs_on_request(tmp_path):
+    calls = []
+
+    def fetch(symbol, limit, fromId=None, startTime=None):
+        calls.append(symbol)
+        return []
+
+    journal = TradeJournal(str(tmp_path / "journal.db"), fetch)
+    journal.start(lambda: ["ETHUSDT"], interval=60)
+    deadline = time.monotonic() + 2
+    while len(calls) < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    journal.request_catch_up()
+    while len(calls) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert calls == ["ETHUSDT", "ETHUSDT"]
+
+
+def test_journal_file_is_created_on_start_not_on_construction(tmp_path):
+    path = tmp_path / "journal.db"
+    journal = TradeJournal(str(path), lambda **params: [])
+    assert not path.exists()
+    journal.start(lambda: [], interval=60)
+    assert path.exists()
@@ -0,0 +1,67 @@
+import pytest
+
+from app.warmup import Stage, WarmUp
+
+
+def test_stages_run_in_order_and_set_ready():
+    calls = []
+    warmup = WarmUp([
+        Stage("a", lambda: calls.append("a") or "1 thing"),
+        Stage("b", lambda: calls.append("b")),
+    ])
+    assert warmup.status()["ready"] is False
+    warmup.run()
+    assert calls == ["a", "b"]
+    status = warmup.status()
+    assert status["ready"] is True
+    assert status["stages"]["a"] == {
+        "status": "ok", "required": True, "detail": "1 thing", "attempts": 1,
+        "seconds": status["stages"]["a"]["seconds"],
+    }
+
+
+def test_required_stage_is_retried_until_it_passes():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("exchange unreachable")
+
+    warmup = WarmUp([Stage("metadata", flaky)], retry_interval=0.01)
+    warmup.run()
+    assert warmup.ready.is_set()
+    assert warmup.status()["stages"]["metadata"]["attempts"] == 3
+
+
+def test_optional_stage_failure_does_not_block_readiness():
+    def books():
+        raise RuntimeError("Order books not synced")
+
+    warmup = WarmUp([Stage("books", books, required=False), Stage("after", lambda: None)])
+    warmup.start()
+    assert warmup.ready.wait(2)
+    stages = warmup.status()["stages"]
+    assert stages["books"]["status"] == "failed" and "not synced" in stages["books"]["detail"]
+    assert stages["after"]["status"] == "ok"
+
+
+def test_services_start_after_a_failed_validation(monkeypatch):
+    from app import runtime
+
+    started = []
+    errors = iter([RuntimeError("Missing required environment variables: WEBHOOK_SECRET")])
+
+    def validate():
+        for e in errors:
+            raise e
+
+    monkeypatch.setattr(runtime, "_services_started", False)
+    monkeypatch.setattr(runtime.settings, "validate", validate)
+    monkeypatch.setattr(runtime.settings, "record_dir", "")
+    monkeypatch.setattr(runtime.warmup, "start", lambda: started.append(True))
+    with pytest.raises(RuntimeError, match="WEBHOOK_SECRET"):
+        runtime.start_services()
+    runtime.start_services()
+    runtime.start_services()
+    assert started == [True]
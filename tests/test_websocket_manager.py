@@ -0,0 +1,45 @@
+import binance
+import pytest
+
+from app import websocket_manager
+
+
+class DeadManager:
+    """Поток менеджера, у которого AsyncClient.create упал: клиента нет, поток уже завершился."""
+    created = 0
+
+    def __init__(self, api_key=None, api_secret=None):
+        DeadManager.created += 1
+        self._bsm = None
+        self.stopped = False
+
+    def start(self):
+        pass
+
+    def is_alive(self):
+        return False
+
+    def stop(self):
+        self.stopped = True
+
+
+class LiveManager(DeadManager):
+    def start(self):
+        self._bsm = object()
+
+    def is_alive(self):
+        return True
+
+
+def test_manager_that_fails_to_start_raises_and_is_rebuilt(monkeypatch):
+    monkeypatch.setattr(websocket_manager, "_twm", None)
+    monkeypatch.setattr(binance, "ThreadedWebsocketManager", DeadManager)
+    with pytest.raises(RuntimeError, match="did not start"):
+        websocket_manager._manager()
+    assert websocket_manager._twm is None
+    monkeypatch.setattr(binance, "ThreadedWebsocketManager", LiveManager)
+    twm = websocket_manager._manager()
+    assert websocket_manager._manager() is twm
+    # Умерший поток менеджера — новый менеджер при следующем обращении
+    monkeypatch.setattr(twm, "is_alive", lambda: False)
+    assert websocket_manager._manager() is not twm